@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,6 +49,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'skaps.middleware.QueryMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'simplecode.urls'
@@ -82,6 +84,32 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Sąskaitų įvesčių talpykla: locmem pagal nutylėjimą. Raktai turi DB saugomas įvesčių
+# versijas, todėl run_invoice_worker procesas pakeitimus mato iškart; SKAPS_CACHE_DIR
+# (bendra failų talpykla) leidžia procesams dalytis įrašais.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'billing': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ['SKAPS_CACHE_DIR'],
+    } if os.environ.get('SKAPS_CACHE_DIR') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'skaps-billing',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+SKAPS_BILLING_CACHE_TIMEOUT = int(os.environ.get('SKAPS_BILLING_CACHE_TIMEOUT', 3600))
+
+# skaitymo rodiniai iš skaps.async_views (ASGI serveryje, žr. simplecode/asgi.py)
+SKAPS_ASYNC_VIEWS = os.environ.get('SKAPS_ASYNC_VIEWS') == '1'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -118,6 +146,39 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Įkelti ir sugeneruoti failai (sąskaitų PDF)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = os.environ.get('SKAPS_MEDIA_ROOT', BASE_DIR / 'media')
+
+# Logging
+# https://docs.djangoproject.com/en/5.2/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': '{asctime} {levelname} {name}: {message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+        },
+    },
+    'loggers': {
+        'skaps': {
+            'handlers': ['console'],
+            # DEBUG rodo ir laiko intervalus (timed_span) kiekvienam paskirstymui
+            'level': os.environ.get('SKAPS_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -1,7 +1,9 @@
 from django.contrib import admin
+
+from .ledger import post_entry, with_balances
 from .models import (
     Association, Customer, Meter, TaxType, Period, PeriodTax,
-    MeterReading, Invoice, InvoiceItem
+    MeterReading, Invoice, InvoiceItem, InvoiceJob, LedgerEntry, ReadingAnomaly
 )
 
 @admin.register(Association)
@@ -16,6 +18,13 @@ class CustomerAdmin(admin.ModelAdmin):
     search_fields = ("full_name", "email")
     list_filter = ("association",)
 
+    def get_queryset(self, request):
+        return with_balances(super().get_queryset(request).select_related("association"))
+
+    @admin.display(description="Balance", ordering="ledger_balance")
+    def balance(self, obj):
+        return obj.ledger_balance
+
 @admin.register(Meter)
 class MeterAdmin(admin.ModelAdmin):
     list_display = ("customer", "meter_type", "unit", "description", "ser_num")
@@ -41,14 +50,21 @@ class PeriodTaxAdmin(admin.ModelAdmin):
 
 @admin.register(MeterReading)
 class MeterReadingAdmin(admin.ModelAdmin):
-    list_display = ("meter", "period", "value")
-    list_filter = ("meter__meter_type", "period")
+    list_display = ("meter", "period", "value", "is_estimated", "estimated_value")
+    list_filter = ("meter_type", "period", "is_estimated")
     search_fields = ("meter__customer__full_name",)
 
+@admin.register(ReadingAnomaly)
+class ReadingAnomalyAdmin(admin.ModelAdmin):
+    list_display = ("meter", "period", "kind", "consumed", "expected", "score", "message")
+    list_filter = ("kind", "association", "period")
+    search_fields = ("meter__ser_num", "meter__customer__full_name")
+    list_select_related = ("meter__customer", "period")
+
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
-    list_display = ("number", "customer", "period", "total_amount", "payable_amount", "balance")
-    list_filter = ("period",)
+    list_display = ("number", "customer", "period", "total_amount", "payable_amount", "balance", "is_stale")
+    list_filter = ("period", "is_stale")
     search_fields = ("number", "customer__full_name")
 
 @admin.register(InvoiceItem)
@@ -56,3 +72,30 @@ class InvoiceItemAdmin(admin.ModelAdmin):
     list_display = ("description", "invoice", "quantity", "unit_price", "total", "unit", "currency")
     list_filter = ("invoice__period",)
     search_fields = ("description", "invoice__number")
+
+@admin.register(InvoiceJob)
+class InvoiceJobAdmin(admin.ModelAdmin):
+    list_display = ("association", "customer", "period", "status", "progress_done", "progress_total",
+                    "anomalies", "wall_time", "queries", "created_at")
+    list_filter = ("status", "period")
+    readonly_fields = ("worker", "attempts", "started_at", "heartbeat_at", "finished_at", "error")
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ("customer", "sequence", "kind", "amount", "invoice", "note", "created_at")
+    list_filter = ("kind",)
+    search_fields = ("customer__full_name", "invoice__number", "note")
+    list_select_related = ("customer", "invoice")
+    fields = ("customer", "kind", "amount", "note")
+
+    def get_readonly_fields(self, request, obj=None):
+        # žurnalas tik papildomas: įrašytas įrašas nebekeičiamas
+        return self.fields if obj else ()
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            entry = post_entry(obj.customer, obj.kind, obj.amount, note=obj.note)
+            obj.pk, obj.sequence = entry.pk, entry.sequence
@@ -0,0 +1,214 @@
+"""
+Meter reading anomaly detection.
+
+Readings are cumulative counters, so each meter's history is checked in
+period order against its previous reading:
+
+    decrease  the counter went down;
+    rollover  it went down, but wrapping past the next power of ten explains
+              the drop better (99 950 -> 20);
+    gap       periods between two readings are missing, so the ledger has
+              no start value and the customer is billed nothing (or the
+              periods were billed on estimates);
+    spike     monthly consumption far above what the meter usually uses in
+              that calendar month (or overall, until a month has history).
+
+MeterStats keeps the running mean and variance (Welford) of a meter's
+monthly consumption, overall and per calendar month, so a new reading is
+checked and folded in without reading the history again. detect_anomalies()
+finds the readings changed since each meter was last scanned: meters that
+only got newer readings are extended from their stats, meters with an older
+or edited reading are rescanned; both come from one ordered query per
+association. Flags are stored as ReadingAnomaly rows.
+
+Estimated readings are neither checked nor folded into the statistics;
+the stats describe the meter's real readings only.
+"""
+import logging
+import math
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Min, Q
+from django.utils import timezone
+
+from .models import MeterReading, MeterStats, ReadingAnomaly
+
+logger = logging.getLogger("skaps.anomalies")
+
+# tiek mėnesių istorijos reikia, kad šuolis būtų vertinamas
+MIN_SAMPLES = 6
+# kalendorinio mėnesio vidurkis naudojamas, kai to mėnesio yra bent tiek stebėjimų
+MIN_MONTH_SAMPLES = 2
+SPIKE_SIGMAS = 4
+# ir bent tiek kartų daugiau už tikėtiną – kad maža sklaida nekeltų triukšmo
+SPIKE_RATIO = 2
+
+
+@dataclass
+class DetectionRun:
+    association_id: object
+    meters_extended: int = 0
+    meters_rescanned: int = 0
+    readings_scanned: int = 0
+    anomalies: list = field(default_factory=list)
+
+
+def calendar_month(ordinal):
+    # period_ordinal = year * 12 + month
+    return str((ordinal - 1) % 12 + 1)
+
+
+def _welford(count, mean, m2, value):
+    count += 1
+    delta = value - mean
+    mean += delta / count
+    return count, mean, m2 + delta * (value - mean)
+
+
+def _fold(stats, consumed, ordinal):
+    stats.samples, stats.mean, stats.m2 = _welford(stats.samples, stats.mean, stats.m2, consumed)
+    month = calendar_month(ordinal)
+    stats.monthly[month] = list(_welford(*stats.monthly.get(month, (0, 0.0, 0.0)), consumed))
+
+
+def expected_consumption(stats, ordinal):
+    """
+    (expected monthly consumption, standard deviation) for the reading's
+    calendar month, or overall until that month has history; None while the
+    meter's history is too short.
+    """
+    if stats.samples < MIN_SAMPLES:
+        return None
+    count, mean, m2 = stats.monthly.get(calendar_month(ordinal), (0, 0.0, 0.0))
+    if count < MIN_MONTH_SAMPLES:
+        count, mean, m2 = stats.samples, stats.mean, stats.m2
+    return mean, math.sqrt(m2 / (count - 1))
+
+
+def _rollover(previous, value):
+    """Consumption if the counter wrapped past the next power of ten, or None if a plain decrease fits better."""
+    capacity = Decimal(10) ** len(str(int(previous)))
+    wrapped = capacity - previous + value
+    return wrapped if wrapped < previous - value else None
+
+
+def _flag(reading, kind, message, consumed=None, expected=None, score=None):
+    reading_id, association_id, meter_id, period_id, ordinal, _ = reading
+    return ReadingAnomaly(
+        reading_id=reading_id, association_id=association_id, meter_id=meter_id, period_id=period_id,
+        period_ordinal=ordinal, kind=kind, message=message, consumed=consumed,
+        expected=None if expected is None else Decimal(expected).quantize(Decimal("0.01")),
+        score=score,
+    )
+
+
+def check_reading(stats, reading):
+    """
+    Checks one reading against the meter's state, folds it in and returns
+    its anomalies. Readings must come in period order.
+    """
+    ordinal, value = reading[4], reading[5]
+    previous, last_ordinal = stats.last_value, stats.last_ordinal
+    stats.last_value, stats.last_ordinal = value, ordinal
+    if previous is None:
+        return []
+
+    flags = []
+    months = ordinal - last_ordinal
+    if months > 1:
+        flags.append(_flag(reading, "gap", f"Trūksta {months - 1} mėn. rodmenų"))
+
+    consumed = value - previous
+    if consumed < 0:
+        wrapped = _rollover(previous, value)
+        if wrapped is None:
+            flags.append(_flag(reading, "decrease", f"Rodmuo sumažėjo nuo {previous} iki {value}", consumed))
+            return flags
+        flags.append(_flag(reading, "rollover", f"Skaitiklis persivertė: {previous} -> {value}", wrapped))
+        consumed = wrapped
+
+    # per tarpą suvartota išdalijama po lygiai kiekvienam mėnesiui
+    monthly = float(consumed) / months
+    expected = expected_consumption(stats, ordinal)
+    if expected is not None:
+        mean, std = expected
+        if monthly > mean + SPIKE_SIGMAS * std and monthly > SPIKE_RATIO * mean:
+            flags.append(_flag(
+                reading, "spike", f"Suvartota {monthly:.2f}, įprastai apie {mean:.2f}", consumed, mean,
+                (monthly - mean) / std if std else None,
+            ))
+            return flags  # šuolis į statistiką neįtraukiamas
+    _fold(stats, monthly, ordinal)
+    return flags
+
+
+def _new_stats(association_id, meter_id, scanned_at):
+    return MeterStats(association_id=association_id, meter_id=meter_id, monthly={}, scanned_at=scanned_at)
+
+
+def detect_anomalies(association_id, meter_ids=None, rescan=False):
+    """
+    Brings the anomaly flags of an association (or just `meter_ids`) up to
+    date with its readings. rescan=True rebuilds the selected meters from
+    their whole history, e.g. after a reading was deleted.
+    """
+    scanned_at = timezone.now()
+    run = DetectionRun(association_id=association_id)
+    readings = MeterReading.objects.filter(association_id=association_id, is_estimated=False)
+    if meter_ids is not None:
+        readings = readings.filter(meter_id__in=meter_ids)
+
+    if rescan:
+        changed = dict.fromkeys(readings.values_list("meter_id", flat=True).distinct(), 0)
+    else:
+        changed = dict(
+            readings.filter(Q(meter__stats__isnull=True) | Q(updated_at__gte=F("meter__stats__scanned_at")))
+            .values("meter_id").annotate(first=Min("period_ordinal")).values_list("meter_id", "first").order_by()
+        )
+    stale = MeterStats.objects.filter(association_id=association_id)
+    if meter_ids is not None:
+        stale = stale.filter(meter_id__in=meter_ids)
+    if rescan:
+        # skaitikliai be rodmenų – nebeturi ir statistikos
+        stale.exclude(meter_id__in=changed).delete()
+    if not changed:
+        return run
+
+    stats = {s.meter_id: s for s in stale.filter(meter_id__in=changed)}
+    rescanned, extended = [], []
+    for meter_id, first in changed.items():
+        current = stats.get(meter_id)
+        if rescan or current is None or current.last_ordinal is None or first <= current.last_ordinal:
+            stats[meter_id] = _new_stats(association_id, meter_id, scanned_at)
+            rescanned.append(meter_id)
+        else:
+            current.scanned_at = scanned_at
+            extended.append(meter_id)
+    run.meters_rescanned, run.meters_extended = len(rescanned), len(extended)
+
+    history = readings.filter(
+        Q(meter_id__in=rescanned)
+        | Q(meter_id__in=extended, period_ordinal__gt=F("meter__stats__last_ordinal"))
+    ).order_by("meter_id", "period_ordinal").values_list(
+        "id", "association_id", "meter_id", "period_id", "period_ordinal", "value"
+    )
+    for reading in history.iterator(chunk_size=2000):
+        run.readings_scanned += 1
+        run.anomalies += check_reading(stats[reading[2]], reading)
+
+    with transaction.atomic():
+        ReadingAnomaly.objects.filter(meter_id__in=rescanned).delete()
+        ReadingAnomaly.objects.bulk_create(run.anomalies, batch_size=500)
+        MeterStats.objects.bulk_create(
+            stats.values(), batch_size=500, update_conflicts=True, unique_fields=["meter"],
+            update_fields=["last_ordinal", "last_value", "samples", "mean", "m2", "monthly", "scanned_at",
+                           "updated_at"],
+        )
+    if run.anomalies:
+        logger.info(
+            "%d reading anomalies in %d readings of association %s", len(run.anomalies), run.readings_scanned,
+            association_id, extra={"association": str(association_id), "anomalies": len(run.anomalies)},
+        )
+    return run
@@ -0,0 +1,298 @@
+"""
+JSON API, version 1.
+
+Each Resource maps its public field names to ORM lookups and serializes
+straight from queryset.values() rows, so list and detail responses never
+build model instances. Clients choose fields with ?fields=a,b (sparse
+fieldsets), page with the keyset cursors of pagination.py (?after=,
+?before=, ?page_size=) and revalidate with If-None-Match. The ETag is a
+hash of the ids and updated_at of the rows read for the response (and of
+the joined rows they print, such as the tax type of a period tax), so a
+page or object is read with one query and a 304 skips serialization.
+
+Readings are written in bulk through ReadingImporter, with the same
+validation, upsert, ledger rebuild and stale marking as a file import.
+"""
+import hashlib
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+
+from .forms import ListFilterForm
+from .importers import ReadingImporter, iter_json_rows
+from .models import Association, Customer, Invoice, InvoiceItem, Meter, MeterReading, PeriodTax
+from .pagination import InvalidCursor, paginate
+
+# vienoje užklausoje priimamų rodmenų riba
+MAX_BULK_READINGS = 5000
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@dataclass(frozen=True)
+class Computed:
+    """A field built by func from several lookups."""
+    func: object
+    lookups: tuple
+
+
+def period_label(year, month):
+    return f"{year}-{month:02d}"
+
+
+def ordinal_label(ordinal):
+    # period_ordinal = year * 12 + month
+    return period_label((ordinal - 1) // 12, (ordinal - 1) % 12 + 1)
+
+
+PERIOD = Computed(period_label, ("period__year", "period__month"))
+
+
+def _etag(*parts):
+    return hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()
+
+
+@dataclass(frozen=True)
+class Resource:
+    name: str
+    model: type
+    # viešas lauko vardas -> ORM kelias arba Computed
+    fields: dict
+    ordering: tuple = ("id",)
+    # kelias iki bendrijos id; None – pačios bendrijos
+    scope: str = None
+    # ?raktas=reikšmė -> tikslus filtras
+    lookups: dict = field(default_factory=dict)
+    # ListFilterForm parametrai (q, meter_type, period_from / period_to)
+    filters: dict = field(default_factory=dict)
+    # prijungtų eilučių updated_at, kurių laukai rodomi atsakyme – įeina į ETag
+    versions: tuple = ()
+
+    @property
+    def version_lookups(self):
+        """Lookups the ETag is built from: the row's id and updated_at and the joined rows' updated_at."""
+        return ["id", "updated_at", *self.versions]
+
+    def queryset(self, association_id=None):
+        queryset = self.model.objects.all()
+        if self.scope:
+            queryset = queryset.filter(**{self.scope: association_id})
+        return queryset
+
+    def filter(self, queryset, params):
+        try:
+            for key, lookup in self.lookups.items():
+                if params.get(key):
+                    queryset = queryset.filter(**{lookup: params[key]})
+        except ValidationError:
+            raise ApiError("Netinkama filtro reikšmė")
+        if self.filters:
+            queryset = ListFilterForm(params, **self.filters).filter(queryset)
+        return queryset
+
+    def select(self, params):
+        """Requested field names (?fields=a,b), all fields by default."""
+        if not params.get("fields"):
+            return list(self.fields)
+        names = list(dict.fromkeys(name.strip() for name in params["fields"].split(",") if name.strip()))
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError(f"Nežinomi laukai: {', '.join(unknown)}")
+        return names
+
+    def values(self, queryset, names, extra=()):
+        lookups = []
+        for name in names:
+            spec = self.fields[name]
+            if isinstance(spec, Computed):
+                lookups += spec.lookups
+            elif spec is not None:
+                lookups.append(spec)
+        return queryset.values(*dict.fromkeys([*lookups, *extra]))
+
+    def serialize(self, rows, names):
+        specs = [(name, self.fields[name]) for name in names if self.fields[name] is not None]
+        data = []
+        for row in rows:
+            item = {}
+            for name, spec in specs:
+                if isinstance(spec, Computed):
+                    item[name] = spec.func(*(row[lookup] for lookup in spec.lookups))
+                else:
+                    item[name] = row[spec]
+            data.append(item)
+        self.attach(data, rows, names)
+        return data
+
+    def attach(self, data, rows, names):
+        """Adds nested fields (declared with a None lookup) to serialized rows."""
+
+    def page(self, association_id, params, page_size):
+        """(KeysetPage of .values() rows, field names); the page is the only query."""
+        names = self.select(params)
+        queryset = self.filter(self.queryset(association_id), params)
+        rows = self.values(queryset, names, extra=[*self.version_lookups, *(f.lstrip("-") for f in self.ordering)])
+        try:
+            page = paginate(rows, self.ordering, after=params.get("after"), before=params.get("before"),
+                            page_size=page_size)
+        except (InvalidCursor, ValidationError):
+            raise ApiError("Netinkamas puslapio žymeklis")
+        return page, names
+
+    def page_data(self, page, names):
+        return {
+            "data": self.serialize(page.object_list, names),
+            "next": page.next_cursor,
+            "previous": page.previous_cursor,
+            "page_size": page.page_size,
+        }
+
+    def get(self, association_id, pk, params):
+        """(.values() row, field names) of one object."""
+        names = self.select(params)
+        try:
+            row = self.values(self.queryset(association_id).filter(id=pk), names, extra=self.version_lookups).first()
+        except ValidationError:
+            row = None
+        if row is None:
+            raise ApiError("Nerasta", status=404)
+        return row, names
+
+    def etag(self, rows, params, *extra):
+        # kiekviena eilutės versija + parametrai (laukai, filtrai, žymekliai)
+        return _etag(self.name, params.urlencode(), *extra, *(
+            "@".join(str(row[key]) for key in self.version_lookups) for row in rows
+        ))
+
+
+class InvoiceResource(Resource):
+    ITEM_FIELDS = {
+        "description": "description",
+        "meter": "meter_id",
+        "period_tax": "period_tax_id",
+        "quantity": "quantity",
+        "unit_price": "unit_price",
+        "total": "total",
+        "start_value": "start_value",
+        "end_value": "end_value",
+        "consumed": "consumed",
+        "is_estimated": "is_estimated",
+    }
+
+    def attach(self, data, rows, names):
+        # visų puslapio sąskaitų eilutės – viena užklausa
+        if "items" not in names or not data:
+            return
+        items = {row["id"]: item for row, item in zip(rows, data)}
+        for item in items.values():
+            item["items"] = []
+        lines = InvoiceItem.objects.filter(invoice_id__in=items).order_by("consumed", "description").values_list(
+            "invoice_id", *self.ITEM_FIELDS.values()
+        )
+        for invoice_id, *values in lines:
+            items[invoice_id]["items"].append(dict(zip(self.ITEM_FIELDS, values)))
+
+
+API_RESOURCES = {
+    resource.name: resource for resource in [
+        Resource(
+            name="associations",
+            model=Association,
+            fields={
+                "id": "id", "name": "name", "description": "description",
+                "created_at": "created_at", "updated_at": "updated_at",
+            },
+            ordering=("name", "id"),
+        ),
+        Resource(
+            name="customers",
+            model=Customer,
+            fields={
+                "id": "id", "full_name": "full_name", "email": "email", "phone": "phone", "address": "address",
+                "floor_area": "floor_area", "updated_at": "updated_at",
+            },
+            ordering=("full_name", "id"),
+            scope="association_id",
+            filters={"search": ["full_name", "address", "email"]},
+        ),
+        Resource(
+            name="meters",
+            model=Meter,
+            fields={
+                "id": "id", "customer": "customer_id", "meter_type": "meter_type", "unit": "unit",
+                "ser_num": "ser_num", "description": "description", "updated_at": "updated_at",
+            },
+            ordering=("ser_num", "id"),
+            scope="customer__association_id",
+            lookups={"customer": "customer_id"},
+            filters={"search": ["ser_num", "description"], "meter_type": "meter_type"},
+        ),
+        Resource(
+            name="readings",
+            model=MeterReading,
+            fields={
+                "id": "id", "meter": "meter_id", "meter_type": "meter_type",
+                # periodas iš eilės numerio – be JOIN
+                "period": Computed(ordinal_label, ("period_ordinal",)),
+                "value": "value", "is_estimated": "is_estimated", "updated_at": "updated_at",
+            },
+            ordering=("-period_ordinal", "id"),
+            scope="association_id",
+            lookups={"meter": "meter_id"},
+            filters={"period_ordinal": "period_ordinal", "meter_type": "meter_type"},
+        ),
+        Resource(
+            name="period_taxes",
+            model=PeriodTax,
+            fields={
+                "id": "id", "period": PERIOD, "tax_type": "tax_type_id", "name": "tax_type__name",
+                "distribution_type": "tax_type__distribution_type", "meter_type": "tax_type__meter_type",
+                "amount": "amount", "currency": "tax_type__currency", "updated_at": "updated_at",
+            },
+            ordering=("-period__year", "-period__month", "id"),
+            scope="association_id",
+            lookups={"tax_type": "tax_type_id"},
+            filters={"period": "period"},
+            versions=("tax_type__updated_at", "period__updated_at"),
+        ),
+        InvoiceResource(
+            name="invoices",
+            model=Invoice,
+            fields={
+                "id": "id", "number": "number", "customer": "customer_id", "period": PERIOD, "date": "date",
+                "total_amount": "total_amount", "balance": "balance", "payable_amount": "payable_amount",
+                "is_stale": "is_stale", "updated_at": "updated_at", "items": None,
+            },
+            ordering=("-created_at", "id"),
+            scope="customer__association_id",
+            lookups={"customer": "customer_id"},
+            filters={"period": "period"},
+            versions=("period__updated_at",),
+        ),
+    ]
+}
+
+
+def upsert_readings(association, payload):
+    """
+    Upserts a JSON array of readings ({"ser_num" or "meter", "period" or
+    "year"/"month", "value"}) or {"readings": [...]}; errors carry the
+    array index of the rejected reading.
+    """
+    items = payload.get("readings") if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        raise ApiError("Laukiama rodmenų masyvo")
+    if len(items) > MAX_BULK_READINGS:
+        raise ApiError(f"Per daug rodmenų: {len(items)} (daugiausia {MAX_BULK_READINGS})", status=413)
+    result = ReadingImporter(association=association).run(iter_json_rows(items), first_line=0)
+    return {
+        "received": result.rows,
+        "upserted": result.upserted,
+        "error_count": result.error_count,
+        "errors": [{"index": index, "message": message} for index, message in result.errors],
+    }
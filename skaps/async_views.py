@@ -0,0 +1,123 @@
+"""
+Async read views for dashboards.
+
+When the app is served over ASGI (settings.SKAPS_ASYNC_VIEWS, switched on
+by simplecode/asgi.py) these views take the URLs of their skaps.views
+counterparts and read with the async ORM, awaiting independent queries
+together with asyncio.gather(). Django runs every async ORM call of a
+request in that request's thread-sensitive worker, so with SQLite one
+request's queries still reach the database one after another; the gain is
+that the event loop keeps accepting and serving other requests meanwhile
+instead of tying up a server thread each.
+
+Templates render through sync_to_async: context processors read the
+session and request.user, and invoice_detail.html loads its items lazily.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse
+from django.shortcuts import aget_object_or_404, render
+from django.utils.cache import get_conditional_response
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import http_date, quote_etag
+
+from .forms import LedgerEntryForm, ListFilterForm
+from .ledger import current_balance, latest_entries, running_balances
+from .models import Association, Customer, Period, PeriodRollup
+from .read_models import InvoiceDocument, aversioned_invoice, invoice_etag
+from .reporting import summary_querysets, summary_rows
+from .views import readings_page
+
+
+async def _list(queryset):
+    return [obj async for obj in queryset]
+
+
+async def _render(request, template_name, context):
+    return await sync_to_async(render)(request, template_name, context)
+
+
+async def customer_dashboard(request, association_id, customer_id):
+    customer = await aget_object_or_404(
+        Customer.objects.select_related("association"), id=customer_id, association_id=association_id
+    )
+    meters, periods, invoices, entries, balance = await asyncio.gather(
+        _list(customer.meters.all()),
+        _list(Period.objects.filter(taxes__association_id=association_id).distinct().order_by("-year", "-month")),
+        _list(customer.invoices.all()),
+        _list(latest_entries(customer)),
+        sync_to_async(current_balance)(customer),
+    )
+    return await _render(request, "skaps/customer_dashboard.html", {
+        "association": customer.association,
+        "customer": customer,
+        "meters": meters,
+        "periods": periods,
+        "invoices": invoices,
+        "balance": balance,
+        "history": running_balances(entries, balance),
+        "ledger_form": LedgerEntryForm(),
+    })
+
+
+async def invoice_detail(request, customer_id, invoice_id):
+    invoice = await aversioned_invoice(customer_id, invoice_id)
+    if invoice is None:
+        raise Http404("Sąskaita nerasta")
+    # kaip condition(): 304 / 412 pagal ETag ir Last-Modified
+    version = invoice_etag(invoice)
+    etag, last_modified = quote_etag(version), int(invoice.last_modified.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        # eilutės užkraunamos tik jei šablono fragmentas nerastas talpykloje
+        document = SimpleLazyObject(lambda: InvoiceDocument.for_invoice(invoice))
+        response = await _render(request, "skaps/invoice_detail.html", {
+            "customer": invoice.customer,
+            "invoice": invoice,
+            "document": document,
+            "version": version,
+        })
+    if request.method in ("GET", "HEAD"):
+        response.headers.setdefault("Last-Modified", http_date(last_modified))
+        response.headers.setdefault("ETag", etag)
+    return response
+
+
+async def meter_readings(request, customer_id):
+    customer, (readings, filter_form) = await asyncio.gather(
+        aget_object_or_404(Customer, id=customer_id),
+        sync_to_async(readings_page)(request, customer_id),
+    )
+    return await _render(request, "skaps/meter_readings.html", {
+        "customer": customer,
+        "readings": readings,
+        "page": readings,
+        "filter_form": filter_form,
+    })
+
+
+async def _summary(association_id, rollups):
+    association, rollups, taxes, totals = await asyncio.gather(
+        aget_object_or_404(Association, id=association_id),
+        *(_list(queryset) for queryset in summary_querysets(association_id, rollups)),
+    )
+    return association, summary_rows(rollups, taxes, totals)
+
+
+async def association_summary_api(request, association_id):
+    """Per-period rollups as JSON; ?period_from= and ?period_to= (YYYY-MM) limit the range."""
+    filter_form = ListFilterForm(request.GET, period_ordinal="period_ordinal")
+    association, rows = await _summary(
+        association_id, filter_form.filter(PeriodRollup.objects.filter(association_id=association_id))
+    )
+    return JsonResponse({"association": {"id": association.id, "name": association.name}, "periods": rows})
+
+
+async def association_period_summary_api(request, association_id, period_id):
+    association, rows = await _summary(
+        association_id, PeriodRollup.objects.filter(association_id=association_id, period_id=period_id)
+    )
+    if not rows:
+        raise Http404("Šiam periodui suvestinės nėra")
+    return JsonResponse({"association": {"id": association.id, "name": association.name}, **rows[0]})
@@ -0,0 +1,284 @@
+"""
+Synthetic data and benchmark scenarios.
+
+generate_dataset() builds associations × customers × meters with a reading
+history and period taxes using bulk inserts. run_benchmarks() measures SQL
+query count, wall time and peak Python memory of the hot paths and
+compare() checks the results against a stored JSON baseline.
+invoice_detail drops the page's cached fragments before every run, so it
+measures a full render; invoice_detail_cached measures the cache hit.
+profile_export() samples memory while a tabular export streams, to show
+it stays flat as the row count grows. api_comparison() sets the JSON API
+scenarios against the HTML views serving the same rows.
+"""
+import random
+import statistics
+import tracemalloc
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.test import RequestFactory
+
+from .billing import generate_invoice
+from .consumption import rebuild_consumption
+from .exports import EXPORT_CHUNK_SIZE
+from .instrumentation import QueryCounter
+from .models import (
+    METER_TYPES, METER_TYPE_UNITS, Association, Customer, Meter, MeterReading, Period, PeriodTax, TaxType
+)
+from .read_models import invoice_etag, versioned_invoice
+from .simulation import simulate
+from .streaming import STREAM_BATCH_SIZE
+
+# Metai, nuo kurių kuriami sintetiniai periodai
+DATASET_START_YEAR = 2000
+# invoice_detail.html {% cache %} fragmentai
+INVOICE_FRAGMENTS = ("invoice_content", "invoice_footer")
+
+
+@dataclass
+class Dataset:
+    associations: list
+    periods: list
+
+
+def dataset_periods(count):
+    periods = []
+    for i in range(count):
+        period, _ = Period.objects.get_or_create(year=DATASET_START_YEAR + i // 12, month=i % 12 + 1)
+        periods.append(period)
+    return periods
+
+
+def generate_dataset(associations=1, customers=100, meters=2, periods=12, seed=0):
+    """Creates a synthetic dataset; returns the created associations and the periods used."""
+    rng = random.Random(seed)
+    meter_types = [t for t, _ in METER_TYPES][:max(meters, 1)]
+    period_list = dataset_periods(periods)
+    created = []
+
+    for a in range(associations):
+        association = Association.objects.create(name=f"Sintetinė bendrija {a + 1}")
+        created.append(association)
+
+        customer_rows = Customer.objects.bulk_create(
+            Customer(
+                association=association,
+                full_name=f"Klientas {a + 1}-{c + 1:05d}",
+                address=f"Gatvė {c // 20 + 1}-{c % 20 + 1}",
+                floor_area=Decimal(rng.randint(25, 120)),
+            )
+            for c in range(customers)
+        )
+        meter_rows = Meter.objects.bulk_create(
+            Meter(
+                customer=customer,
+                meter_type=meter_types[m % len(meter_types)],
+                unit=METER_TYPE_UNITS[meter_types[m % len(meter_types)]],
+                ser_num=f"S{a:02d}{c:05d}{m:02d}",
+            )
+            for c, customer in enumerate(customer_rows)
+            for m in range(meters)
+        )
+
+        readings = []
+        for meter in meter_rows:
+            value = Decimal(rng.randint(0, 1000))
+            for period in period_list:
+                value += Decimal(rng.randint(1, 30))
+                readings.append(
+                    MeterReading(meter=meter, period=period, value=value)
+                    .denormalize(association.id, meter.meter_type, period)
+                )
+        MeterReading.objects.bulk_create(readings, batch_size=1000)
+
+        tax_types = [
+            TaxType(association=association, name=f"Skaitiklis {t}", distribution_type="proportional", meter_type=t)
+            for t in meter_types
+        ] + [
+            TaxType(association=association, name="Administravimas", distribution_type="fixed"),
+            TaxType(association=association, name="Šildymas", distribution_type="by_area"),
+            TaxType(association=association, name="Valymas", distribution_type="equal_split"),
+        ]
+        TaxType.objects.bulk_create(tax_types)
+        PeriodTax.objects.bulk_create(
+            PeriodTax(association=association, tax_type=tax_type, period=period,
+                      amount=Decimal(rng.randint(100, 5000)))
+            for period in period_list
+            for tax_type in tax_types
+        )
+
+        # bulk_create aplenkia signalus
+        rebuild_consumption(association)
+
+    return Dataset(associations=created, periods=period_list)
+
+
+def measure(func, repeat=3):
+    """Returns median wall time and max query count of repeat runs, plus peak memory of one extra run."""
+    timings, queries = [], []
+    for _ in range(repeat):
+        with QueryCounter() as counter:
+            func()
+        timings.append(counter.wall_time)
+        queries.append(counter.queries)
+
+    # tracemalloc lėtina vykdymą, todėl atmintis matuojama atskirai
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "wall_time": statistics.median(timings),
+        "queries": max(queries),
+        "peak_memory": peak,
+    }
+
+
+def _rolled_back(func):
+    def run():
+        with transaction.atomic():
+            func()
+            transaction.set_rollback(True)
+    return run
+
+
+def benchmark_scenarios(dataset):
+    # importuojama čia, kad benchmarks modulis nepriklausytų nuo views
+    from . import views
+
+    association = dataset.associations[0]
+    period = dataset.periods[-1]
+    customers = list(association.customers.order_by("full_name")[:2])
+    customer, unbilled = customers[0], customers[-1]
+    factory = RequestFactory()
+
+    # invoice_detail reikia išrašytos sąskaitos; generate_invoice matuojamas kitam klientui
+    invoice = generate_invoice(customer, period)
+    heating = association.tax_types.get(name="Šildymas")
+    cleaning = association.tax_types.get(name="Valymas")
+
+    # invoice_detail matuoja tikrą atvaizdavimą, invoice_detail_cached – fragmentų talpyklą
+    version = invoice_etag(versioned_invoice(customer.id, invoice.id))
+    fragments = [make_template_fragment_key(name, [invoice.id, version]) for name in INVOICE_FRAGMENTS]
+
+    def render(view, *args, uncached=(), **kwargs):
+        def run():
+            cache.delete_many(uncached)
+            response = view(factory.get("/"), *args, **kwargs)
+            assert response.status_code == 200, response.status_code
+        return run
+
+    return {
+        "generate_invoice": _rolled_back(lambda: generate_invoice(Customer.objects.get(id=unbilled.id), period)),
+        "invoice_detail": render(views.invoice_detail, customer.id, invoice.id, uncached=fragments),
+        "invoice_detail_cached": render(views.invoice_detail, customer.id, invoice.id),
+        "customer_dashboard": render(views.customer_dashboard, association.id, customer.id),
+        "meter_list": render(views.meter_list, association.id),
+        "customers_list": render(views.customers_list, association.id),
+        "api_invoice": render(views.api_detail, resource="invoices", pk=invoice.id, association_id=association.id),
+        "api_meters": render(views.api_list, resource="meters", association_id=association.id),
+        "api_customers": render(views.api_list, resource="customers", association_id=association.id),
+        # visų periodų simuliacija: šildymas +10 %, valymas pagal plotą
+        "simulate_billing": lambda: simulate(association, {
+            "periods": [str(p) for p in dataset.periods],
+            "taxes": [
+                {"tax_type": str(heating.id), "factor": "1.1"},
+                {"tax_type": str(cleaning.id), "distribution_type": "by_area"},
+            ],
+        }),
+    }
+
+
+# JSON API scenarijus -> HTML view su tomis pačiomis eilutėmis
+API_COUNTERPARTS = {
+    "api_invoice": "invoice_detail",
+    "api_meters": "meter_list",
+    "api_customers": "customers_list",
+}
+
+
+def api_comparison(results):
+    """(api scenario, html scenario, wall time ratio api / html) for every pair measured."""
+    return [
+        (api, html, results[api]["wall_time"] / results[html]["wall_time"])
+        for api, html in API_COUNTERPARTS.items()
+        if api in results and html in results and results[html]["wall_time"]
+    ]
+
+
+def run_benchmarks(dataset, repeat=3, only=None):
+    results = {}
+    for name, func in benchmark_scenarios(dataset).items():
+        if only and name not in only:
+            continue
+        func()  # apšildymas: šablonų ir užklausų talpyklos
+        results[name] = measure(func, repeat=repeat)
+    return results
+
+
+def compare(results, baseline, threshold=0.25):
+    """
+    Returns a list of regressions against the baseline.
+
+    Query counts are deterministic, so any increase is a regression; wall
+    time and peak memory may grow by at most threshold (0.25 = 25 %).
+    """
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if current["queries"] > base["queries"]:
+            regressions.append(f"{name}: queries {base['queries']} -> {current['queries']}")
+        for key in ("wall_time", "peak_memory"):
+            if base[key] and current[key] > base[key] * (1 + threshold):
+                regressions.append(f"{name}: {key} {base[key]:.4g} -> {current[key]:.4g}")
+    return regressions
+
+
+
+def profile_export(export, association, fmt="csv", expected_rows=None, samples=10,
+                   chunk_size=None, batch=None):
+    """
+    Consumes a tabular export under tracemalloc and samples traced memory
+    every expected_rows / samples rows. Returns (rows, bytes, samples) where
+    each sample is {"rows", "bytes", "current", "peak"}.
+    """
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    batch = batch or STREAM_BATCH_SIZE
+    step = max((expected_rows or 0) // samples, batch)
+    counted = 0
+
+    def counting(rows):
+        nonlocal counted
+        for row in rows:
+            counted += 1
+            yield row
+
+    taken, written, next_sample = [], 0, step
+    tracemalloc.start()
+    try:
+        for chunk in export.write(counting(export.rows(association, chunk_size=chunk_size)), fmt, batch=batch):
+            written += len(chunk)
+            if counted >= next_sample:
+                current, peak = tracemalloc.get_traced_memory()
+                taken.append({"rows": counted, "bytes": written, "current": current, "peak": peak})
+                next_sample += step
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    taken.append({"rows": counted, "bytes": written, "current": current, "peak": peak})
+    return counted, written, taken
+
+
+def memory_growth(samples):
+    """Peak memory at the end relative to the first sample (1.0 = perfectly flat)."""
+    first, last = samples[0]["peak"], samples[-1]["peak"]
+    return last / first if first else 1.0
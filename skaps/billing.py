@@ -0,0 +1,534 @@
+import copy
+import hashlib
+import logging
+import uuid
+from collections import defaultdict, namedtuple
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from . import billing_cache
+from .anomalies import detect_anomalies
+from .distribution import CENT, allocate
+from .estimation import estimate_missing_readings
+from .instrumentation import QueryCounter, timed_span
+from .ledger import LedgerWriter, payable
+from .reporting import refresh_period_rollup
+from .models import (
+    Customer, Meter, MeterReading, PeriodTax, Invoice, InvoiceItem, MeterConsumption, ConsumptionTotal,
+    ReadingAnomaly,
+)
+
+logger = logging.getLogger("skaps.billing")
+
+# Eilučių skaičius vienoje INSERT užklausoje
+BULK_BATCH_SIZE = 500
+
+
+LedgerRow = namedtuple("LedgerRow", ["start_value", "end_value", "consumed", "is_estimated"])
+
+
+def proportional_meter_types(period_taxes):
+    return {
+        pt.tax_type.meter_type
+        for pt in period_taxes
+        if pt.tax_type.distribution_type == "proportional" and pt.tax_type.meter_type
+    }
+
+
+def load_meter_inputs(association, period, meter_types):
+    """Meters, consumption ledger rows and their readings of the given meter types."""
+    inputs = {
+        "meters_by_customer": {}, "consumptions": {}, "reading_ids": {}, "total_consumption": {},
+        "meter_types": set(meter_types),
+    }
+    if not meter_types:
+        return inputs
+
+    meters_by_customer = defaultdict(list)
+    meters = Meter.objects.filter(
+        customer__association=association, meter_type__in=meter_types
+    ).order_by("created_at")
+    for meter in meters:
+        meters_by_customer[(meter.customer_id, meter.meter_type)].append(meter)
+    inputs["meters_by_customer"] = dict(meters_by_customer)
+
+    # Suvartojimas imamas iš žurnalo – jokio rodmenų agregavimo sąskaitos metu
+    consumptions = MeterConsumption.objects.filter(
+        meter__customer__association=association,
+        meter__meter_type__in=meter_types,
+        period=period,
+    )
+    inputs["consumptions"] = {c.meter_id: c for c in consumptions}
+    inputs["reading_ids"] = dict(
+        MeterReading.objects.filter(meter_id__in=inputs["consumptions"], period=period).values_list("meter_id", "id")
+    )
+
+    totals = ConsumptionTotal.objects.filter(association=association, meter_type__in=meter_types, period=period)
+    inputs["total_consumption"] = {t.meter_type: t.consumed for t in totals}
+    return inputs
+
+
+def load_billing_inputs(association, period):
+    """Reads everything allocation depends on for one association and period (cached by billing_cache)."""
+    customers = list(Customer.objects.filter(association=association).order_by("full_name", "id"))
+    period_taxes = list(
+        PeriodTax.objects.filter(association=association, period=period).select_related("tax_type")
+    )
+    return {
+        "customers": customers,
+        "period_taxes": period_taxes,
+        **load_meter_inputs(association, period, proportional_meter_types(period_taxes)),
+    }
+
+
+def load_period_inputs(association, periods, meter_types=(), readings=True):
+    """
+    load_billing_inputs() of many periods at once: {period id: inputs}.
+
+    Customers and meters are read once and shared by every period; period
+    taxes, ledger rows, readings and consumption totals take one query each.
+    Ledger rows are LedgerRow tuples rather than MeterConsumption objects.
+    Meters of `meter_types` are loaded even if no period tax needs them.
+    readings=False leaves reading_ids empty; only invoice items link to them.
+    """
+    period_ids = [period.id for period in periods]
+    customers = list(Customer.objects.filter(association=association).order_by("full_name", "id"))
+    period_taxes = defaultdict(list)
+    for pt in PeriodTax.objects.filter(association=association, period_id__in=period_ids).select_related("tax_type"):
+        period_taxes[pt.period_id].append(pt)
+    meter_types = set(meter_types).union(*map(proportional_meter_types, period_taxes.values()))
+
+    meters_by_customer = defaultdict(list)
+    consumptions, reading_ids, total_consumption = defaultdict(dict), defaultdict(dict), defaultdict(dict)
+    if meter_types:
+        meters = Meter.objects.filter(
+            customer__association=association, meter_type__in=meter_types
+        ).order_by("created_at")
+        for meter in meters:
+            meters_by_customer[(meter.customer_id, meter.meter_type)].append(meter)
+
+        ledger = MeterConsumption.objects.filter(
+            meter__customer__association=association, meter__meter_type__in=meter_types, period_id__in=period_ids
+        ).values_list("period_id", "meter_id", "start_value", "end_value", "consumed", "is_estimated")
+        # be modelių egzempliorių – paskirstymui reikia tik žurnalo reikšmių
+        for period_id, meter_id, *values in ledger:
+            consumptions[period_id][meter_id] = LedgerRow(*values)
+        if readings:
+            rows = MeterReading.objects.filter(
+                association=association, meter_type__in=meter_types, period_id__in=period_ids
+            ).values_list("period_id", "meter_id", "id")
+            for period_id, meter_id, reading_id in rows:
+                reading_ids[period_id][meter_id] = reading_id
+        totals = ConsumptionTotal.objects.filter(
+            association=association, meter_type__in=meter_types, period_id__in=period_ids
+        )
+        for t in totals:
+            total_consumption[t.period_id][t.meter_type] = t.consumed
+
+    meters_by_customer = dict(meters_by_customer)
+    return {
+        period_id: {
+            "customers": customers,
+            "period_taxes": period_taxes[period_id],
+            "meters_by_customer": meters_by_customer,
+            # reading_ids – tik skaitikliams, kurie turi žurnalo eilutę (kaip load_meter_inputs)
+            "consumptions": consumptions[period_id],
+            "reading_ids": {m: r for m, r in reading_ids[period_id].items() if m in consumptions[period_id]},
+            "total_consumption": total_consumption[period_id],
+            "meter_types": meter_types,
+        }
+        for period_id in period_ids
+    }
+
+
+class BillingContext:
+    """
+    Billing inputs of one association for one period.
+
+    Everything the distribution helpers need (customers, period taxes, floor
+    area, meters and the consumption ledger) is loaded once here, so billing N customers
+    costs the same handful of queries as billing one. The inputs come from
+    billing_cache and are only re-read after a signal invalidated them.
+    """
+
+    def __init__(self, association, period, inputs=None):
+        self.association = association
+        self.period = period
+
+        if inputs is None:
+            inputs = billing_cache.get_or_load(
+                association.id, period.id, lambda: load_billing_inputs(association, period)
+            )
+        self.customers = inputs["customers"]
+        self.period_taxes = inputs["period_taxes"]
+        self.meters_by_customer = inputs["meters_by_customer"]
+        self.consumptions = inputs["consumptions"]
+        self.reading_ids = inputs["reading_ids"]
+        self.total_consumption = inputs["total_consumption"]
+        # skaitiklių tipai, kurių duomenys įkelti
+        self.meter_types = inputs.get("meter_types") or proportional_meter_types(self.period_taxes)
+
+        self.customer_count = len(self.customers)
+        self.total_floor_area = sum((c.floor_area for c in self.customers), Decimal("0"))
+
+    def meters_for(self, customer, meter_type):
+        return self.meters_by_customer.get((customer.id, meter_type), [])
+
+    def with_period_taxes(self, period_taxes):
+        """
+        Copy of this context that bills `period_taxes` instead (used by
+        what-if simulations). Only meter types that were not loaded yet are
+        read from the database.
+        """
+        context = copy.copy(self)
+        context.__dict__.pop("allocation", None)
+        context.period_taxes = period_taxes
+        missing = proportional_meter_types(period_taxes) - self.meter_types
+        if missing:
+            extra = load_meter_inputs(self.association, self.period, missing)
+            context.meter_types = self.meter_types | extra.pop("meter_types")
+            for key, values in extra.items():
+                setattr(context, key, {**getattr(self, key), **values})
+        return context
+
+    @cached_property
+    def allocation(self):
+        with timed_span("billing.allocate", log=logger, association=str(self.association.id),
+                        period=str(self.period), customers=self.customer_count):
+            return allocate(self)
+
+    @cached_property
+    def existing_invoices(self):
+        """Latest already issued invoice per customer for this period."""
+        invoices = Invoice.objects.filter(
+            customer__association=self.association, period=self.period
+        ).order_by("customer_id", "-created_at")
+        latest = {}
+        for invoice in invoices:
+            latest.setdefault(invoice.customer_id, invoice)
+        return latest
+
+
+def _canonical(value):
+    if isinstance(value, Decimal):
+        return format(value.normalize(), "f")
+    return str(value)
+
+
+# paskirstytos eilutės laukai, nuo kurių priklauso įrašoma sąskaita
+HASHED_LINE_FIELDS = [
+    "period_tax", "meter", "reading_id", "description", "currency", "quantity", "unit_price", "total",
+    "start_value", "end_value", "consumed", "supplier_amount", "total_diff", "floor_area", "is_estimated",
+]
+
+
+def input_hash(customer, context):
+    """
+    Content hash of the customer's allocated invoice lines.
+
+    The allocation already reflects every input, including the other
+    customers' weights and the order that breaks cent ties, so an unchanged
+    hash means regenerating would produce the same invoice.
+    """
+    parts = []
+    for line in context.allocation.lines_for(customer):
+        for key in HASHED_LINE_FIELDS:
+            value = line.get(key)
+            # period_tax ir meter – modeliai, užtenka id
+            parts.append(getattr(value, "pk", value))
+
+    return hashlib.sha256("|".join(_canonical(p) for p in parts).encode()).hexdigest()
+
+
+def build_invoice_lines(customer, context):
+    """Returns (line items, total) for one customer from the shared allocation."""
+    allocation = context.allocation
+    return allocation.lines_for(customer), allocation.total_for(customer)
+
+
+def _stored(value):
+    # suapvalinama taip pat, kaip DecimalField(decimal_places=2) įrašo į DB
+    if value is None:
+        return None
+    return Decimal(value).quantize(CENT)
+
+
+def invoice_number(customer, period):
+    return f"INV-{period.year}{period.month:02d}-{customer.id.hex[:6]}-{uuid.uuid4().hex[:4]}"
+
+
+@dataclass
+class InvoiceDraft:
+    """
+    Invoice with its unsaved items; ids and number are assigned up front.
+
+    action is "create" for a new invoice, "replace" when an existing invoice
+    of the (customer, period) gets new items, "unchanged" when nothing moved.
+    """
+    invoice: Invoice
+    items: list
+    action: str = "create"
+
+
+def build_invoice(customer, period, context):
+    digest = input_hash(customer, context)
+    existing = context.existing_invoices.get(customer.id)
+    if existing is not None and existing.input_hash == digest:
+        return InvoiceDraft(invoice=existing, items=[], action="unchanged")
+
+    items, total_amount = build_invoice_lines(customer, context)
+    if not items:
+        return None
+
+    if existing is not None:
+        # tas pats numeris ir id – keičiamos tik eilutės ir sumos
+        invoice = existing
+        invoice.total_amount = total_amount
+        invoice.payable_amount = total_amount
+        invoice.input_hash = digest
+        action = "replace"
+    else:
+        invoice = Invoice(
+            customer=customer,
+            period=period,
+            number=invoice_number(customer, period),
+            total_amount=total_amount,
+            payable_amount=total_amount,
+            balance=0,
+            input_hash=digest,
+        )
+        action = "create"
+    invoice_items = [
+        InvoiceItem(
+            invoice=invoice,
+            description=item["description"],
+            quantity=_stored(item["quantity"]),
+            unit_price=_stored(item["unit_price"]),
+            total=_stored(item["total"]),
+            start_value=_stored(item.get("start_value")),
+            end_value=_stored(item.get("end_value")),
+            consumed=_stored(item.get("consumed")),
+            supplier_amount=_stored(item.get("supplier_amount")),
+            total_diff=_stored(item.get("total_diff")),
+            is_estimated=item.get("is_estimated", False),
+            meter=item.get("meter"),
+            period_tax=item.get("period_tax"),
+            reading_id=item.get("reading_id"),
+            floor_area=_stored(item.get("floor_area")),
+        )
+        for item in items
+    ]
+    return InvoiceDraft(invoice=invoice, items=invoice_items, action=action)
+
+
+ITEM_FIELDS = [
+    "description", "quantity", "unit_price", "total", "start_value", "end_value", "consumed",
+    "supplier_amount", "total_diff", "is_estimated", "meter_id", "period_tax_id", "reading_id", "floor_area",
+]
+
+
+def _item_key(item):
+    return item.period_tax_id, item.meter_id
+
+
+def _patch_items(replaced):
+    """
+    Diffs the new items of replaced invoices against the stored ones.
+
+    Items are matched by (period_tax, meter); only rows whose values moved
+    are returned for update, unmatched new rows for insert and unmatched
+    old rows for delete.
+    """
+    stored = defaultdict(dict)
+    for item in InvoiceItem.objects.filter(invoice__in=[d.invoice for d in replaced]):
+        stored[item.invoice_id][_item_key(item)] = item
+
+    to_create, to_update, to_delete = [], [], []
+    for draft in replaced:
+        old_items = stored[draft.invoice.id]
+        for item in draft.items:
+            old = old_items.pop(_item_key(item), None)
+            if old is None:
+                to_create.append(item)
+            elif any(getattr(old, f) != getattr(item, f) for f in ITEM_FIELDS):
+                for f in ITEM_FIELDS:
+                    setattr(old, f, getattr(item, f))
+                to_update.append(old)
+        to_delete.extend(old_items.values())
+    return to_create, to_update, to_delete
+
+
+def _post_to_ledger(created, replaced):
+    """
+    Charges new invoices to the customer ledger and books total changes of
+    replaced ones as correcting entries. The balance before the invoice is
+    stored on it and applied to the payable amount.
+    """
+    ledger = LedgerWriter({d.invoice.customer_id for d in created + replaced})
+    old_totals = {}
+    if replaced:
+        old_totals = dict(
+            Invoice.objects.filter(id__in=[d.invoice.id for d in replaced]).values_list("id", "total_amount")
+        )
+
+    for draft in created:
+        invoice = draft.invoice
+        invoice.total_amount = _stored(invoice.total_amount)
+        invoice.balance = ledger.balance(invoice.customer_id)
+        invoice.payable_amount = payable(invoice.total_amount, invoice.balance)
+        ledger.post(invoice.customer_id, "invoice", -invoice.total_amount, invoice=invoice, note=invoice.number)
+
+    for draft in replaced:
+        invoice = draft.invoice
+        invoice.total_amount = _stored(invoice.total_amount)
+        invoice.payable_amount = payable(invoice.total_amount, invoice.balance)
+        change = invoice.total_amount - old_totals[invoice.id]
+        if change:
+            ledger.post(invoice.customer_id, "invoice", -change, invoice=invoice,
+                        note=f"{invoice.number} perskaičiuota")
+    return ledger
+
+
+def save_invoices(drafts, batch_size=BULK_BATCH_SIZE):
+    """
+    Writes all drafts in one transaction with bulk statements.
+
+    New invoices are inserted. Replaced ones are updated in place and only
+    their changed item rows are written. Unchanged ones are not touched,
+    apart from clearing a stale flag. New and changed totals are posted to
+    the customer ledger.
+    """
+    created = [d for d in drafts if d.action == "create"]
+    replaced = [d for d in drafts if d.action == "replace"]
+    refreshed = [d.invoice for d in drafts if d.action == "unchanged" and d.invoice.is_stale]
+
+    with transaction.atomic():
+        ledger = _post_to_ledger(created, replaced) if created or replaced else None
+        if replaced:
+            now = timezone.now()
+            for draft in replaced:
+                draft.invoice.updated_at = now
+                draft.invoice.is_stale = False
+            to_create, to_update, to_delete = _patch_items(replaced)
+            for item in to_update:
+                item.updated_at = now
+
+            InvoiceItem.objects.filter(id__in=[i.id for i in to_delete]).delete()
+            InvoiceItem.objects.bulk_update(to_update, ITEM_FIELDS + ["updated_at"], batch_size=batch_size)
+            InvoiceItem.objects.bulk_create(to_create, batch_size=batch_size)
+            Invoice.objects.bulk_update(
+                [d.invoice for d in replaced],
+                ["total_amount", "payable_amount", "input_hash", "is_stale", "updated_at"],
+                batch_size=batch_size,
+            )
+        if refreshed:
+            Invoice.objects.filter(id__in=[invoice.id for invoice in refreshed]).update(is_stale=False)
+            for invoice in refreshed:
+                invoice.is_stale = False
+
+        Invoice.objects.bulk_create([d.invoice for d in created], batch_size=batch_size)
+        InvoiceItem.objects.bulk_create([i for d in created for i in d.items], batch_size=batch_size)
+        if ledger:
+            ledger.save(batch_size=batch_size)
+    return [d.invoice for d in drafts]
+
+
+def generate_invoice(customer, period, context=None):
+    if context is None:
+        context = BillingContext(customer.association, period)
+
+    draft = build_invoice(customer, period, context)
+    if draft is None:
+        return None
+
+    if draft.action != "unchanged":
+        save_invoices([draft])
+        refresh_period_rollup(customer.association_id, period)
+    elif draft.invoice.is_stale:
+        # įvestys tos pačios – tik nuimama pasenusios sąskaitos žymė
+        save_invoices([draft])
+    return draft.invoice
+
+
+@dataclass
+class BillingRun:
+    """Result of an association-wide invoice run."""
+    association: object
+    period: object
+    invoices: list = field(default_factory=list)
+    skipped: list = field(default_factory=list)
+    queries: int = 0
+    db_time: float = 0.0
+    wall_time: float = 0.0
+    # įtartini šio periodo rodmenys (ReadingAnomaly)
+    anomalies: int = 0
+    # trūkstami rodmenys, įvertinti pagal ankstesnį suvartojimą
+    estimated: int = 0
+    # visi bendrijos klientai; customers – jau apdoroti
+    total_customers: int = 0
+
+    @property
+    def customers(self):
+        return len(self.invoices) + len(self.skipped)
+
+
+def generate_association_invoices(association, period, estimate=False, chunk_size=None, on_chunk=None):
+    """
+    Bills every customer of the association for the period in one pass.
+    estimate=True first fills missing readings with estimates.
+
+    With chunk_size the invoices are saved chunk_size customers at a time,
+    each chunk in one transaction with on_chunk(run), so a long run keeps
+    what it finished. Running it again is safe: invoices whose inputs did
+    not change come out "unchanged" and are not written again.
+    """
+    run = BillingRun(association=association, period=period)
+
+    with QueryCounter() as counter:
+        if estimate:
+            run.estimated = len(estimate_missing_readings(association, period))
+        # rodmenys patikrinami prieš skaičiuojant – įspėjama, ne stabdoma
+        detect_anomalies(association.id)
+        run.anomalies = ReadingAnomaly.objects.filter(association=association, period=period).count()
+        context = BillingContext(association, period)
+        customers = context.customers
+        run.total_customers = len(customers)
+        size = chunk_size or len(customers) or 1
+        for start in range(0, len(customers), size):
+            drafts = []
+            for customer in customers[start:start + size]:
+                # customer.association jau žinoma – nereikia papildomos užklausos
+                customer.association = association
+                draft = build_invoice(customer, period, context)
+                if draft is None:
+                    run.skipped.append(customer)
+                else:
+                    drafts.append(draft)
+            if on_chunk is None:
+                run.invoices += save_invoices(drafts)
+                continue
+            # sąskaitos ir progresas įrašomi kartu
+            with transaction.atomic():
+                run.invoices += save_invoices(drafts)
+                on_chunk(run)
+        if run.invoices:
+            refresh_period_rollup(association.id, period)
+
+    run.queries = counter.queries
+    run.db_time = counter.db_time
+    run.wall_time = counter.wall_time
+    logger.info(
+        "billed %s %s: %d invoices, %d skipped in %.1f ms, %d queries",
+        association, period, len(run.invoices), len(run.skipped), run.wall_time * 1000, run.queries,
+        extra={"association": str(association.id), "period": str(period), "queries": run.queries},
+    )
+    if run.anomalies:
+        logger.warning(
+            "%s %s billed with %d suspicious meter readings", association, period, run.anomalies,
+            extra={"association": str(association.id), "period": str(period), "anomalies": run.anomalies},
+        )
+    return run
@@ -0,0 +1,77 @@
+"""
+Cache of per-(association, period) billing inputs.
+
+BillingContext reads customers, period taxes, meters and the consumption
+ledger of an association through get_or_load(). Cache keys carry two
+versions kept in the database: Association.billing_generation, bumped by
+changes that touch every period (customers, meters, tax types, ledger
+rebuilds), and the BillingInputsVersion token of the period, replaced when
+its readings or period taxes change. Signals bump them inside the
+transaction of the change, so every process, the invoice worker included,
+sees the new key as soon as the change commits, whatever cache backend it
+uses; a hit costs one query for the versions.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from .instrumentation import metrics
+from .models import Association, BillingInputsVersion
+
+CACHE_ALIAS = "billing"
+KEY_PREFIX = "skaps:billing"
+
+
+def _cache():
+    try:
+        return caches[CACHE_ALIAS]
+    except InvalidCacheBackendError:
+        return caches["default"]
+
+
+def _key(association_id, period_id):
+    token = BillingInputsVersion.objects.filter(association_id=OuterRef("pk"), period_id=period_id).values("token")
+    versions = Association.objects.filter(id=association_id).annotate(token=Subquery(token[:1])).values_list(
+        "billing_generation", "token"
+    ).first()
+    generation, token = versions or (None, None)
+    return f"{KEY_PREFIX}:{association_id}:{generation}:{period_id}:{token}"
+
+
+def get_or_load(association_id, period_id, loader):
+    cache = _cache()
+    key = _key(association_id, period_id)
+    inputs = cache.get(key)
+    if inputs is not None:
+        metrics.increment("billing_cache_hit")
+        return inputs
+    metrics.increment("billing_cache_miss")
+    inputs = loader()
+    cache.set(key, inputs, getattr(settings, "SKAPS_BILLING_CACHE_TIMEOUT", 3600))
+    return inputs
+
+
+def invalidate_periods(association_id, *period_ids):
+    period_ids = [p for p in period_ids if p]
+    if not association_id or not period_ids:
+        return
+    # atsitiktinė žymė, ne skaitiklis: vienas upsert be lenktynių
+    now = timezone.now()
+    BillingInputsVersion.objects.bulk_create(
+        [
+            BillingInputsVersion(association_id=association_id, period_id=period_id, token=uuid.uuid4().hex[:12],
+                                 created_at=now, updated_at=now)
+            for period_id in period_ids
+        ],
+        update_conflicts=True, unique_fields=["association_id", "period_id"], update_fields=["token", "updated_at"],
+    )
+    metrics.increment("billing_cache_invalidation")
+
+
+def invalidate_association(association_id):
+    if association_id:
+        Association.objects.filter(id=association_id).update(billing_generation=F("billing_generation") + 1)
+        metrics.increment("billing_cache_invalidation")
@@ -0,0 +1,189 @@
+"""
+Consumption ledger maintenance.
+
+MeterConsumption holds (start, end, consumed) per meter and period and
+ConsumptionTotal holds the association-wide totals per meter type, so
+proportional billing reads them instead of re-aggregating readings. A
+reading in period P affects the ledger rows of P and of the following
+period (whose start value it is); both are refreshed after every change
+and their cached billing inputs dropped.
+
+Readings carry their association, meter_type and period ordinal, so every
+aggregate here is a single-table range scan over MeterReading.
+
+A period billed on an estimated reading keeps its estimated_value in the
+ledger after the real reading arrives, so the next period starts from the
+estimate and its consumption trues the difference up (see estimation.py).
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+from . import billing_cache
+from .models import Meter, MeterReading, Period, MeterConsumption, ConsumptionTotal
+
+
+# reikšmė, kuria periodas apmokestintas
+BILLED_VALUE = Coalesce("estimated_value", "value")
+
+
+def meter_consumed(start_value, end_value):
+    # be ankstesnio rodmens suvartojimo nežinome
+    return end_value - start_value if start_value is not None else Decimal("0")
+
+
+def total_consumed(start_total, end_total):
+    # be praėjusio periodo rodmenų imama visa suma
+    return end_total - start_total if start_total else end_total
+
+
+def _neighbours(period):
+    return period.previous_period(), period.next_period()
+
+
+def _store_meter_row(meter_id, period, start_value, end_value, estimated=False):
+    if end_value is None:
+        MeterConsumption.objects.filter(meter_id=meter_id, period=period).delete()
+        return
+    MeterConsumption.objects.update_or_create(
+        meter_id=meter_id,
+        period=period,
+        defaults={
+            "start_value": start_value,
+            "end_value": end_value,
+            "consumed": meter_consumed(start_value, end_value),
+            "is_estimated": estimated,
+        },
+    )
+
+
+def refresh_meter_consumption(meter_id, period):
+    """Re-derives the meter's ledger rows for the period and the one after it."""
+    previous, following = _neighbours(period)
+    ordinal = period.ordinal
+    values, estimated = {}, set()
+    readings = MeterReading.objects.filter(
+        meter_id=meter_id, period_ordinal__range=(ordinal - 1, ordinal + 1)
+    ).values_list("period_ordinal", BILLED_VALUE, "estimated_value")
+    for reading_ordinal, value, estimated_value in readings:
+        values[reading_ordinal] = value
+        if estimated_value is not None:
+            estimated.add(reading_ordinal)
+
+    current = values.get(ordinal)
+    _store_meter_row(meter_id, period, values.get(ordinal - 1), current, ordinal in estimated)
+    if following:
+        _store_meter_row(meter_id, following, current, values.get(ordinal + 1), ordinal + 1 in estimated)
+
+
+def _period_end_total(association_id, meter_type, period):
+    return MeterReading.objects.filter(
+        association_id=association_id,
+        meter_type=meter_type,
+        period_ordinal=period.ordinal,
+    ).aggregate(total=Sum(BILLED_VALUE), count=Count("id"))
+
+
+def refresh_consumption_total(association_id, meter_type, period):
+    """Re-aggregates the association total for the period and chains it into the next one."""
+    previous, following = _neighbours(period)
+    current = _period_end_total(association_id, meter_type, period)
+    end_total = current["total"] or Decimal("0")
+
+    if not current["count"]:
+        ConsumptionTotal.objects.filter(association_id=association_id, meter_type=meter_type, period=period).delete()
+    else:
+        start_total = Decimal("0")
+        if previous:
+            start_total = ConsumptionTotal.objects.filter(
+                association_id=association_id, meter_type=meter_type, period=previous
+            ).values_list("end_total", flat=True).first() or Decimal("0")
+        ConsumptionTotal.objects.update_or_create(
+            association_id=association_id,
+            meter_type=meter_type,
+            period=period,
+            defaults={
+                "start_total": start_total,
+                "end_total": end_total,
+                "consumed": total_consumed(start_total, end_total),
+            },
+        )
+
+    if following:
+        row = ConsumptionTotal.objects.filter(
+            association_id=association_id, meter_type=meter_type, period=following
+        ).first()
+        if row:
+            row.start_total = end_total
+            row.consumed = total_consumed(end_total, row.end_total)
+            row.save(update_fields=["start_total", "consumed", "updated_at"])
+
+
+def refresh_reading_ledger(meter_id, period_id):
+    """Brings the ledger up to date after a reading of (meter, period) changed."""
+    meter = Meter.objects.filter(id=meter_id).values("customer__association_id", "meter_type").first()
+    period = Period.objects.filter(id=period_id).first()
+    if meter is None or period is None:
+        return
+
+    with transaction.atomic():
+        refresh_meter_consumption(meter_id, period)
+        refresh_consumption_total(meter["customer__association_id"], meter["meter_type"], period)
+    following = period.next_period()
+    billing_cache.invalidate_periods(meter["customer__association_id"], period.id, following and following.id)
+
+
+def rebuild_consumption(association):
+    """
+    Rebuilds the whole ledger of an association from its readings.
+
+    Used after bulk writes that bypass model signals; reads every reading of
+    the association once and rewrites the ledger with two bulk inserts.
+    """
+    readings = MeterReading.objects.filter(association=association).values_list(
+        "meter_id", "meter_type", "period_id", "period_ordinal", BILLED_VALUE, "estimated_value"
+    )
+    values = {}
+    estimated = set()
+    period_ids = {}
+    end_totals = defaultdict(Decimal)
+    for meter_id, meter_type, period_id, ordinal, value, estimated_value in readings:
+        values[(meter_id, ordinal)] = value
+        if estimated_value is not None:
+            estimated.add((meter_id, ordinal))
+        period_ids[ordinal] = period_id
+        end_totals[(meter_type, ordinal)] += value
+
+    meter_rows = []
+    for (meter_id, ordinal), value in values.items():
+        start_value = values.get((meter_id, ordinal - 1))
+        meter_rows.append(MeterConsumption(
+            meter_id=meter_id,
+            period_id=period_ids[ordinal],
+            start_value=start_value,
+            end_value=value,
+            consumed=meter_consumed(start_value, value),
+            is_estimated=(meter_id, ordinal) in estimated,
+        ))
+
+    total_rows = []
+    for (meter_type, ordinal), end_total in end_totals.items():
+        start_total = end_totals.get((meter_type, ordinal - 1), Decimal("0"))
+        total_rows.append(ConsumptionTotal(
+            association=association,
+            meter_type=meter_type,
+            period_id=period_ids[ordinal],
+            start_total=start_total,
+            end_total=end_total,
+            consumed=total_consumed(start_total, end_total),
+        ))
+
+    with transaction.atomic():
+        MeterConsumption.objects.filter(meter__customer__association=association).delete()
+        ConsumptionTotal.objects.filter(association=association).delete()
+        MeterConsumption.objects.bulk_create(meter_rows, batch_size=500)
+        ConsumptionTotal.objects.bulk_create(total_rows, batch_size=500)
+    billing_cache.invalidate_association(association.id)
@@ -0,0 +1,199 @@
+"""
+Distribution engine.
+
+Each TaxType.distribution_type key maps to a strategy registered with
+@register. A strategy receives one PeriodTax and the BillingContext of its
+association and returns the invoice lines of every customer at once, so
+allocate() produces the whole customers × taxes matrix in one call.
+
+Split strategies allocate cents with the largest-remainder method, so the
+customers' shares always add up to the PeriodTax amount exactly.
+"""
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal, ROUND_FLOOR
+
+from .instrumentation import timed_span
+
+logger = logging.getLogger("skaps.billing")
+
+CENT = Decimal("0.01")
+
+DISTRIBUTION_STRATEGIES = {}
+
+# Raktas likučiui, kurio neapima nė vienas klientas (pvz. skaitiklis be ankstesnio rodmens)
+UNALLOCATED = object()
+
+
+def register(key):
+    """Registers a strategy for a TaxType.DISTRIBUTION_CHOICES key."""
+    def decorator(func):
+        DISTRIBUTION_STRATEGIES[key] = func
+        return func
+    return decorator
+
+
+def largest_remainder(amount, weights, total_weight=None):
+    """
+    Splits amount over weights ({key: weight}) in whole cents.
+
+    Every share is first rounded down, then the leftover cents go to the keys
+    with the largest fractional parts. If total_weight is larger than the sum
+    of weights, the difference is an unallocated bucket whose share is dropped;
+    a smaller total_weight is ignored, so the shares never exceed amount.
+    """
+    weights = dict(weights)
+    weight_sum = sum(weights.values(), Decimal("0"))
+    if total_weight is not None and total_weight < weight_sum:
+        logger.warning("total weight %s is below the sum of weights %s, splitting over the sum",
+                       total_weight, weight_sum)
+    elif total_weight is not None and total_weight != weight_sum:
+        weights[UNALLOCATED] = total_weight - weight_sum
+        weight_sum = total_weight
+    if not weights or weight_sum == 0:
+        return {key: Decimal("0.00") for key in weights if key is not UNALLOCATED}
+
+    amount = Decimal(amount)
+    raw = {key: amount * Decimal(w) / weight_sum for key, w in weights.items()}
+    shares = {key: value.quantize(CENT, rounding=ROUND_FLOOR) for key, value in raw.items()}
+
+    leftover = int((amount.quantize(CENT) - sum(shares.values())) / CENT)
+    # stabilus rikiavimas: lygiems likučiams pirmenybė pagal eiliškumą
+    order = sorted(weights, key=lambda key: raw[key] - shares[key], reverse=True)
+    for key in order[:leftover]:
+        shares[key] += CENT
+
+    shares.pop(UNALLOCATED, None)
+    return shares
+
+
+def _header(pt):
+    # bendri visų kliento eilučių laukai – skaičiuojami vieną kartą mokesčiui
+    return {
+        "description": f"{pt.tax_type.name} ({pt.tax_type.get_distribution_type_display()})",
+        "currency": pt.tax_type.currency,
+        "period_tax": pt,
+        # tiekėjo sąskaita, iš kurios eilutė paskirstyta
+        "supplier_amount": pt.amount,
+    }
+
+
+def _line(header, **values):
+    return {**header, **values}
+
+
+@register("fixed")
+def distribute_fixed(pt, context):
+    # fiksuotas mokestis kiekvienam klientui
+    amount = pt.amount.quantize(CENT)
+    header = _header(pt)
+    return {
+        c.id: [_line(header, quantity=1, unit_price=amount, total=amount)]
+        for c in context.customers
+    }
+
+
+@register("equal_split")
+def distribute_equal_split(pt, context):
+    # padalinam visiems klientams po lygiai
+    shares = largest_remainder(pt.amount, {c.id: Decimal("1") for c in context.customers})
+    header = _header(pt)
+    return {
+        customer_id: [_line(header, quantity=1, unit_price=share, total=share)]
+        for customer_id, share in shares.items()
+    }
+
+
+@register("by_area")
+def distribute_by_area(pt, context):
+    # proporcingai pagal plotą
+    total_area = context.total_floor_area
+    if total_area > 0:
+        unit_price = pt.amount / total_area
+        shares = largest_remainder(pt.amount, {c.id: c.floor_area for c in context.customers})
+    else:
+        unit_price = Decimal("0")
+        shares = {c.id: Decimal("0.00") for c in context.customers}
+
+    header = _header(pt)
+    return {
+        c.id: [_line(header, quantity=c.floor_area, unit_price=unit_price, total=shares[c.id], floor_area=c.floor_area)]
+        for c in context.customers
+    }
+
+
+@register("proportional")
+def distribute_proportional(pt, context):
+    # proporcingai pagal skaitiklių suvartojimą iš žurnalo
+    meter_type = pt.tax_type.meter_type
+    if not meter_type:
+        return {}
+
+    total_diff = context.total_consumption.get(meter_type, Decimal("0"))
+    unit_price = pt.amount / total_diff if total_diff > 0 else Decimal("0")
+
+    billed = []
+    for c in context.customers:
+        for meter in context.meters_for(c, meter_type):
+            consumption = context.consumptions.get(meter.id)
+            if consumption is None:
+                continue  # be dabartinio rodmens nieko nerodome
+            billed.append((c, meter, consumption))
+
+    if total_diff > 0:
+        shares = largest_remainder(
+            pt.amount, {meter.id: consumption.consumed for _, meter, consumption in billed}, total_diff
+        )
+    else:
+        shares = {}
+
+    header = _header(pt)
+    lines = defaultdict(list)
+    for c, meter, consumption in billed:
+        lines[c.id].append(_line(
+            header,
+            quantity=consumption.consumed,
+            start_value=consumption.start_value,
+            end_value=consumption.end_value,
+            consumed=consumption.consumed,
+            unit_price=unit_price,
+            total=shares.get(meter.id, Decimal("0.00")),
+            unit=meter.unit_display,
+            total_diff=total_diff,
+            is_estimated=consumption.is_estimated,
+            meter=meter,
+            reading_id=context.reading_ids.get(meter.id),
+        ))
+    return lines
+
+
+@dataclass
+class Allocation:
+    """Allocation matrix of one association and period."""
+    lines: dict = field(default_factory=lambda: defaultdict(list))
+    shares: dict = field(default_factory=lambda: defaultdict(dict))
+
+    def lines_for(self, customer):
+        return self.lines.get(customer.id, [])
+
+    def total_for(self, customer):
+        return sum(self.shares.get(customer.id, {}).values(), Decimal("0"))
+
+
+def allocate(context):
+    """Runs every PeriodTax of the context through its strategy."""
+    allocation = Allocation()
+    for pt in context.period_taxes:
+        distribution_type = pt.tax_type.distribution_type
+        strategy = DISTRIBUTION_STRATEGIES.get(distribution_type)
+        if strategy is None:
+            logger.warning("no distribution strategy for %r (period tax %s)", distribution_type, pt.id)
+            continue
+        with timed_span(f"distribution.{distribution_type}", log=logger,
+                        period_tax=str(pt.id), customers=context.customer_count):
+            result = strategy(pt, context)
+        for customer_id, lines in result.items():
+            allocation.lines[customer_id].extend(lines)
+            allocation.shares[customer_id][pt.id] = sum((line["total"] for line in lines), Decimal("0"))
+    return allocation
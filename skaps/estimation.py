@@ -0,0 +1,84 @@
+"""
+Estimated meter readings.
+
+A meter that has a reading for the previous period but none for the billed
+one gets an estimated reading: its last real reading plus the consumption
+its MeterStats profile expects for every month since, i.e. the calendar
+month's mean, or the overall mean while that month has too little history.
+detect_anomalies() keeps the profiles current from one ordered pass over
+the readings, so a whole association is estimated with one query for the
+meters to fill, one bulk insert and one ledger rebuild.
+
+An estimate is a MeterReading with is_estimated=True, and estimated_value
+records what the period was billed with. When the real reading arrives it
+replaces value and clears is_estimated, but the ledger keeps billing that
+period with estimated_value: the issued invoice does not change, the next
+period starts from the estimate, and its consumption trues up the
+difference.
+"""
+import logging
+from decimal import Decimal
+
+from .anomalies import MIN_MONTH_SAMPLES, calendar_month, detect_anomalies
+from .consumption import rebuild_consumption
+from .distribution import CENT
+from .models import MeterReading, MeterStats
+
+logger = logging.getLogger("skaps.estimation")
+
+
+def profile_consumption(stats, ordinal):
+    """Consumption the meter usually has in the reading's calendar month, or None without history."""
+    if not stats.samples:
+        return None
+    count, mean, _ = stats.monthly.get(calendar_month(ordinal), (0, 0.0, 0.0))
+    return mean if count >= MIN_MONTH_SAMPLES else stats.mean
+
+
+def estimate_reading(stats, ordinal):
+    """Estimated counter value at `ordinal` from the meter's last real reading, or None."""
+    if stats.last_value is None or stats.last_ordinal >= ordinal:
+        return None
+    consumed = 0.0
+    for month in range(stats.last_ordinal + 1, ordinal + 1):
+        expected = profile_consumption(stats, month)
+        if expected is None:
+            return None
+        consumed += expected
+    return (stats.last_value + Decimal(consumed)).quantize(CENT)
+
+
+def estimate_missing_readings(association, period):
+    """
+    Creates estimated readings for the association's meters that have a
+    reading in the previous period but none in `period`; returns them.
+
+    Meters whose last reading is older are left alone, since their ledger
+    has no start value for `period` anyway.
+    """
+    detect_anomalies(association.id)
+    missing = MeterStats.objects.filter(
+        association=association, meter__readings__period_ordinal=period.ordinal - 1
+    ).exclude(meter__readings__period_ordinal=period.ordinal).select_related("meter")
+
+    readings = []
+    for stats in missing:
+        value = estimate_reading(stats, period.ordinal)
+        if value is None:
+            continue
+        readings.append(
+            MeterReading(meter_id=stats.meter_id, period=period, value=value, is_estimated=True,
+                         estimated_value=value)
+            .denormalize(association.id, stats.meter.meter_type, period)
+        )
+    if not readings:
+        return []
+
+    MeterReading.objects.bulk_create(readings, batch_size=500)
+    # bulk_create aplenkia signalus – žurnalas perstatomas vienu kartu
+    rebuild_consumption(association)
+    logger.info(
+        "%d estimated readings for %s %s", len(readings), association, period,
+        extra={"association": str(association.id), "period": str(period), "estimated": len(readings)},
+    )
+    return readings
@@ -0,0 +1,355 @@
+"""
+Invoice exports.
+
+A PDF is rendered from the same InvoiceDocument as the HTML page and stored
+under invoices/<invoice id>/<etag>.pdf in default_storage, so it is
+produced once per invoice version and later requests just stream the file.
+A re-billed invoice gets a new etag; the old file is removed when the new
+one is written.
+
+export_period_invoices() renders every invoice of an association period in
+a process pool and writes the results into a zip as they finish. Only the
+parent touches the database; workers get ready InvoiceDocuments, and at
+most a few documents per worker are in flight, so memory does not grow
+with the number of invoices. By default exports share one pool of
+EXPORT_WORKERS processes per server process, started on first use, so
+concurrent exports queue for the same workers instead of each starting
+its own.
+
+TABULAR_EXPORTS describe the flat CSV/XLSX exports for accountants:
+invoice items with their invoice, meter readings and period taxes of an
+association. Rows come from values_list().iterator(), so they are read
+from the database in chunks and never collected.
+"""
+import os
+import statistics
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template.loader import render_to_string
+
+from .forms import ListFilterForm
+from .instrumentation import metrics
+from .models import InvoiceItem, MeterReading, PeriodTax
+from .pdf import PDFDocument
+from .read_models import InvoiceDocument, period_invoices
+from .streaming import STREAM_BATCH_SIZE, csv_stream, xlsx_stream
+
+EXPORT_FORMATS = ("pdf", "html")
+# kiek užduočių vienam procesui laikoma eilėje
+IN_FLIGHT_PER_WORKER = 4
+EXPORT_WORKERS = min(os.cpu_count() or 1, 4)
+
+
+def _money(value, currency):
+    return f"{value:.2f} {currency or ''}".strip()
+
+
+def render_invoice_pdf(document):
+    invoice, customer = document.invoice, document.customer
+    currency = document.currency
+    pdf = PDFDocument()
+    pdf.line(f"Sąskaita {invoice.number}", size=16, bold=True)
+    pdf.line(str(document.association), size=12)
+    pdf.line(f"Periodas: {invoice.period}")
+    pdf.line(f"Klientas: {customer.full_name}")
+    pdf.line(f"Data: {invoice.date}")
+
+    def name(line):
+        return f"{line.name} [{line.footnote}]" if line.footnote else line.name
+
+    pdf.space()
+    pdf.line("Bendrijos mokesčiai", size=12, bold=True)
+    pdf.line("Aprašymas", (280, "Vieneto kaina"), (420, "Suma"), bold=True)
+    for line in document.community_lines:
+        pdf.line(
+            name(line), (280, f"{_money(line.unit_price, line.currency)} {line.quantity_label}"),
+            (420, _money(line.total, line.currency)),
+        )
+
+    if document.meter_lines:
+        pdf.space()
+        pdf.line("Skaitiklių sąnaudos", size=12, bold=True)
+        pdf.line("Aprašymas", (160, "Nuo"), (215, "Iki"), (270, "Suvartota"), (340, "Vieneto kaina"),
+                 (420, "Suma"), bold=True)
+        for line in document.meter_lines:
+            pdf.line(
+                name(line), (160, f"{line.start_value:.0f}" if line.start_value is not None else ""),
+                (215, f"{line.end_value:.0f}"), (270, f"{line.consumed:.0f} {line.unit}"),
+                (340, _money(line.unit_price, line.currency)), (420, _money(line.total, line.currency)),
+            )
+
+    pdf.rule()
+    pdf.line(f"Bendra suma: {_money(invoice.total_amount, currency)}", bold=True)
+    pdf.line(f"Balansas: {_money(invoice.balance, currency)}")
+    pdf.line(f"Mokėti: {_money(invoice.payable_amount, currency)}", bold=True)
+
+    if document.footnotes:
+        pdf.space()
+        pdf.line("Pastabos:", bold=True)
+        for number, footnote in enumerate(document.footnotes, start=1):
+            pdf.line(f"{number}. {footnote}", size=9)
+    return pdf.render()
+
+
+def invoice_pdf_name(invoice, etag):
+    return f"invoices/{invoice.id}/{etag}.pdf"
+
+
+def stored_invoice_pdf(invoice, etag, storage=None):
+    """
+    Name of the stored PDF of this invoice version, rendering and saving it
+    first if needed. `invoice` must come from versioned_invoice().
+    """
+    storage = storage or default_storage
+    name = invoice_pdf_name(invoice, etag)
+    if storage.exists(name):
+        return name
+
+    content = render_invoice_pdf(InvoiceDocument.for_invoice(invoice))
+    folder = f"invoices/{invoice.id}"
+    if storage.exists(folder):
+        for old in storage.listdir(folder)[1]:
+            storage.delete(f"{folder}/{old}")
+    saved = storage.save(name, ContentFile(content))
+    if saved != name:
+        # lygiagrečiai ta pati versija jau įrašyta
+        storage.delete(saved)
+    metrics.increment("invoice_pdf_rendered")
+    return name
+
+
+def render_invoice_html(document, version):
+    return render_to_string("skaps/invoice_detail.html", {
+        "customer": document.customer,
+        "invoice": document.invoice,
+        "document": document,
+        "version": version,
+    }).encode()
+
+
+def render_invoice(document, version, fmt):
+    """Runs in a pool worker: (file name, content, seconds)."""
+    started = time.perf_counter()
+    content = render_invoice_pdf(document) if fmt == "pdf" else render_invoice_html(document, version)
+    name = f"{document.invoice.number}.{fmt}".replace("/", "-")
+    return name, content, time.perf_counter() - started
+
+
+def _init_worker():
+    # spawn/forkserver procesai pradeda be sukonfigūruoto Django
+    import django
+    django.setup()
+
+
+@dataclass
+class ExportRun:
+    association: object
+    period: object
+    files: int = 0
+    bytes: int = 0
+    wall_time: float = 0.0
+    timings: list = field(default_factory=list)
+
+    @property
+    def median_render_time(self):
+        return statistics.median(t for _, t in self.timings) if self.timings else 0.0
+
+    @property
+    def slowest(self):
+        return max(self.timings, key=lambda timing: timing[1], default=None)
+
+
+def _write(archive, run, result):
+    name, content, seconds = result
+    compression = zipfile.ZIP_STORED if name.endswith(".pdf") else zipfile.ZIP_DEFLATED
+    archive.writestr(name, content, compress_type=compression)
+    run.files += 1
+    run.bytes += len(content)
+    run.timings.append((name, seconds))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def shared_pool():
+    """The export pool of this process, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=EXPORT_WORKERS, initializer=_init_worker)
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _render_in_pool(pool, workers, archive, run, formats):
+    pending = set()
+    for document, version in period_invoices(run.association, run.period):
+        for fmt in formats:
+            pending.add(pool.submit(render_invoice, document, version, fmt))
+        if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                _write(archive, run, future.result())
+    for future in wait(pending).done:
+        _write(archive, run, future.result())
+
+
+def export_period_invoices(association, period, target, formats=("pdf",), workers=None):
+    """
+    Writes the latest invoice of every customer in `formats` into a zip at
+    `target` (a path or a binary file object). workers=None renders in the
+    shared pool, a number in a pool of its own and 0 in this process.
+    Returns an ExportRun with per-file render times.
+    """
+    for fmt in formats:
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format {fmt!r}")
+    run = ExportRun(association=association, period=period)
+    started = time.perf_counter()
+
+    with zipfile.ZipFile(target, "w") as archive:
+        if workers == 0:
+            for document, version in period_invoices(association, period):
+                for fmt in formats:
+                    _write(archive, run, render_invoice(document, version, fmt))
+        elif workers is None:
+            pool = shared_pool()
+            try:
+                _render_in_pool(pool, EXPORT_WORKERS, archive, run, formats)
+            except BrokenProcessPool:
+                # nutrūkusio darbininko baseinas nebepanaudojamas – kitas eksportas paleis naują
+                _discard_pool(pool)
+                raise
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                _render_in_pool(pool, workers, archive, run, formats)
+
+    run.wall_time = time.perf_counter() - started
+    metrics.increment("invoice_export_files", run.files)
+    return run
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+@dataclass(frozen=True)
+class TabularExport:
+    name: str
+    title: str
+    columns: tuple
+    ordering: tuple
+    filters: dict
+
+    def header(self):
+        return [title for title, _ in self.columns]
+
+    def queryset(self, association):
+        raise NotImplementedError
+
+    def filter_form(self, data=None):
+        return ListFilterForm(data, **self.filters)
+
+    def rows(self, association, data=None, chunk_size=EXPORT_CHUNK_SIZE):
+        queryset = self.filter_form(data).filter(self.queryset(association))
+        lookups = [lookup for _, lookup in self.columns]
+        return queryset.order_by(*self.ordering).values_list(*lookups).iterator(chunk_size=chunk_size)
+
+    def write(self, rows, fmt, batch=STREAM_BATCH_SIZE):
+        if fmt == "xlsx":
+            return xlsx_stream(self.header(), rows, sheet_name=self.title, batch=batch)
+        return csv_stream(self.header(), rows, batch=batch)
+
+    def stream(self, association, fmt, data=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """Byte chunks of the whole export; nothing is queried until the first chunk is requested."""
+        return self.write(self.rows(association, data, chunk_size), fmt)
+
+
+class InvoiceItemExport(TabularExport):
+    def queryset(self, association):
+        return InvoiceItem.objects.filter(invoice__customer__association=association)
+
+
+class ReadingExport(TabularExport):
+    def queryset(self, association):
+        return MeterReading.objects.filter(association=association)
+
+
+class PeriodTaxExport(TabularExport):
+    def queryset(self, association):
+        return PeriodTax.objects.filter(association=association)
+
+
+TABULAR_EXPORTS = {
+    export.name: export for export in [
+        InvoiceItemExport(
+            name="invoices",
+            title="Sąskaitos",
+            columns=(
+                ("Sąskaita", "invoice__number"),
+                ("Data", "invoice__date"),
+                ("Metai", "invoice__period__year"),
+                ("Mėnuo", "invoice__period__month"),
+                ("Klientas", "invoice__customer__full_name"),
+                ("Sąskaitos suma", "invoice__total_amount"),
+                ("Balansas", "invoice__balance"),
+                ("Mokėti", "invoice__payable_amount"),
+                ("Eilutė", "description"),
+                ("Skaitiklis", "meter__ser_num"),
+                ("Suvartota", "consumed"),
+                ("Kiekis", "quantity"),
+                ("Vieneto kaina", "unit_price"),
+                ("Suma", "total"),
+            ),
+            ordering=("invoice__period__year", "invoice__period__month", "invoice__number", "id"),
+            filters={"period": "invoice__period"},
+        ),
+        ReadingExport(
+            name="readings",
+            title="Rodmenys",
+            columns=(
+                ("Metai", "period__year"),
+                ("Mėnuo", "period__month"),
+                ("Klientas", "meter__customer__full_name"),
+                ("Skaitiklis", "meter__ser_num"),
+                ("Tipas", "meter_type"),
+                ("Rodmuo", "value"),
+            ),
+            ordering=("period_ordinal", "meter_type", "id"),
+            filters={"period_ordinal": "period_ordinal", "meter_type": "meter_type"},
+        ),
+        PeriodTaxExport(
+            name="period_taxes",
+            title="Periodų mokesčiai",
+            columns=(
+                ("Metai", "period__year"),
+                ("Mėnuo", "period__month"),
+                ("Mokestis", "tax_type__name"),
+                ("Paskirstymas", "tax_type__distribution_type"),
+                ("Skaitiklio tipas", "tax_type__meter_type"),
+                ("Suma", "amount"),
+                ("Valiuta", "tax_type__currency"),
+            ),
+            ordering=("period__year", "period__month", "tax_type__name", "id"),
+            filters={"period": "period"},
+        ),
+    ]
+}
+TABULAR_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
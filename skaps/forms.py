@@ -1,7 +1,11 @@
 from django import forms
 from django.forms import inlineformset_factory
 
-from .models import TaxType, PeriodTax, Period, Meter, MeterReading, Customer, Association
+from django.db.models import Q
+
+from .models import (
+    METER_TYPES, period_ordinal, TaxType, PeriodTax, Period, Meter, MeterReading, Customer, Association, LedgerEntry
+)
 
 
 class AssociationForm(forms.ModelForm):
@@ -59,11 +63,90 @@ class MeterReadingForm(forms.ModelForm):
             "value": forms.NumberInput(attrs={"class": "form-control", "step": "0.01"}),
         }
 
+    def validate_unique(self):
+        # tikrasis rodmuo įrašomas vietoj įvertinto, ne šalia jo
+        estimated = None
+        if self.instance._state.adding and self.instance.meter_id and self.instance.period_id:
+            estimated = MeterReading.objects.filter(
+                meter_id=self.instance.meter_id, period_id=self.instance.period_id, is_estimated=True
+            ).first()
+        if estimated is not None:
+            self.instance.id = estimated.id
+            self.instance.created_at = estimated.created_at
+            self.instance.estimated_value = estimated.estimated_value
+            self.instance._state.adding = False
+        super().validate_unique()
+
+
+class ReadingImportForm(forms.Form):
+    file = forms.FileField(
+        label="Rodmenų failas (CSV arba XLSX)",
+        help_text="Stulpeliai: ser_num, year, month, value",
+        widget=forms.ClearableFileInput(attrs={"class": "form-control", "accept": ".csv,.xlsx"}),
+    )
+
+
+class ListFilterForm(forms.Form):
+    """GET filters shared by the list views; each view declares which lookups they map to."""
+    q = forms.CharField(required=False, label="Paieška",
+                        widget=forms.TextInput(attrs={"class": "form-control", "placeholder": "Paieška"}))
+    meter_type = forms.ChoiceField(required=False, label="Skaitiklio tipas",
+                                   choices=[("", "Visi tipai")] + METER_TYPES,
+                                   widget=forms.Select(attrs={"class": "form-select"}))
+    period_from = forms.RegexField(r"^\d{4}-\d{2}$", required=False, label="Nuo",
+                                   widget=forms.TextInput(attrs={"class": "form-control", "placeholder": "YYYY-MM"}))
+    period_to = forms.RegexField(r"^\d{4}-\d{2}$", required=False, label="Iki",
+                                 widget=forms.TextInput(attrs={"class": "form-control", "placeholder": "YYYY-MM"}))
+
+    def __init__(self, data=None, search=(), meter_type=None, period=None, period_ordinal=None, distinct=False):
+        super().__init__(data)
+        self.search_fields = search
+        self.meter_type_field = meter_type
+        self.period_field = period
+        # jei lentelė turi periodo eilės numerį, intervalas filtruojamas be JOIN
+        self.period_ordinal_field = period_ordinal
+        # filtras per daug-su-daug ryšį (pvz. kliento skaitikliai) gali dubliuoti eilutes
+        self.distinct = distinct
+        # rodomi tik laukai, kuriuos sąrašas palaiko
+        if not search:
+            del self.fields["q"]
+        if not meter_type:
+            del self.fields["meter_type"]
+        if not (period or period_ordinal):
+            del self.fields["period_from"]
+            del self.fields["period_to"]
+
+    def filter(self, queryset):
+        if not self.is_valid():
+            return queryset
+        data = self.cleaned_data
+        if data.get("q"):
+            query = Q()
+            for field in self.search_fields:
+                query |= Q(**{f"{field}__icontains": data["q"]})
+            queryset = queryset.filter(query)
+        if data.get("meter_type"):
+            queryset = queryset.filter(**{self.meter_type_field: data["meter_type"]})
+        for key, op in (("period_from", "gt"), ("period_to", "lt")):
+            if not data.get(key):
+                continue
+            year, month = map(int, data[key].split("-"))
+            if self.period_ordinal_field:
+                queryset = queryset.filter(**{f"{self.period_ordinal_field}__{op}e": period_ordinal(year, month)})
+            else:
+                queryset = queryset.filter(
+                    Q(**{f"{self.period_field}__year__{op}": year})
+                    | Q(**{f"{self.period_field}__year": year, f"{self.period_field}__month__{op}e": month})
+                )
+        if self.distinct and data.get("meter_type"):
+            queryset = queryset.distinct()
+        return queryset
+
 
 class CustomerForm(forms.ModelForm):
     class Meta:
         model = Customer
-        fields = ["association", "full_name", "email", "phone", "address", "floor_area", "balance"]
+        fields = ["association", "full_name", "email", "phone", "address", "floor_area"]
         widgets = {
             "association": forms.Select(attrs={"class": "form-select"}),
             "full_name": forms.TextInput(attrs={"class": "form-control"}),
@@ -71,9 +154,25 @@ class CustomerForm(forms.ModelForm):
             "phone": forms.TextInput(attrs={"class": "form-control"}),
             "address": forms.TextInput(attrs={"class": "form-control"}),
             "floor_area": forms.NumberInput(attrs={"class": "form-control", "step": "0.01"}),
-            "balance": forms.NumberInput(attrs={"class": "form-control", "step": "0.01"}),
         }
 
+
+class LedgerEntryForm(forms.ModelForm):
+    """Manual ledger posting: a payment received or a balance adjustment."""
+    class Meta:
+        model = LedgerEntry
+        fields = ["kind", "amount", "note"]
+        widgets = {
+            "kind": forms.Select(attrs={"class": "form-select"}),
+            "amount": forms.NumberInput(attrs={"class": "form-control", "step": "0.01"}),
+            "note": forms.TextInput(attrs={"class": "form-control"}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # sąskaitos įrašomos tik generuojant sąskaitas
+        self.fields["kind"].choices = [c for c in LedgerEntry.KIND_CHOICES if c[0] != "invoice"]
+
 # Inline formset – skaitikliams priskirti klientui
 class MeterForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,275 @@
+"""
+Streaming meter reading import.
+
+Rows are read one at a time from CSV (or XLSX through openpyxl's read-only
+mode), matched to a Meter by ser_num and to a Period by year/month, checked
+against the meter's previous and next readings and upserted in batches with
+bulk_create(update_conflicts=True). Only the current batch, the meter and
+period maps and the last value per meter are held in memory.
+
+Expected columns: ser_num, year, month, value (or period as "YYYY-MM"
+instead of year and month). Rows may name the meter by its id ("meter")
+instead of ser_num, which is required when several meters share a serial
+number.
+"""
+import csv
+import io
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from .anomalies import detect_anomalies
+from .consumption import rebuild_consumption
+from .models import Association, Meter, MeterReading, Period
+from .rebilling import mark_stale_for_readings
+
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+# MeterReading.value: max_digits=10, decimal_places=2
+MAX_READING_VALUE = Decimal("100000000")
+
+
+class RowError(Exception):
+    pass
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    upserted: int = 0
+    error_count: int = 0
+    errors: list = field(default_factory=list)
+    duration: float = 0.0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.duration if self.duration else 0
+
+
+def iter_csv_rows(binary_file):
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    for row in csv.DictReader(text, dialect=dialect):
+        yield {(k or "").strip().lower(): (v or "").strip() for k, v in row.items()}
+
+
+def iter_xlsx_rows(binary_file):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("XLSX importui reikalingas openpyxl paketas.")
+
+    workbook = load_workbook(binary_file, read_only=True, data_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    header = [str(h or "").strip().lower() for h in next(rows, [])]
+    for values in rows:
+        yield {h: "" if v is None else str(v).strip() for h, v in zip(header, values)}
+    workbook.close()
+
+
+def iter_json_rows(items):
+    """Rows from a list of JSON objects; values are read as strings, like CSV cells."""
+    for item in items:
+        if not isinstance(item, dict):
+            yield {}
+            continue
+        yield {str(k).lower(): "" if v is None else str(v).strip() for k, v in item.items()}
+
+
+def iter_rows(binary_file, filename):
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        return iter_xlsx_rows(binary_file)
+    return iter_csv_rows(binary_file)
+
+
+class ReadingImporter:
+    """Validates rows and upserts MeterReading rows batch by batch."""
+
+    def __init__(self, association=None, batch_size=IMPORT_BATCH_SIZE):
+        self.association = association
+        self.batch_size = batch_size
+        self.result = ImportResult()
+
+        meters = Meter.objects.all()
+        if association is not None:
+            meters = meters.filter(customer__association=association)
+        self.meters = {}
+        self.meter_ids = {}
+        self.ambiguous = set()  # ser_num, kurį turi keli skaitikliai
+        self.customer_ids = {}  # meter_id -> customer_id
+        for meter_id, ser_num, association_id, meter_type, customer_id in meters.values_list(
+            "id", "ser_num", "customer__association_id", "meter_type", "customer_id"
+        ):
+            self.meter_ids[str(meter_id)] = (meter_id, association_id, meter_type)
+            self.customer_ids[meter_id] = customer_id
+            if ser_num in self.meters:
+                self.ambiguous.add(ser_num)
+            elif ser_num:
+                self.meters[ser_num] = (meter_id, association_id, meter_type)
+
+        self.periods = {(p.year, p.month): p for p in Period.objects.all()}
+        self.last_values = {}  # meter_id -> (ordinal, value) paskutinis matytas faile
+        self.touched = set()   # (association_id, period_id, meter_id)
+
+    def parse(self, row):
+        if not row:
+            raise RowError("Tuščia eilutė.")
+        if row.get("meter"):
+            meter = self.meter_ids.get(row["meter"].lower())
+            if meter is None:
+                raise RowError(f"Nežinomas skaitiklis '{row['meter']}'.")
+        else:
+            ser_num = row.get("ser_num") or row.get("serial") or ""
+            if ser_num in self.ambiguous:
+                raise RowError(f"Keli skaitikliai turi numerį '{ser_num}' – nurodykite skaitiklio id.")
+            if ser_num not in self.meters:
+                raise RowError(f"Nežinomas skaitiklis '{ser_num}'.")
+            meter = self.meters[ser_num]
+        meter_id, association_id, meter_type = meter
+
+        try:
+            if row.get("period"):
+                year, month = (int(x) for x in row["period"].split("-")[:2])
+            else:
+                year, month = int(row.get("year", "")), int(row.get("month", ""))
+        except ValueError:
+            raise RowError("Neteisingas periodas.")
+        period = self.periods.get((year, month))
+        if period is None:
+            raise RowError(f"Periodas {year}-{month:02d} neegzistuoja.")
+
+        try:
+            value = Decimal(row.get("value", "").replace(",", "."))
+        except InvalidOperation:
+            raise RowError(f"Neteisinga reikšmė '{row.get('value')}'.")
+        if value < 0:
+            raise RowError("Rodmuo negali būti neigiamas.")
+        if value >= MAX_READING_VALUE:
+            raise RowError(f"Rodmuo {value} per didelis.")
+
+        return meter_id, association_id, meter_type, period, value
+
+    def _neighbour_values(self, batch):
+        """
+        Stored real readings of the calendar-previous and -next periods for
+        every row of the batch: ({(meter_id, period_id): value}, same for
+        next). A reading past an estimate is its true-up, not an error.
+        """
+        wanted = {}
+        for _, meter_id, _, _, period, _ in batch:
+            wanted[(meter_id, period.ordinal - 1)] = (meter_id, period.id, 0)
+            wanted[(meter_id, period.ordinal + 1)] = (meter_id, period.id, 1)
+
+        readings = MeterReading.objects.filter(
+            meter_id__in={m for m, _ in wanted}, period_ordinal__in={o for _, o in wanted}, is_estimated=False
+        ).values_list("meter_id", "period_ordinal", "value")
+        neighbours = ({}, {})
+        for m, o, v in readings:
+            if (m, o) in wanted:
+                meter_id, period_id, side = wanted[(m, o)]
+                neighbours[side][(meter_id, period_id)] = v
+        return neighbours
+
+    def flush(self, batch):
+        if not batch:
+            return
+        previous_values, next_values = self._neighbour_values(batch)
+
+        readings = {}
+        now = timezone.now()
+        for line, meter_id, association_id, meter_type, period, value in batch:
+            ordinal = period.ordinal
+            previous = previous_values.get((meter_id, period.id))
+            seen = self.last_values.get(meter_id)
+            if seen and seen[0] == ordinal - 1:
+                previous = seen[1]
+            following = next_values.get((meter_id, period.id))
+            if seen and seen[0] == ordinal + 1:
+                following = seen[1]
+            if previous is not None and value < previous:
+                self.result.add_error(line, f"Rodmuo {value} mažesnis už ankstesnį ({previous}).")
+                continue
+            if following is not None and value > following:
+                self.result.add_error(line, f"Rodmuo {value} didesnis už vėlesnį ({following}).")
+                continue
+            if (meter_id, period.id) in readings:
+                self.result.add_error(line, "Pasikartojantis skaitiklio ir periodo rodmuo – imamas paskutinis.")
+
+            readings[(meter_id, period.id)] = MeterReading(
+                meter_id=meter_id, period=period, value=value, created_at=now, updated_at=now
+            ).denormalize(association_id, meter_type, period)
+            if not seen or seen[0] <= ordinal:
+                self.last_values[meter_id] = (ordinal, value)
+            self.touched.add((association_id, period.id, meter_id))
+
+        with transaction.atomic():
+            MeterReading.objects.bulk_create(
+                readings.values(),
+                batch_size=self.batch_size,
+                update_conflicts=True,
+                unique_fields=["meter", "period"],
+                # tikrasis rodmuo pakeičia įvertintą; estimated_value lieka
+                update_fields=["value", "is_estimated", "updated_at"],
+            )
+        self.result.upserted += len(readings)
+
+    def run(self, rows, first_line=2):
+        started = time.perf_counter()
+        batch = []
+        # faile antraštė yra 1-a eilutė; JSON masyvo elementai numeruojami nuo 0
+        for line, row in enumerate(rows, start=first_line):
+            self.result.rows += 1
+            try:
+                batch.append((line, *self.parse(row)))
+            except RowError as e:
+                self.result.add_error(line, str(e))
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        self.flush(batch)
+        self.finish()
+        self.result.errors.sort()
+        self.result.duration = time.perf_counter() - started
+        return self.result
+
+    def finish(self):
+        # bulk_create aplenkia signalus – žurnalą ir sąskaitų būseną atnaujiname patys
+        association_ids = {a for a, _, _ in self.touched}
+        for association in Association.objects.filter(id__in=association_ids):
+            rebuild_consumption(association)
+            detect_anomalies(association.id)
+
+        next_periods = {}
+        for p in self.periods.values():
+            year, month = (p.year + 1, 1) if p.month == 12 else (p.year, p.month + 1)
+            if (year, month) in self.periods:
+                next_periods[p.id] = self.periods[(year, month)].id
+        # kaip rodmens signalas: kliento sąskaitos ir to tipo proporcingi mokesčiai
+        changed = defaultdict(lambda: (set(), set()))
+        meter_types = {meter_id: meter_type for meter_id, _, meter_type in self.meter_ids.values()}
+        for association_id, period_id, meter_id in self.touched:
+            customers, types = changed[(association_id, period_id)]
+            customers.add(self.customer_ids[meter_id])
+            types.add(meter_types[meter_id])
+        for (association_id, period_id), (customers, types) in changed.items():
+            periods = [period_id, next_periods[period_id]] if period_id in next_periods else [period_id]
+            mark_stale_for_readings(association_id, periods, customers, types)
+
+
+def import_readings(binary_file, filename, association=None, batch_size=IMPORT_BATCH_SIZE):
+    importer = ReadingImporter(association=association, batch_size=batch_size)
+    return importer.run(iter_rows(binary_file, filename))
@@ -0,0 +1,157 @@
+"""
+Lightweight instrumentation: SQL query counting, timing spans and an
+in-process metrics registry exported as JSON or Prometheus text.
+"""
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.db import connection
+
+logger = logging.getLogger("skaps.instrumentation")
+
+# Ta pati SQL užklausa tiek kartų per vieną užklausą – įtariamas N+1
+N_PLUS_ONE_THRESHOLD = 5
+
+
+class QueryCounter:
+    """Context manager counting the SQL queries and wall time of a block."""
+
+    def __init__(self, using=None):
+        self.connection = using or connection
+        self.queries = 0
+        self.db_time = 0.0
+        self.wall_time = 0.0
+        self.statements = Counter()
+        self._wrapper = None
+        self._started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+            self.statements[sql] += 1
+
+    def __enter__(self):
+        self._wrapper = self.connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wall_time = time.perf_counter() - self._started
+        self._wrapper.__exit__(exc_type, exc, tb)
+        return False
+
+    @property
+    def repeated_statements(self):
+        """SQL templates executed at least N_PLUS_ONE_THRESHOLD times."""
+        return {sql: n for sql, n in self.statements.items() if n >= N_PLUS_ONE_THRESHOLD}
+
+
+@contextmanager
+def timed_span(name, log=logger, **fields):
+    """Logs the duration (and query count) of a block as one structured record."""
+    with QueryCounter() as counter:
+        yield counter
+    log.debug(
+        "%s took %.1f ms, %d queries", name, counter.wall_time * 1000, counter.queries,
+        extra={"span": name, "duration_ms": counter.wall_time * 1000, "queries": counter.queries, **fields},
+    )
+
+
+class ViewStats:
+    __slots__ = ("requests", "wall_time", "max_wall_time", "queries", "db_time", "n_plus_one")
+
+    def __init__(self):
+        self.requests = 0
+        self.wall_time = 0.0
+        self.max_wall_time = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.n_plus_one = 0
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "wall_time": self.wall_time,
+            "avg_wall_time": self.wall_time / self.requests if self.requests else 0,
+            "max_wall_time": self.max_wall_time,
+            "queries": self.queries,
+            "avg_queries": self.queries / self.requests if self.requests else 0,
+            "db_time": self.db_time,
+            "n_plus_one": self.n_plus_one,
+        }
+
+
+class MetricsRegistry:
+    """Process-local metrics: per-view request stats plus named counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.views = defaultdict(ViewStats)
+        self.counters = Counter()
+
+    def record_view(self, view_name, counter):
+        with self._lock:
+            stats = self.views[view_name]
+            stats.requests += 1
+            stats.wall_time += counter.wall_time
+            stats.max_wall_time = max(stats.max_wall_time, counter.wall_time)
+            stats.queries += counter.queries
+            stats.db_time += counter.db_time
+            if counter.repeated_statements:
+                stats.n_plus_one += 1
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def reset(self):
+        with self._lock:
+            self.views.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "views": {name: stats.as_dict() for name, stats in sorted(self.views.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def prometheus(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        data = self.snapshot()
+        lines = []
+        view_metrics = [
+            ("skaps_view_requests_total", "counter", "requests", "Requests handled per view"),
+            ("skaps_view_wall_seconds_total", "counter", "wall_time", "Wall time spent per view"),
+            ("skaps_view_wall_seconds_max", "gauge", "max_wall_time", "Slowest request per view"),
+            ("skaps_view_queries_total", "counter", "queries", "SQL queries per view"),
+            ("skaps_view_db_seconds_total", "counter", "db_time", "Database time per view"),
+            ("skaps_view_n_plus_one_total", "counter", "n_plus_one", "Requests with repeated identical SQL"),
+        ]
+        for metric, kind, key, help_text in view_metrics:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for view, stats in data["views"].items():
+                lines.append(f'{metric}{{view="{_escape(view)}"}} {stats[key]}')
+
+        if data["counters"]:
+            lines.append("# HELP skaps_events_total Application event counters")
+            lines.append("# TYPE skaps_events_total counter")
+            for name, value in data["counters"].items():
+                lines.append(f'skaps_events_total{{name="{_escape(name)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = MetricsRegistry()
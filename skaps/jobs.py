@@ -0,0 +1,138 @@
+"""
+DB-backed invoice job queue.
+
+Views only enqueue an InvoiceJob; the run_invoice_worker command claims
+jobs and runs them off the request path. Association jobs go through
+generate_association_invoices() like the command line, committing their
+invoices chunk by chunk together with the job's progress. A job whose
+worker died (no heartbeat for STALE_AFTER) is picked up again and runs
+from the start; the committed invoices are unchanged, so they are skipped.
+"""
+import logging
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .billing import generate_association_invoices, generate_invoice
+from .instrumentation import QueryCounter
+from .models import InvoiceJob
+
+logger = logging.getLogger("skaps.jobs")
+
+JOB_CHUNK_SIZE = 50
+STALE_AFTER = timedelta(minutes=5)
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_invoice_job(association, period, customer=None, estimate=False):
+    """Queues a run; an identical pending/running job is reused instead of duplicated."""
+    active = InvoiceJob.objects.filter(
+        association=association, period=period, customer=customer, estimate=estimate,
+        status__in=["pending", "running"],
+    ).first()
+    if active:
+        return active
+    return InvoiceJob.objects.create(association=association, period=period, customer=customer, estimate=estimate)
+
+
+def claim_next_job(worker):
+    """Atomically takes the oldest pending job, or a running one whose worker went silent."""
+    stale = timezone.now() - STALE_AFTER
+    candidates = InvoiceJob.objects.filter(
+        Q(status="pending") | Q(status="running", heartbeat_at__lt=stale)
+    ).order_by("created_at")[:10]
+
+    for job in candidates:
+        now = timezone.now()
+        # optimistinis užraktas: pavyks tik vienam darbuotojui
+        claimed = InvoiceJob.objects.filter(
+            id=job.id, status=job.status, heartbeat_at=job.heartbeat_at
+        ).update(
+            status="running",
+            worker=worker,
+            heartbeat_at=now,
+            started_at=job.started_at or now,
+            attempts=F("attempts") + 1,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def _run_customer_job(job):
+    customer = job.customer
+    customer.association = job.association
+    job.progress_total = 1
+    with transaction.atomic():
+        job.invoice = generate_invoice(customer, job.period)
+        job.progress_done = 1
+        job.invoices_created = 1 if job.invoice else 0
+        job.save(update_fields=["invoice", "progress_done", "progress_total", "invoices_created", "updated_at"])
+
+
+def _run_association_job(job):
+    def save_progress(run):
+        job.progress_done = run.customers
+        job.progress_total = run.total_customers
+        job.invoices_created = len(run.invoices)
+        job.estimated = run.estimated
+        job.anomalies = run.anomalies
+        job.heartbeat_at = timezone.now()
+        job.save(update_fields=[
+            "progress_done", "progress_total", "invoices_created", "estimated", "anomalies", "heartbeat_at",
+            "updated_at",
+        ])
+
+    # pakartotinai paimta užduotis pradedama iš naujo: jau įrašytos sąskaitos
+    # išeina "unchanged" ir neperrašomos, o nauji ar pervadinti klientai nepraleidžiami
+    generate_association_invoices(
+        job.association, job.period, estimate=job.estimate, chunk_size=JOB_CHUNK_SIZE, on_chunk=save_progress
+    )
+
+
+def run_job(job):
+    with QueryCounter() as counter:
+        try:
+            if job.customer_id:
+                _run_customer_job(job)
+            else:
+                _run_association_job(job)
+        except Exception:
+            logger.exception("invoice job %s failed", job.id)
+            job.status = "failed"
+            job.error = traceback.format_exc()
+        else:
+            job.status = "done"
+            job.error = ""
+
+    job.finished_at = timezone.now()
+    job.wall_time += counter.wall_time
+    job.queries += counter.queries
+    job.save()
+    logger.info(
+        "invoice job %s %s: %d/%d customers in %.1f ms, %d queries",
+        job.id, job.status, job.progress_done, job.progress_total, counter.wall_time * 1000, counter.queries,
+        extra={"job": str(job.id), "status": job.status},
+    )
+    return job
+
+
+def run_pending_jobs(worker=None, limit=None):
+    """Processes queued jobs until the queue is empty (or limit is reached)."""
+    worker = worker or worker_name()
+    processed = []
+    while limit is None or len(processed) < limit:
+        job = claim_next_job(worker)
+        if job is None:
+            break
+        processed.append(run_job(job))
+    return processed
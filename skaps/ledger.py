@@ -0,0 +1,127 @@
+"""
+Customer ledger.
+
+Every account movement is an append-only LedgerEntry with a per-customer
+sequence number. Every SNAPSHOT_EVERY entries a BalanceSnapshot records the
+running balance, so the current balance is the latest snapshot plus the sum
+of at most SNAPSHOT_EVERY newer entries, and with_balances() gets it for a
+whole customer queryset in one query.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import BalanceSnapshot, Customer, LedgerEntry
+from .reporting import refresh_collected
+
+SNAPSHOT_EVERY = 50
+# kliento suvestinėje rodoma įrašų
+HISTORY_LIMIT = 20
+ZERO = Decimal("0.00")
+
+
+def _money(expression):
+    return Coalesce(expression, Value(ZERO), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def with_balances(queryset):
+    """
+    Annotates customers with ledger_balance and ledger_sequence (the last
+    posted entry) using correlated subqueries over the (customer, sequence)
+    indexes.
+    """
+    latest = BalanceSnapshot.objects.filter(customer=OuterRef("pk")).order_by("-sequence")
+    tail = LedgerEntry.objects.filter(
+        customer=OuterRef("pk"), sequence__gt=OuterRef("snapshot_sequence")
+    ).order_by().values("customer").annotate(total=Sum("amount")).values("total")
+    last = LedgerEntry.objects.filter(customer=OuterRef("pk")).order_by("-sequence").values("sequence")[:1]
+    return queryset.annotate(
+        snapshot_sequence=Coalesce(Subquery(latest.values("sequence")[:1]), Value(0)),
+        snapshot_balance=_money(Subquery(latest.values("balance")[:1])),
+    ).annotate(
+        ledger_balance=F("snapshot_balance") + _money(Subquery(tail)),
+        ledger_sequence=Coalesce(Subquery(last), Value(0)),
+    )
+
+
+def balances_for(customer_ids):
+    """{customer_id: (balance, last sequence)} for many customers in one query."""
+    rows = with_balances(Customer.objects.filter(id__in=customer_ids)).values_list(
+        "id", "ledger_balance", "ledger_sequence"
+    )
+    return {customer_id: (Decimal(balance), sequence) for customer_id, balance, sequence in rows}
+
+
+def current_balance(customer):
+    return balances_for([customer.id]).get(customer.id, (ZERO, 0))[0]
+
+
+class LedgerWriter:
+    """
+    Collects entries for many customers and writes them (with due snapshots)
+    in bulk. Must be created inside a transaction: the customer rows stay
+    locked until it ends, so concurrent writers cannot take the same sequence.
+    """
+
+    def __init__(self, customer_ids):
+        # id tvarka – kad lygiagretūs rašytojai neužsirakintų vienas kito
+        list(Customer.objects.select_for_update().filter(id__in=customer_ids).order_by("id").values_list("id"))
+        self.state = balances_for(customer_ids)
+        self.entries = []
+        self.snapshots = []
+
+    def balance(self, customer_id):
+        return self.state.get(customer_id, (ZERO, 0))[0]
+
+    def post(self, customer_id, kind, amount, invoice=None, note=""):
+        balance, sequence = self.state.get(customer_id, (ZERO, 0))
+        sequence += 1
+        balance += amount
+        self.state[customer_id] = (balance, sequence)
+        entry = LedgerEntry(
+            customer_id=customer_id, sequence=sequence, kind=kind, amount=amount, invoice=invoice, note=note
+        )
+        self.entries.append(entry)
+        if sequence % SNAPSHOT_EVERY == 0:
+            self.snapshots.append(BalanceSnapshot(customer_id=customer_id, sequence=sequence, balance=balance))
+        return entry
+
+    def save(self, batch_size=500):
+        LedgerEntry.objects.bulk_create(self.entries, batch_size=batch_size)
+        BalanceSnapshot.objects.bulk_create(self.snapshots, batch_size=batch_size)
+
+
+def post_entry(customer, kind, amount, invoice=None, note=""):
+    """Appends one entry; LedgerWriter locks the customer row so sequences stay gapless."""
+    with transaction.atomic():
+        writer = LedgerWriter([customer.id])
+        entry = writer.post(customer.id, kind, Decimal(amount), invoice=invoice, note=note)
+        writer.save()
+        if kind == "payment":
+            refresh_collected(customer.association_id, entry.created_at)
+    return entry
+
+
+def payable(total_amount, balance):
+    # išankstinė įmoka mažina, skola didina mokėtiną sumą
+    return max(total_amount - balance, ZERO)
+
+
+def latest_entries(customer, limit=HISTORY_LIMIT):
+    return LedgerEntry.objects.filter(customer=customer).order_by("-sequence")[:limit]
+
+
+def balance_history(customer, limit=HISTORY_LIMIT):
+    """Latest `limit` entries with the balance after each, newest first: one range read plus the balance."""
+    return running_balances(list(latest_entries(customer, limit)), current_balance(customer))
+
+
+def running_balances(entries, balance):
+    """(entry, balance after it) for entries newest first, the newest ending at `balance`."""
+    history = []
+    for entry in entries:
+        history.append((entry, balance))
+        balance -= entry.amount
+    return history
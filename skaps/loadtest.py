@@ -0,0 +1,151 @@
+"""
+HTTP load test of the read views over WSGI and ASGI.
+
+serve() starts the project in a child process: "wsgi" is Django's threaded
+WSGI server (runserver), "asgi-sync" is uvicorn running the sync views in
+its thread pool and "asgi" is uvicorn with skaps.async_views, so the three
+differ only in the server path. load() keeps `concurrency` requests in
+flight over plain asyncio streams and measures throughput and latency.
+"""
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.urls import reverse
+
+from .billing import generate_invoice
+
+# serveris -> SKAPS_ASYNC_VIEWS
+SERVERS = {"wsgi": "0", "asgi-sync": "0", "asgi": "1"}
+
+
+class ServerError(Exception):
+    pass
+
+
+@dataclass
+class LoadResult:
+    requests: int
+    errors: int
+    elapsed: float
+    latencies: list
+
+    @property
+    def throughput(self):
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, q):
+        if len(self.latencies) < 2:
+            return self.latencies[0] if self.latencies else 0.0
+        return statistics.quantiles(self.latencies, n=100)[q - 1]
+
+
+def server_command(kind, host, port):
+    if kind == "wsgi":
+        return [sys.executable, "-m", "django", "runserver", "--noreload", "--skip-checks", f"{host}:{port}"]
+    return [
+        sys.executable, "-m", "uvicorn", "simplecode.asgi:application", "--host", host, "--port", str(port),
+        "--log-level", "warning", "--no-access-log",
+    ]
+
+
+def _wait_for_port(process, host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise ServerError(f"Serveris baigė darbą su kodu {process.returncode}")
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise ServerError(f"Serveris neatsiliepė per {timeout} s")
+
+
+@contextmanager
+def serve(kind, host="127.0.0.1", port=8765, timeout=30):
+    """Runs the project under `kind` (see SERVERS) until the block ends."""
+    env = {
+        **os.environ,
+        "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "simplecode.settings"),
+        "SKAPS_ASYNC_VIEWS": SERVERS[kind],
+    }
+    process = subprocess.Popen(
+        server_command(kind, host, port), cwd=settings.BASE_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_for_port(process, host, port, timeout)
+        yield process
+    finally:
+        process.terminate()
+        process.wait(timeout)
+
+
+async def fetch(host, port, path):
+    """GETs `path` on a new connection and returns the status code."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    return int(status_line.split()[1])
+
+
+async def load(host, port, paths, concurrency=20, requests=500):
+    """Sends `requests` GETs cycling through `paths`, `concurrency` at a time."""
+    numbers = iter(range(requests))
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        # visi darbininkai ima iš to paties iteratoriaus
+        for number in numbers:
+            started = time.perf_counter()
+            try:
+                status = await fetch(host, port, paths[number % len(paths)])
+            except (OSError, ValueError, IndexError):
+                status = None
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return LoadResult(requests, errors, time.perf_counter() - started, latencies)
+
+
+def load_test_paths(dataset, customers=10):
+    """Dashboard, reading list, invoice and summary URLs of the first customers of the dataset."""
+    association = dataset.associations[0]
+    period = dataset.periods[-1]
+    paths = [reverse("association_summary_api", args=[association.id])]
+    for customer in association.customers.order_by("full_name")[:customers]:
+        invoice = generate_invoice(customer, period)
+        paths += [
+            reverse("customer_dashboard", args=[association.id, customer.id]),
+            reverse("meter_readings", args=[customer.id]),
+            reverse("invoice_detail", args=[customer.id, invoice.id]),
+        ]
+    return paths
+
+
+def run_load_test(paths, servers=tuple(SERVERS), host="127.0.0.1", port=8765, concurrency=20, requests=500):
+    """{server: LoadResult}; every server gets a short warm-up run first."""
+    results = {}
+    for kind in servers:
+        with serve(kind, host, port):
+            asyncio.run(load(host, port, paths, concurrency=concurrency, requests=len(paths)))
+            results[kind] = asyncio.run(load(host, port, paths, concurrency=concurrency, requests=requests))
+    return results
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from skaps.benchmarks import generate_dataset, memory_growth, profile_export
+from skaps.exports import TABULAR_EXPORTS, TABULAR_FORMATS
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Stream a tabular export of a synthetic association and sample memory (everything is rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000, help="Approximate number of meter readings")
+        parser.add_argument("--periods", type=int, default=12)
+        parser.add_argument("--format", dest="fmt", choices=sorted(TABULAR_FORMATS), default="csv")
+        parser.add_argument("--samples", type=int, default=10)
+        parser.add_argument("--max-growth", type=float, default=1.5,
+                            help="Fail if the final peak exceeds the first sample's peak by this factor")
+
+    def handle(self, *args, **options):
+        meters, periods = 2, options["periods"]
+        customers = -(-options["rows"] // (meters * periods))
+
+        try:
+            with transaction.atomic():
+                dataset = generate_dataset(customers=customers, meters=meters, periods=periods)
+                rows, written, samples = profile_export(
+                    TABULAR_EXPORTS["readings"], dataset.associations[0], fmt=options["fmt"],
+                    expected_rows=customers * meters * periods, samples=options["samples"],
+                )
+                raise Rollback
+        except Rollback:
+            pass
+
+        for sample in samples:
+            self.stdout.write(
+                f"{sample['rows']:>10} rows {sample['bytes'] / 2 ** 20:9.1f} MiB out "
+                f"{sample['current'] / 1024:9.0f} KiB now {sample['peak'] / 1024:9.0f} KiB peak"
+            )
+        growth = memory_growth(samples)
+        summary = f"{rows} rows, {written / 2 ** 20:.1f} MiB {options['fmt']}, peak growth ×{growth:.2f}"
+        if growth > options["max_growth"]:
+            raise CommandError(f"Memory is not flat: {summary}")
+        self.stdout.write(self.style.SUCCESS(summary))
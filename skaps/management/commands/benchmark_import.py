@@ -0,0 +1,64 @@
+import csv
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from skaps.importers import IMPORT_BATCH_SIZE, import_readings
+from skaps.models import Association, Customer, Meter, Period
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Measure reading import throughput on synthetic data (everything is rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000)
+        parser.add_argument("--meters", type=int, default=5_000)
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        rows, meter_count = options["rows"], options["meters"]
+        months = -(-rows // meter_count)
+
+        try:
+            with transaction.atomic():
+                association = Association.objects.create(name="Benchmark")
+                customers = Customer.objects.bulk_create(
+                    Customer(association=association, full_name=f"Bench {i}") for i in range(meter_count)
+                )
+                meters = Meter.objects.bulk_create(
+                    Meter(customer=c, meter_type="water", unit="m3", ser_num=f"BENCH{i:07d}")
+                    for i, c in enumerate(customers)
+                )
+                # 1900-ieji – kad nesusikirstų su tikrais periodais
+                periods = [Period.objects.get_or_create(year=1900 + m // 12, month=m % 12 + 1)[0]
+                           for m in range(months)]
+
+                with tempfile.TemporaryFile("w+b") as f:
+                    text = open(f.fileno(), "w", encoding="utf-8", newline="", closefd=False)
+                    writer = csv.writer(text)
+                    writer.writerow(["ser_num", "year", "month", "value"])
+                    written = 0
+                    for month, period in enumerate(periods):
+                        for meter in meters:
+                            if written == rows:
+                                break
+                            writer.writerow([meter.ser_num, period.year, period.month, month * 10])
+                            written += 1
+                    text.flush()
+                    f.seek(0)
+
+                    result = import_readings(f, "bench.csv", association, batch_size=options["batch_size"])
+
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.rows} rows, {result.upserted} upserted, {result.error_count} errors: "
+            f"{result.duration:.2f}s, {result.rows_per_second:.0f} rows/s"
+        ))
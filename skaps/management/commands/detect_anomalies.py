@@ -0,0 +1,32 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from skaps.anomalies import detect_anomalies
+from skaps.instrumentation import QueryCounter
+from skaps.models import Association
+
+
+class Command(BaseCommand):
+    help = "Check meter readings for decreases, rollovers, gaps and spikes (only readings changed since the last run)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("association_id", nargs="?", help="Association UUID (default: all)")
+        parser.add_argument("--rescan", action="store_true", help="Rebuild the statistics from the whole history")
+
+    def handle(self, *args, **options):
+        associations = Association.objects.all()
+        if options["association_id"]:
+            try:
+                associations = [associations.get(id=options["association_id"])]
+            except (Association.DoesNotExist, ValidationError):
+                raise CommandError(f"Association {options['association_id']} not found.")
+
+        for association in associations:
+            with QueryCounter() as counter:
+                run = detect_anomalies(association.id, rescan=options["rescan"])
+            self.stdout.write(self.style.SUCCESS(
+                f"{association.name}: {run.readings_scanned} readings "
+                f"({run.meters_rescanned} meters rescanned, {run.meters_extended} extended), "
+                f"{len(run.anomalies)} new anomalies, {association.reading_anomalies.count()} flagged, "
+                f"{counter.wall_time:.3f}s, {counter.queries} queries"
+            ))
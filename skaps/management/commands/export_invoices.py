@@ -0,0 +1,47 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from skaps.exports import EXPORT_FORMATS, export_period_invoices
+from skaps.models import Association, Period
+
+
+class Command(BaseCommand):
+    help = "Render every invoice of an association period into a zip (PDF and/or HTML) using a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument("association_id", help="Association UUID")
+        parser.add_argument("--year", type=int, required=True)
+        parser.add_argument("--month", type=int, required=True)
+        parser.add_argument("--format", dest="formats", action="append", choices=EXPORT_FORMATS,
+                            help="Repeat for several formats (default: pdf)")
+        parser.add_argument("--workers", type=int, default=None, help="Worker processes, 0 renders in-process")
+        parser.add_argument("--output", help="Zip path (default: invoices-<year>-<month>.zip)")
+
+    def handle(self, *args, **options):
+        try:
+            association = Association.objects.get(id=options["association_id"])
+        except (Association.DoesNotExist, ValidationError):
+            raise CommandError(f"Association {options['association_id']} not found.")
+
+        try:
+            period = Period.objects.get(year=options["year"], month=options["month"])
+        except Period.DoesNotExist:
+            raise CommandError(f"Period {options['year']}-{options['month']:02d} not found.")
+
+        output = options["output"] or f"invoices-{period.year}-{period.month:02d}.zip"
+        run = export_period_invoices(
+            association, period, output, formats=options["formats"] or ["pdf"], workers=options["workers"]
+        )
+
+        if options["verbosity"] > 1:
+            for name, seconds in run.timings:
+                self.stdout.write(f"{name}: {seconds * 1000:.1f} ms")
+        if run.slowest:
+            name, seconds = run.slowest
+            self.stdout.write(
+                f"render median {run.median_render_time * 1000:.1f} ms, slowest {name} {seconds * 1000:.1f} ms"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{association.name} {period}: {run.files} files, {run.bytes / 1024:.0f} KiB -> {output} "
+            f"in {run.wall_time:.3f}s"
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from skaps.benchmarks import generate_dataset
+
+
+class Command(BaseCommand):
+    help = "Create synthetic associations with customers, meters, readings and period taxes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--associations", type=int, default=1)
+        parser.add_argument("--customers", type=int, default=500, help="Customers per association")
+        parser.add_argument("--meters", type=int, default=2, help="Meters per customer")
+        parser.add_argument("--periods", type=int, default=24, help="Months of reading history")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            dataset = generate_dataset(
+                associations=options["associations"],
+                customers=options["customers"],
+                meters=options["meters"],
+                periods=options["periods"],
+                seed=options["seed"],
+            )
+        readings = options["associations"] * options["customers"] * options["meters"] * options["periods"]
+        self.stdout.write(self.style.SUCCESS(
+            f"Sukurta {len(dataset.associations)} bendrijų, {readings} rodmenų "
+            f"({dataset.periods[0]} – {dataset.periods[-1]})"
+        ))
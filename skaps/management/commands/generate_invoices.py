@@ -0,0 +1,38 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from skaps.billing import generate_association_invoices
+from skaps.models import Association, Period
+
+
+class Command(BaseCommand):
+    help = "Generate invoices for every customer of an association for one period."
+
+    def add_arguments(self, parser):
+        parser.add_argument("association_id", help="Association UUID")
+        parser.add_argument("--year", type=int, required=True)
+        parser.add_argument("--month", type=int, required=True)
+        parser.add_argument("--estimate", action="store_true",
+                            help="Estimate missing readings from each meter's past consumption")
+
+    def handle(self, *args, **options):
+        try:
+            association = Association.objects.get(id=options["association_id"])
+        except (Association.DoesNotExist, ValidationError):
+            raise CommandError(f"Association {options['association_id']} not found.")
+
+        try:
+            period = Period.objects.get(year=options["year"], month=options["month"])
+        except Period.DoesNotExist:
+            raise CommandError(f"Period {options['year']}-{options['month']:02d} not found.")
+
+        run = generate_association_invoices(association, period, estimate=options["estimate"])
+
+        for customer in run.skipped:
+            self.stdout.write(f"skipped: {customer.full_name}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{association.name} {period}: {len(run.invoices)}/{run.customers} invoices, "
+            f"{run.wall_time:.3f}s wall, {run.queries} queries ({run.db_time:.3f}s db)"
+        ))
+        if run.estimated:
+            self.stdout.write(f"estimated readings: {run.estimated}")
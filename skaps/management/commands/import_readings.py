@@ -0,0 +1,35 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from skaps.importers import IMPORT_BATCH_SIZE, import_readings
+from skaps.models import Association
+
+
+class Command(BaseCommand):
+    help = "Import meter readings from a CSV or XLSX file (columns: ser_num, year, month, value)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--association", help="Only match meters of this association UUID")
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        association = None
+        if options["association"]:
+            try:
+                association = Association.objects.get(id=options["association"])
+            except (Association.DoesNotExist, ValidationError):
+                raise CommandError(f"Association {options['association']} not found.")
+
+        try:
+            with open(options["path"], "rb") as f:
+                result = import_readings(f, options["path"], association, batch_size=options["batch_size"])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for line, message in result.errors:
+            self.stderr.write(f"line {line}: {message}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.upserted}/{result.rows} readings imported, {result.error_count} errors, "
+            f"{result.duration:.2f}s ({result.rows_per_second:.0f} rows/s)"
+        ))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from skaps.benchmarks import generate_dataset
+from skaps.loadtest import SERVERS, ServerError, load_test_paths, run_load_test
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the read views under WSGI (runserver) and ASGI (uvicorn, sync and async views) "
+        "on a synthetic association, deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customers", type=int, default=200)
+        parser.add_argument("--meters", type=int, default=2)
+        parser.add_argument("--periods", type=int, default=12)
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--server", dest="servers", action="append", choices=list(SERVERS),
+                            help="Server to test (repeatable); all by default")
+
+    def handle(self, *args, **options):
+        servers = options["servers"] or list(SERVERS)
+        if any(kind.startswith("asgi") for kind in servers):
+            try:
+                import uvicorn  # noqa: F401
+            except ImportError:
+                raise CommandError("ASGI apkrovos testui reikalingas uvicorn paketas.")
+
+        # serveriai – atskiri procesai, todėl duomenys įrašomi, o ne atšaukiami
+        dataset = generate_dataset(customers=options["customers"], meters=options["meters"], periods=options["periods"])
+        try:
+            paths = load_test_paths(dataset)
+            results = run_load_test(
+                paths, servers, port=options["port"], concurrency=options["concurrency"], requests=options["requests"]
+            )
+        except ServerError as exc:
+            raise CommandError(str(exc))
+        finally:
+            for association in dataset.associations:
+                association.delete()
+
+        for kind, result in results.items():
+            self.stdout.write(
+                f"{kind:10} {result.throughput:8.1f} req/s  p50 {result.percentile(50) * 1000:7.1f} ms  "
+                f"p95 {result.percentile(95) * 1000:7.1f} ms  {result.errors} errors"
+            )
+        if "wsgi" in results:
+            for kind in ("asgi-sync", "asgi"):
+                if kind in results and results["wsgi"].throughput:
+                    self.stdout.write(f"{kind} / wsgi: {results[kind].throughput / results['wsgi'].throughput:.2f}x")
+        if any(result.errors for result in results.values()):
+            raise CommandError("Dalis užklausų nepavyko")
@@ -0,0 +1,30 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from skaps.instrumentation import QueryCounter
+from skaps.models import Association, Period
+from skaps.rebilling import recompute_stale_invoices, stale_targets
+
+
+class Command(BaseCommand):
+    help = "Recompute invoices marked stale after readings, period taxes or floor areas changed."
+
+    def handle(self, *args, **options):
+        targets = stale_targets()
+        if not targets:
+            self.stdout.write("No stale invoices.")
+            return
+
+        associations = Association.objects.in_bulk({a for a, _ in targets})
+        periods = Period.objects.in_bulk({p for _, p in targets})
+
+        for association_id, period_id in targets:
+            association, period = associations[association_id], periods[period_id]
+            with QueryCounter() as counter:
+                drafts = recompute_stale_invoices(association, period)
+            actions = Counter(d.action for d in drafts)
+            self.stdout.write(self.style.SUCCESS(
+                f"{association.name} {period}: {actions['replace']} updated, {actions['unchanged']} unchanged, "
+                f"{counter.wall_time:.3f}s, {counter.queries} queries"
+            ))
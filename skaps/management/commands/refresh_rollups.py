@@ -0,0 +1,29 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from skaps.instrumentation import QueryCounter
+from skaps.models import Association
+from skaps.reporting import refresh_association_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the reporting rollups from invoices and payments (after upgrades or manual data fixes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("association_id", nargs="?", help="Association UUID (default: all)")
+
+    def handle(self, *args, **options):
+        associations = Association.objects.all()
+        if options["association_id"]:
+            try:
+                associations = [associations.get(id=options["association_id"])]
+            except (Association.DoesNotExist, ValidationError):
+                raise CommandError(f"Association {options['association_id']} not found.")
+
+        for association in associations:
+            with QueryCounter() as counter:
+                refresh_association_rollups(association)
+            self.stdout.write(self.style.SUCCESS(
+                f"{association.name}: {association.period_rollups.count()} periods, "
+                f"{counter.wall_time:.3f}s, {counter.queries} queries"
+            ))
@@ -0,0 +1,62 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from skaps.benchmarks import api_comparison, compare, generate_dataset, run_benchmarks
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark invoice generation and the main read views on a synthetic dataset "
+        "(rolled back afterwards) and compare against a JSON baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customers", type=int, default=500)
+        parser.add_argument("--meters", type=int, default=2)
+        parser.add_argument("--periods", type=int, default=12)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--baseline", default=str(Path(settings.BASE_DIR) / "benchmark_baseline.json"))
+        parser.add_argument("--threshold", type=float, default=0.25,
+                            help="Allowed relative growth of wall time and peak memory")
+        parser.add_argument("--save-baseline", action="store_true", help="Write results as the new baseline")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                dataset = generate_dataset(
+                    customers=options["customers"], meters=options["meters"], periods=options["periods"]
+                )
+                results = run_benchmarks(dataset, repeat=options["repeat"])
+                raise Rollback
+        except Rollback:
+            pass
+
+        for name, r in results.items():
+            self.stdout.write(
+                f"{name:22} {r['wall_time'] * 1000:9.1f} ms {r['queries']:6d} queries "
+                f"{r['peak_memory'] / 1024:9.0f} KiB"
+            )
+        for api, html, ratio in api_comparison(results):
+            self.stdout.write(f"{api} / {html}: {ratio:.2f}x")
+
+        baseline_path = Path(options["baseline"])
+        if options["save_baseline"]:
+            baseline_path.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Baseline įrašytas: {baseline_path}"))
+            return
+        if not baseline_path.exists():
+            self.stdout.write(self.style.WARNING(f"Baseline nerastas ({baseline_path}), palyginimas praleistas"))
+            return
+
+        regressions = compare(results, json.loads(baseline_path.read_text()), options["threshold"])
+        if regressions:
+            raise CommandError("Performance regression:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("Regresijų nerasta"))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from skaps.jobs import run_pending_jobs, worker_name
+
+
+class Command(BaseCommand):
+    help = "Process queued invoice generation jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit")
+        parser.add_argument("--poll", type=float, default=2.0, help="Seconds between queue polls")
+
+    def handle(self, *args, **options):
+        worker = worker_name()
+        self.stdout.write(f"worker {worker} started")
+
+        while True:
+            for job in run_pending_jobs(worker):
+                style = self.style.SUCCESS if job.status == "done" else self.style.ERROR
+                self.stdout.write(style(
+                    f"{job}: {job.progress_done}/{job.progress_total} customers, "
+                    f"{job.invoices_created} invoices, {job.wall_time:.3f}s, {job.queries} queries"
+                ))
+                if job.error:
+                    self.stderr.write(job.error)
+
+            if options["once"]:
+                break
+            time.sleep(options["poll"])
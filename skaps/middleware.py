@@ -0,0 +1,63 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from .instrumentation import QueryCounter, metrics
+
+logger = logging.getLogger("skaps.requests")
+
+
+class QueryMetricsMiddleware:
+    """Records wall time, SQL query count and DB time of every resolved view."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with QueryCounter() as counter:
+            response = self.get_response(request)
+        return self.record(request, response, counter)
+
+    async def __acall__(self, request):
+        # async ORM užklausos vykdomos užklausos sinchroninėje gijoje – ten ir jos jungtis
+        counter = QueryCounter()
+        await sync_to_async(counter.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(counter.__exit__)(None, None, None)
+        return self.record(request, response, counter)
+
+    def record(self, request, response, counter):
+        match = getattr(request, "resolver_match", None)
+        if match is None:
+            return response
+        view_name = match.view_name or match._func_path
+
+        metrics.record_view(view_name, counter)
+        repeated = counter.repeated_statements
+        if repeated:
+            sql, times = max(repeated.items(), key=lambda item: item[1])
+            logger.warning(
+                "possible N+1 in %s: statement repeated %d times: %s", view_name, times, sql,
+                extra={"view": view_name, "repeated": times},
+            )
+        logger.debug(
+            "%s %s -> %s in %.1f ms, %d queries (%.1f ms db)",
+            request.method, request.path, view_name, counter.wall_time * 1000,
+            counter.queries, counter.db_time * 1000,
+            extra={
+                "view": view_name,
+                "status": response.status_code,
+                "duration_ms": counter.wall_time * 1000,
+                "queries": counter.queries,
+                "db_ms": counter.db_time * 1000,
+            },
+        )
+        return response
@@ -0,0 +1,94 @@
+# Generated by Django 5.2.8 on 2026-10-17 11:55
+
+import django.db.models.deletion
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_ledger(apps, schema_editor):
+    Period = apps.get_model("skaps", "Period")
+    MeterReading = apps.get_model("skaps", "MeterReading")
+    MeterConsumption = apps.get_model("skaps", "MeterConsumption")
+    ConsumptionTotal = apps.get_model("skaps", "ConsumptionTotal")
+
+    periods = {p.id: (p.year, p.month) for p in Period.objects.all()}
+    by_ym = {ym: pid for pid, ym in periods.items()}
+
+    def previous_of(period_id):
+        year, month = periods[period_id]
+        return by_ym.get((year - 1, 12) if month == 1 else (year, month - 1))
+
+    values = {}
+    end_totals = defaultdict(Decimal)
+    readings = MeterReading.objects.values_list(
+        "meter_id", "meter__customer__association_id", "meter__meter_type", "period_id", "value"
+    )
+    for meter_id, association_id, meter_type, period_id, value in readings:
+        values[(meter_id, period_id)] = value
+        end_totals[(association_id, meter_type, period_id)] += value
+
+    meter_rows = []
+    for (meter_id, period_id), value in values.items():
+        start = values.get((meter_id, previous_of(period_id)))
+        meter_rows.append(MeterConsumption(
+            meter_id=meter_id, period_id=period_id, start_value=start, end_value=value,
+            consumed=value - start if start is not None else Decimal("0"),
+        ))
+
+    total_rows = []
+    for (association_id, meter_type, period_id), end_total in end_totals.items():
+        start = end_totals.get((association_id, meter_type, previous_of(period_id)), Decimal("0"))
+        total_rows.append(ConsumptionTotal(
+            association_id=association_id, meter_type=meter_type, period_id=period_id,
+            start_total=start, end_total=end_total, consumed=end_total - start if start else end_total,
+        ))
+
+    MeterConsumption.objects.bulk_create(meter_rows, batch_size=500)
+    ConsumptionTotal.objects.bulk_create(total_rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skaps', '0006_alter_meter_ser_num'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumptionTotal',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('meter_type', models.CharField(choices=[('electricity', 'Electricity'), ('water', 'Water'), ('gas', 'Gas')], max_length=20)),
+                ('start_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('end_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('consumed', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('association', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumption_totals', to='skaps.association')),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumption_totals', to='skaps.period')),
+            ],
+            options={
+                'unique_together': {('association', 'meter_type', 'period')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MeterConsumption',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('start_value', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('end_value', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('consumed', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('meter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumptions', to='skaps.meter')),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meter_consumptions', to='skaps.period')),
+            ],
+            options={
+                'unique_together': {('meter', 'period')},
+            },
+        ),
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-17 11:57
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skaps', '0007_consumption_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('status', models.CharField(choices=[('pending', 'Laukia'), ('running', 'Vykdoma'), ('done', 'Atlikta'), ('failed', 'Nepavyko')], default='pending', max_length=10)),
+                ('progress_done', models.PositiveIntegerField(default=0)),
+                ('progress_total', models.PositiveIntegerField(default=0)),
+                ('invoices_created', models.PositiveIntegerField(default=0)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('wall_time', models.FloatField(default=0)),
+                ('queries', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('association', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invoice_jobs', to='skaps.association')),
+                ('customer', models.ForeignKey(blank=True, help_text='Empty = whole association', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='invoice_jobs', to='skaps.customer')),
+                ('invoice', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='skaps.invoice')),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invoice_jobs', to='skaps.period')),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skaps', '0008_invoicejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='input_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the billing inputs the items were computed from', max_length=64),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-17 11:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skaps', '0009_invoice_input_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='is_stale',
+            field=models.BooleanField(db_index=True, default=False, help_text='Inputs changed since the invoice was computed'),
+        ),
+        migrations.AddField(
+            model_name='invoiceitem',
+            name='floor_area',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoiceitem',
+            name='reading',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoice_items', to='skaps.meterreading'),
+        ),
+    ]
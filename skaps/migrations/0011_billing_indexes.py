@@ -0,0 +1,69 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:11
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def merge_duplicate_period_taxes(apps, schema_editor):
+    """
+    Before the unique constraint: duplicate (association, tax_type, period)
+    rows were each distributed on their own, so they are merged into the
+    oldest row with the summed amount and invoice items are repointed to it.
+    """
+    PeriodTax = apps.get_model("skaps", "PeriodTax")
+    InvoiceItem = apps.get_model("skaps", "InvoiceItem")
+
+    groups = defaultdict(list)
+    for tax in PeriodTax.objects.order_by("created_at", "id"):
+        groups[(tax.association_id, tax.tax_type_id, tax.period_id)].append(tax)
+
+    for kept, *duplicates in groups.values():
+        if not duplicates:
+            continue
+        duplicate_ids = [tax.id for tax in duplicates]
+        kept.amount = sum((tax.amount for tax in duplicates), kept.amount)
+        kept.save(update_fields=["amount"])
+        InvoiceItem.objects.filter(period_tax_id__in=duplicate_ids).update(period_tax_id=kept.id)
+        PeriodTax.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skaps', '0010_invoice_dependencies'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_period_taxes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['association', 'full_name', 'id'], name='customer_assoc_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['customer', 'period', '-created_at'], name='invoice_customer_period_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoicejob',
+            index=models.Index(fields=['status', 'created_at'], name='invoicejob_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meter',
+            index=models.Index(fields=['customer', 'meter_type'], name='meter_customer_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meter',
+            index=models.Index(fields=['ser_num'], name='meter_ser_num_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meterreading',
+            index=models.Index(fields=['period', 'meter'], name='reading_period_meter_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='periodtax',
+            constraint=models.UniqueConstraint(fields=('association', 'period', 'tax_type'), name='unique_period_tax'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+
+def backfill_reading_columns(apps, schema_editor):
+    Meter = apps.get_model("skaps", "Meter")
+    Period = apps.get_model("skaps", "Period")
+    MeterReading = apps.get_model("skaps", "MeterReading")
+
+    meters = Meter.objects.filter(id=OuterRef("meter_id"))
+    periods = Period.objects.filter(id=OuterRef("period_id")).annotate(ordinal=F("year") * 12 + F("month"))
+    MeterReading.objects.update(
+        association_id=Subquery(meters.values("customer__association_id")[:1]),
+        meter_type=Subquery(meters.values("meter_type")[:1]),
+        period_ordinal=Subquery(periods.values("ordinal")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skaps', '0011_billing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meterreading',
+            name='association',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE,
+                                    related_name='meter_readings', to='skaps.association'),
+        ),
+        migrations.AddField(
+            model_name='meterreading',
+            name='meter_type',
+            field=models.CharField(choices=[('electricity', 'Electricity'), ('water', 'Water'), ('gas', 'Gas')],
+                                   default='', editable=False, max_length=20),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='meterreading',
+            name='period_ordinal',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='year * 12 + month'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_reading_columns, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='meterreading',
+            name='association',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE,
+                                    related_name='meter_readings', to='skaps.association'),
+        ),
+        migrations.AddIndex(
+            model_name='meterreading',
+            index=models.Index(fields=['association', 'meter_type', 'period_ordinal'],
+                               name='reading_assoc_type_ord_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meterreading',
+            index=models.Index(fields=['meter', 'period_ordinal'], name='reading_meter_ordinal_idx'),
+        ),
+    ]
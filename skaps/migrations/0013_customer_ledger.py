@@ -0,0 +1,75 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:15
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+def open_ledgers(apps, schema_editor):
+    """Carries Customer.balance over as each customer's first ledger entry."""
+    Customer = apps.get_model("skaps", "Customer")
+    LedgerEntry = apps.get_model("skaps", "LedgerEntry")
+    LedgerEntry.objects.bulk_create(
+        LedgerEntry(customer_id=customer_id, sequence=1, kind="adjustment", amount=balance,
+                    note="Pradinis likutis")
+        for customer_id, balance in Customer.objects.exclude(balance=0).values_list("id", "balance")
+    )
+
+
+def restore_balances(apps, schema_editor):
+    Customer = apps.get_model("skaps", "Customer")
+    LedgerEntry = apps.get_model("skaps", "LedgerEntry")
+    for entry in LedgerEntry.objects.filter(sequence=1, note="Pradinis likutis"):
+        Customer.objects.filter(id=entry.customer_id).update(balance=entry.amount)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skaps', '0012_meterreading_denormalized'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='invoice',
+            name='balance',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Customer balance before this invoice (from the ledger)', max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('sequence', models.PositiveIntegerField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='skaps.customer')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('customer', 'sequence'), name='unique_balance_snapshot')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('sequence', models.PositiveIntegerField(help_text='Per-customer posting order')),
+                ('kind', models.CharField(choices=[('invoice', 'Sąskaita'), ('payment', 'Mokėjimas'), ('adjustment', 'Koregavimas')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='skaps.customer')),
+                ('invoice', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='skaps.invoice')),
+            ],
+            options={
+                'ordering': ['customer', 'sequence'],
+                'constraints': [models.UniqueConstraint(fields=('customer', 'sequence'), name='unique_ledger_sequence')],
+            },
+        ),
+        migrations.RunPython(open_ledgers, restore_balances),
+        migrations.RemoveField(
+            model_name='customer',
+            name='balance',
+        ),
+    ]
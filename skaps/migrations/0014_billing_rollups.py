@@ -0,0 +1,77 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:37
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_supplier_amounts(apps, schema_editor):
+    # supplier_amount – tiekėjo sąskaita (PeriodTax.amount), total_diff – bendrijos suvartojimas
+    InvoiceItem = apps.get_model("skaps", "InvoiceItem")
+    PeriodTax = apps.get_model("skaps", "PeriodTax")
+    ConsumptionTotal = apps.get_model("skaps", "ConsumptionTotal")
+
+    taxes = PeriodTax.objects.filter(id=OuterRef("period_tax_id"))
+    totals = ConsumptionTotal.objects.filter(
+        association_id=OuterRef("association_id"),
+        meter_type=OuterRef("tax_type__meter_type"),
+        period_id=OuterRef("period_id"),
+    ).values("consumed")[:1]
+    InvoiceItem.objects.filter(period_tax__isnull=False).update(
+        supplier_amount=Subquery(taxes.values("amount")[:1])
+    )
+    InvoiceItem.objects.filter(period_tax__isnull=False, meter__isnull=False).update(
+        total_diff=Subquery(taxes.annotate(total=Subquery(totals)).values("total")[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skaps', '0013_customer_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeriodRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('period_ordinal', models.PositiveIntegerField(editable=False, help_text='year * 12 + month')),
+                ('invoices', models.PositiveIntegerField(default=0)),
+                ('billed_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('payable_amount', models.DecimalField(decimal_places=2, default=0, help_text='Billed amount after customer balances were applied', max_digits=14)),
+                ('supplier_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('collected_amount', models.DecimalField(decimal_places=2, default=0, help_text="Payments posted during the period's month", max_digits=14)),
+                ('association', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_rollups', to='skaps.association')),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='skaps.period')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['association', 'period_ordinal'], name='period_rollup_ordinal_idx')],
+                'constraints': [models.UniqueConstraint(fields=('association', 'period'), name='unique_period_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TaxRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('period_ordinal', models.PositiveIntegerField(editable=False, help_text='year * 12 + month')),
+                ('supplier_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('billed_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('consumed', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('lines', models.PositiveIntegerField(default=0)),
+                ('association', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tax_rollups', to='skaps.association')),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tax_rollups', to='skaps.period')),
+                ('tax_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='skaps.taxtype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['association', 'period_ordinal'], name='tax_rollup_ordinal_idx')],
+                'constraints': [models.UniqueConstraint(fields=('association', 'period', 'tax_type'), name='unique_tax_rollup')],
+            },
+        ),
+        migrations.RunPython(fill_supplier_amounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:52
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skaps', '0014_billing_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeterStats',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('last_ordinal', models.PositiveIntegerField(blank=True, null=True)),
+                ('last_value', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('mean', models.FloatField(default=0)),
+                ('m2', models.FloatField(default=0, help_text='Sum of squared deviations from the mean (Welford)')),
+                ('monthly', models.JSONField(default=dict, help_text='{"month": [samples, mean, m2]} per calendar month')),
+                ('scanned_at', models.DateTimeField(help_text='Readings updated after this are not folded in yet')),
+                ('association', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meter_stats', to='skaps.association')),
+                ('meter', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='skaps.meter')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ReadingAnomaly',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('period_ordinal', models.PositiveIntegerField(editable=False, help_text='year * 12 + month')),
+                ('kind', models.CharField(choices=[('decrease', 'Rodmuo sumažėjo'), ('rollover', 'Skaitiklis persivertė'), ('spike', 'Neįprastai didelis suvartojimas'), ('gap', 'Trūksta rodmenų')], max_length=20)),
+                ('consumed', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('expected', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('score', models.FloatField(blank=True, help_text='Standard deviations above the expected value', null=True)),
+                ('message', models.CharField(max_length=200)),
+                ('association', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reading_anomalies', to='skaps.association')),
+                ('meter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='anomalies', to='skaps.meter')),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reading_anomalies', to='skaps.period')),
+                ('reading', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='anomalies', to='skaps.meterreading')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['association', 'period_ordinal'], name='anomaly_assoc_ordinal_idx')],
+                'constraints': [models.UniqueConstraint(fields=('reading', 'kind'), name='unique_reading_anomaly')],
+            },
+        ),
+    ]
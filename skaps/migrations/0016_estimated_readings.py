@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skaps', '0015_reading_anomalies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoiceitem',
+            name='is_estimated',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='meterconsumption',
+            name='is_estimated',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='meterreading',
+            name='estimated_value',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, help_text='Value the period was billed with; kept when the real reading replaces the estimate', max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='meterreading',
+            name='is_estimated',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skaps', '0016_estimated_readings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoicejob',
+            name='anomalies',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='invoicejob',
+            name='estimate',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='invoicejob',
+            name='estimated',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:23
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skaps', '0017_invoice_job_estimate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='association',
+            name='billing_generation',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='BillingInputsVersion',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('association_id', models.UUIDField()),
+                ('period_id', models.UUIDField()),
+                ('token', models.CharField(max_length=12)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('association_id', 'period_id'), name='unique_billing_inputs_version')],
+            },
+        ),
+    ]
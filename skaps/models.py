@@ -39,11 +39,18 @@ class Association(BaseModel):
     name = models.CharField(max_length=150)
     description = models.TextField(blank=True, null=True)
     manager = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    # didinama, kai pasikeičia visų periodų sąskaitų įvestys (skaps.billing_cache)
+    billing_generation = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
 
 
+def period_ordinal(year, month):
+    """Sortable month number: consecutive months differ by exactly one."""
+    return year * 12 + month
+
+
 class Period(BaseModel):
     """Represents a year-month accounting period."""
     year = models.PositiveSmallIntegerField()
@@ -56,6 +63,19 @@ class Period(BaseModel):
     def __str__(self):
         return f"{self.year}-{self.month:02d}"
 
+    @property
+    def ordinal(self):
+        return period_ordinal(self.year, self.month)
+
+    def previous_period(self):
+        """Calendar-previous period (2025-01 → 2024-12), or None if it does not exist."""
+        year, month = (self.year - 1, 12) if self.month == 1 else (self.year, self.month - 1)
+        return Period.objects.filter(year=year, month=month).first()
+
+    def next_period(self):
+        year, month = (self.year + 1, 1) if self.month == 12 else (self.year, self.month + 1)
+        return Period.objects.filter(year=year, month=month).first()
+
 
 class Customer(BaseModel):
     """Represents a member of the association."""
@@ -65,10 +85,14 @@ class Customer(BaseModel):
     email = models.EmailField(blank=True, null=True)
     phone = models.CharField(max_length=20, blank=True, null=True)
     address = models.CharField(max_length=100, blank=True, null=True)
-    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0,
-                                  help_text="Positive = prepaid, Negative = debt")
     floor_area = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
+    class Meta:
+        indexes = [
+            # bendrijos klientų sąrašas ir BillingContext rikiuoja pagal vardą
+            models.Index(fields=["association", "full_name", "id"], name="customer_assoc_name_idx"),
+        ]
+
     def __str__(self):
         return f"{self.full_name} ({self.association.name})"
 
@@ -80,6 +104,13 @@ class Meter(BaseModel):
     description = models.CharField(max_length=100, blank=True)
     ser_num = models.CharField("Serial number", max_length=20, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["customer", "meter_type"], name="meter_customer_type_idx"),
+            # rodmenų importas ieško pagal serijos numerį
+            models.Index(fields=["ser_num"], name="meter_ser_num_idx"),
+        ]
+
     def clean(self):
         # automatinis unit priskyrimas
         expected_unit = METER_TYPE_UNITS.get(self.meter_type)
@@ -153,6 +184,12 @@ class PeriodTax(BaseModel):
     period = models.ForeignKey(Period, on_delete=models.CASCADE, related_name="taxes")
     amount = models.DecimalField(max_digits=12, decimal_places=2)
 
+    class Meta:
+        constraints = [
+            # association, period pirmi – tas pats indeksas aptarnauja ir (association, period) paiešką
+            models.UniqueConstraint(fields=["association", "period", "tax_type"], name="unique_period_tax"),
+        ]
+
     def __str__(self):
         return f"{self.tax_type.name} {self.amount} {self.tax_type.currency} ({self.period})"
 
@@ -164,21 +201,166 @@ class MeterReading(BaseModel):
     meter = models.ForeignKey(Meter, on_delete=models.CASCADE, related_name="readings")
     period = models.ForeignKey(Period, on_delete=models.CASCADE, related_name="meter_readings")
     value = models.DecimalField(max_digits=10, decimal_places=2)
+    # įvertintas pagal ankstesnį suvartojimą, kol tikrasis rodmuo negautas
+    is_estimated = models.BooleanField(default=False)
+    estimated_value = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True, editable=False,
+        help_text="Value the period was billed with; kept when the real reading replaces the estimate",
+    )
+
+    # denormalizuota iš skaitiklio ir periodo – agregatai be JOIN (sinchronizuoja save() ir signalai)
+    association = models.ForeignKey(Association, on_delete=models.CASCADE, related_name="meter_readings",
+                                    editable=False)
+    meter_type = models.CharField(max_length=20, choices=METER_TYPES, editable=False)
+    period_ordinal = models.PositiveIntegerField(editable=False, help_text="year * 12 + month")
 
     class Meta:
         unique_together = ("meter", "period")
+        indexes = [
+            models.Index(fields=["period", "meter"], name="reading_period_meter_idx"),
+            models.Index(fields=["association", "meter_type", "period_ordinal"], name="reading_assoc_type_ord_idx"),
+            models.Index(fields=["meter", "period_ordinal"], name="reading_meter_ordinal_idx"),
+        ]
 
     def __str__(self):
         return f"{self.meter} ({self.period}): {self.value} {self.meter.unit}"
 
+    def denormalize(self, association_id, meter_type, period):
+        """Sets the copied columns; bulk_create callers use it instead of save()."""
+        self.association_id = association_id
+        self.meter_type = meter_type
+        self.period_ordinal = period.ordinal
+        return self
+
+    def save(self, *args, **kwargs):
+        association_id, meter_type = Meter.objects.filter(id=self.meter_id).values_list(
+            "customer__association_id", "meter_type"
+        ).get()
+        self.denormalize(association_id, meter_type, self.period)
+        super().save(*args, **kwargs)
+
+
+class MeterConsumption(BaseModel):
+    """Materialized consumption of one meter in one period (kept in sync by signals)."""
+    meter = models.ForeignKey(Meter, on_delete=models.CASCADE, related_name="consumptions")
+    period = models.ForeignKey(Period, on_delete=models.CASCADE, related_name="meter_consumptions")
+    start_value = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    end_value = models.DecimalField(max_digits=10, decimal_places=2)
+    consumed = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # end_value – įvertintas rodmuo
+    is_estimated = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ("meter", "period")
+
+    def __str__(self):
+        return f"{self.meter} ({self.period}): {self.consumed} {self.meter.unit}"
+
+
+class ConsumptionTotal(BaseModel):
+    """Association-wide reading totals per meter type and period."""
+    association = models.ForeignKey(Association, on_delete=models.CASCADE, related_name="consumption_totals")
+    meter_type = models.CharField(max_length=20, choices=METER_TYPES)
+    period = models.ForeignKey(Period, on_delete=models.CASCADE, related_name="consumption_totals")
+    start_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    end_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    consumed = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ("association", "meter_type", "period")
+
+    def __str__(self):
+        return f"{self.association} {self.meter_type} ({self.period}): {self.consumed}"
+
+
+class BillingInputsVersion(BaseModel):
+    """Version of one association period's billing inputs; part of the billing cache key (skaps.billing_cache)."""
+    # be FK: rašoma ir iš trynimo signalų, kai bendrija ar periodas jau trinami
+    association_id = models.UUIDField()
+    period_id = models.UUIDField()
+    token = models.CharField(max_length=12)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["association_id", "period_id"], name="unique_billing_inputs_version"),
+        ]
+
+    def __str__(self):
+        return f"{self.association_id} ({self.period_id}): {self.token}"
+
+
+class MeterStats(BaseModel):
+    """
+    Running consumption statistics of one meter (skaps.anomalies).
+
+    Readings up to last_ordinal are folded in; a newer reading extends the
+    statistics, an older or edited one makes the meter rescan its history.
+    """
+    meter = models.OneToOneField(Meter, on_delete=models.CASCADE, related_name="stats")
+    association = models.ForeignKey(Association, on_delete=models.CASCADE, related_name="meter_stats")
+    last_ordinal = models.PositiveIntegerField(null=True, blank=True)
+    last_value = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    samples = models.PositiveIntegerField(default=0)
+    mean = models.FloatField(default=0)
+    m2 = models.FloatField(default=0, help_text="Sum of squared deviations from the mean (Welford)")
+    monthly = models.JSONField(default=dict, help_text='{"month": [samples, mean, m2]} per calendar month')
+    scanned_at = models.DateTimeField(help_text="Readings updated after this are not folded in yet")
+
+    def __str__(self):
+        return f"{self.meter}: {self.samples} samples, mean {self.mean:.2f}"
+
+
+class ReadingAnomaly(BaseModel):
+    """Suspicious meter reading found by skaps.anomalies; recomputed whenever the meter is rescanned."""
+
+    KIND_CHOICES = [
+        ("decrease", "Rodmuo sumažėjo"),
+        ("rollover", "Skaitiklis persivertė"),
+        ("spike", "Neįprastai didelis suvartojimas"),
+        ("gap", "Trūksta rodmenų"),
+    ]
+
+    reading = models.ForeignKey(MeterReading, on_delete=models.CASCADE, related_name="anomalies")
+    meter = models.ForeignKey(Meter, on_delete=models.CASCADE, related_name="anomalies")
+    association = models.ForeignKey(Association, on_delete=models.CASCADE, related_name="reading_anomalies")
+    period = models.ForeignKey(Period, on_delete=models.CASCADE, related_name="reading_anomalies")
+    period_ordinal = models.PositiveIntegerField(editable=False, help_text="year * 12 + month")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    consumed = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    expected = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    score = models.FloatField(null=True, blank=True, help_text="Standard deviations above the expected value")
+    message = models.CharField(max_length=200)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["reading", "kind"], name="unique_reading_anomaly"),
+        ]
+        indexes = [
+            models.Index(fields=["association", "period_ordinal"], name="anomaly_assoc_ordinal_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.meter} ({self.period}): {self.get_kind_display()}"
+
+
 class Invoice(BaseModel):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="invoices")
     period = models.ForeignKey(Period, on_delete=models.PROTECT, related_name="invoices")
     number = models.CharField(max_length=50, unique=True)
     date = models.DateField(auto_now_add=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
-    balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    balance = models.DecimalField(max_digits=10, decimal_places=2, default=0,
+                                  help_text="Customer balance before this invoice (from the ledger)")
     payable_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    input_hash = models.CharField(max_length=64, blank=True, editable=False,
+                                  help_text="Hash of the billing inputs the items were computed from")
+    is_stale = models.BooleanField(default=False, db_index=True,
+                                   help_text="Inputs changed since the invoice was computed")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["customer", "period", "-created_at"], name="invoice_customer_period_idx"),
+        ]
 
     def __str__(self):
         return f"{self.number} - {self.customer.full_name}"
@@ -200,6 +382,12 @@ class InvoiceItem(BaseModel):
     consumed = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     supplier_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     total_diff = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    is_estimated = models.BooleanField(default=False)
+
+    # priklausomybės: iš kokių duomenų eilutė apskaičiuota
+    reading = models.ForeignKey(MeterReading, on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name="invoice_items")
+    floor_area = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
 
     def __str__(self):
         return f"{self.description} ({self.total} €)"
@@ -216,3 +404,158 @@ class InvoiceItem(BaseModel):
     def currency(self):
         """Grąžina valiutą iš susieto PeriodTax → TaxType, jei yra."""
         return self.period_tax.tax_type.currency if self.period_tax else None
+
+
+class LedgerEntry(BaseModel):
+    """
+    Append-only customer account movement; entries are never edited.
+
+    Positive amount = money in (payment, credit), negative = charge, so the
+    balance is positive when prepaid and negative when in debt.
+    """
+
+    KIND_CHOICES = [
+        ("invoice", "Sąskaita"),
+        ("payment", "Mokėjimas"),
+        ("adjustment", "Koregavimas"),
+    ]
+
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="ledger_entries")
+    sequence = models.PositiveIntegerField(help_text="Per-customer posting order")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    # ištrinta sąskaita žurnalo nekeičia – taisoma koregavimo įrašu
+    invoice = models.ForeignKey(Invoice, on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name="ledger_entries")
+    note = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        ordering = ["customer", "sequence"]
+        constraints = [
+            models.UniqueConstraint(fields=["customer", "sequence"], name="unique_ledger_sequence"),
+        ]
+
+    def __str__(self):
+        return f"{self.customer.full_name} #{self.sequence} {self.get_kind_display()} {self.amount}"
+
+
+class BalanceSnapshot(BaseModel):
+    """Customer balance after ledger entry `sequence`; balances read the latest one plus the entries after it."""
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="balance_snapshots")
+    sequence = models.PositiveIntegerField()
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["customer", "sequence"], name="unique_balance_snapshot"),
+        ]
+
+    def __str__(self):
+        return f"{self.customer.full_name} #{self.sequence}: {self.balance}"
+
+
+class PeriodRollup(BaseModel):
+    """Billing totals of an association for one period, refreshed when its invoices are (re)generated."""
+    association = models.ForeignKey(Association, on_delete=models.CASCADE, related_name="period_rollups")
+    period = models.ForeignKey(Period, on_delete=models.CASCADE, related_name="rollups")
+    period_ordinal = models.PositiveIntegerField(editable=False, help_text="year * 12 + month")
+    invoices = models.PositiveIntegerField(default=0)
+    billed_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    payable_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0,
+                                         help_text="Billed amount after customer balances were applied")
+    supplier_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    collected_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0,
+                                           help_text="Payments posted during the period's month")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["association", "period"], name="unique_period_rollup"),
+        ]
+        indexes = [
+            models.Index(fields=["association", "period_ordinal"], name="period_rollup_ordinal_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.association} {self.period}: {self.billed_amount}"
+
+
+class TaxRollup(BaseModel):
+    """Supplier amount vs billed amount of one tax type in a period."""
+    association = models.ForeignKey(Association, on_delete=models.CASCADE, related_name="tax_rollups")
+    period = models.ForeignKey(Period, on_delete=models.CASCADE, related_name="tax_rollups")
+    period_ordinal = models.PositiveIntegerField(editable=False, help_text="year * 12 + month")
+    tax_type = models.ForeignKey(TaxType, on_delete=models.CASCADE, related_name="rollups")
+    supplier_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    billed_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    consumed = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    lines = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["association", "period", "tax_type"], name="unique_tax_rollup"),
+        ]
+        indexes = [
+            models.Index(fields=["association", "period_ordinal"], name="tax_rollup_ordinal_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.tax_type} {self.period}: {self.billed_amount} / {self.supplier_amount}"
+
+    @property
+    def difference(self):
+        return self.billed_amount - self.supplier_amount
+
+
+class InvoiceJob(BaseModel):
+    """Queued invoice generation run, processed by the run_invoice_worker command."""
+
+    STATUS_CHOICES = [
+        ("pending", "Laukia"),
+        ("running", "Vykdoma"),
+        ("done", "Atlikta"),
+        ("failed", "Nepavyko"),
+    ]
+
+    association = models.ForeignKey(Association, on_delete=models.CASCADE, related_name="invoice_jobs")
+    period = models.ForeignKey(Period, on_delete=models.CASCADE, related_name="invoice_jobs")
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, null=True, blank=True,
+                                 related_name="invoice_jobs", help_text="Empty = whole association")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+
+    progress_done = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    invoices_created = models.PositiveIntegerField(default=0)
+    invoice = models.ForeignKey(Invoice, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    # trūkstami rodmenys įvertinami prieš skaičiuojant (tik visai bendrijai)
+    estimate = models.BooleanField(default=False)
+    estimated = models.PositiveIntegerField(default=0)
+    anomalies = models.PositiveIntegerField(default=0)
+
+    worker = models.CharField(max_length=100, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    wall_time = models.FloatField(default=0)
+    queries = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="invoicejob_status_idx"),
+        ]
+
+    def __str__(self):
+        target = self.customer.full_name if self.customer_id else self.association.name
+        return f"{target} {self.period} ({self.status})"
+
+    @property
+    def percent(self):
+        if not self.progress_total:
+            return 100 if self.status == "done" else 0
+        return round(100 * self.progress_done / self.progress_total)
+
+    @property
+    def is_finished(self):
+        return self.status in ("done", "failed")
@@ -0,0 +1,146 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of OFFSET the next page starts after the sort key of the last row
+shown, so every page costs the same index range scan no matter how deep
+it is. Cursors are opaque url-safe strings with the sort key values of the
+boundary row; the ordering must end with a unique column (id). Rows may be
+model instances or .values() dicts that include the ordering lookups.
+"""
+import base64
+import json
+from dataclasses import dataclass
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, default=str, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+    if not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values
+
+
+def _lookup(field):
+    return field.lstrip("-")
+
+
+def _value(obj, field):
+    if isinstance(obj, dict):
+        # .values() eilutė
+        return obj[_lookup(field)]
+    for part in _lookup(field).split("__"):
+        obj = getattr(obj, part)
+    return obj
+
+
+def keyset_filter(ordering, values, forward=True):
+    """
+    Q selecting rows strictly after (forward) or before the given key:
+    (a > x) OR (a = x AND b > y) OR ...; descending fields flip the comparison.
+    """
+    if len(values) != len(ordering):
+        raise InvalidCursor(values)
+    condition = Q()
+    for i, field in enumerate(ordering):
+        ascending = not field.startswith("-")
+        op = "gt" if ascending == forward else "lt"
+        equal = {_lookup(f): v for f, v in zip(ordering[:i], values[:i])}
+        condition |= Q(**equal, **{f"{_lookup(field)}__{op}": values[i]})
+    return condition
+
+
+def _reverse(field):
+    return field[1:] if field.startswith("-") else f"-{field}"
+
+
+@dataclass
+class KeysetPage:
+    object_list: list
+    next_cursor: str = None
+    previous_cursor: str = None
+    page_size: int = PAGE_SIZE
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def page_size_from(request, default=PAGE_SIZE):
+    try:
+        size = int(request.GET.get("page_size", default))
+    except ValueError:
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def paginate(queryset, ordering, after=None, before=None, page_size=PAGE_SIZE):
+    """
+    One page of queryset ordered by ordering, starting after the `after`
+    cursor or ending before the `before` cursor. Fetches one extra row to
+    know whether there is another page in that direction.
+    """
+    ordering = list(ordering)
+    if before:
+        qs = queryset.filter(keyset_filter(ordering, decode_cursor(before), forward=False))
+        rows = list(qs.order_by(*map(_reverse, ordering))[:page_size + 1])
+        more = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_previous, has_next = more, True
+    else:
+        qs = queryset
+        if after:
+            qs = qs.filter(keyset_filter(ordering, decode_cursor(after)))
+        rows = list(qs.order_by(*ordering)[:page_size + 1])
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_previous = bool(after)
+
+    def cursor(row):
+        return encode_cursor([_value(row, f) for f in ordering])
+
+    return KeysetPage(
+        object_list=rows,
+        next_cursor=cursor(rows[-1]) if rows and has_next else None,
+        previous_cursor=cursor(rows[0]) if rows and has_previous else None,
+        page_size=page_size,
+    )
+
+
+def paginate_request(request, queryset, ordering):
+    """paginate() driven by ?after=, ?before= and ?page_size= query parameters; bad cursors restart."""
+    try:
+        return paginate(
+            queryset, ordering,
+            after=request.GET.get("after"), before=request.GET.get("before"),
+            page_size=page_size_from(request),
+        )
+    except (InvalidCursor, ValidationError):
+        return paginate(queryset, ordering, page_size=page_size_from(request))
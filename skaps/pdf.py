@@ -0,0 +1,129 @@
+"""
+Minimal PDF writer.
+
+Enough of PDF 1.4 for invoices: A4 pages of text lines in the standard
+Helvetica fonts, with cells at fixed x offsets and horizontal rules. Text
+is written in cp1257 (Baltic): the fonts keep WinAnsiEncoding as the base
+and a /Differences table names the glyphs of the bytes where cp1257 differs
+from it, so ą, č, ę, ė, į, š, ų, ū and ž print as themselves. Characters
+outside cp1257 lose their diacritics.
+"""
+import unicodedata
+import zlib
+
+A4 = (595, 842)
+FONTS = {False: "F1", True: "F2"}
+ENCODING = "cp1257"
+
+# Adobe glyph names: "LATIN SMALL LETTER A WITH OGONEK" -> aogonek
+_ACCENTS = {
+    "OGONEK": "ogonek", "CARON": "caron", "MACRON": "macron", "ACUTE": "acute", "DOT ABOVE": "dotaccent",
+    "CEDILLA": "commaaccent", "STROKE": "slash",
+}
+_GLYPHS = {
+    "\u00a8": "dieresis", "\u02c7": "caron", "\u00b8": "cedilla", "\u00af": "macron", "\u02db": "ogonek",
+    "\u02d9": "dotaccent", "Æ": "AE", "æ": "ae",
+}
+
+
+def _glyph_name(char):
+    if char in _GLYPHS:
+        return _GLYPHS[char]
+    case, letter_and_accent = unicodedata.name(char).removeprefix("LATIN ").split(" LETTER ")
+    letter, accent = letter_and_accent.split(" WITH ")
+    return (letter if case == "CAPITAL" else letter.lower()) + _ACCENTS[accent]
+
+
+def _decode(byte, encoding):
+    try:
+        return bytes([byte]).decode(encoding)
+    except UnicodeDecodeError:
+        return None
+
+
+# baitai, kurių cp1257 simbolis skiriasi nuo WinAnsi
+DIFFERENCES = {
+    byte: _glyph_name(char) for byte in range(0x80, 0x100)
+    if (char := _decode(byte, ENCODING)) and char != _decode(byte, "cp1252")
+}
+
+
+def _encode(text):
+    out = bytearray()
+    for char in str(text):
+        try:
+            out += char.encode(ENCODING)
+        except UnicodeEncodeError:
+            base = unicodedata.normalize("NFKD", char).encode(ENCODING, "ignore")
+            out += base or b"?"
+    return bytes(out).replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+class PDFDocument:
+    """Lines are laid out top-down; a new page starts when the next line would not fit."""
+
+    def __init__(self, page_size=A4, margin=50):
+        self.width, self.height = page_size
+        self.margin = margin
+        self.pages = []
+        self._new_page()
+
+    def _new_page(self):
+        self.ops = []
+        self.pages.append(self.ops)
+        self.y = self.height - self.margin
+
+    def _advance(self, height):
+        if self.y - height < self.margin:
+            self._new_page()
+        self.y -= height
+
+    def line(self, *cells, size=10, bold=False, leading=None):
+        """Cells are text (placed at the margin) or (x, text) pairs with x relative to the margin."""
+        self._advance(leading or size * 1.4)
+        font = FONTS[bold]
+        for cell in cells:
+            x, text = cell if isinstance(cell, tuple) else (0, cell)
+            self.ops.append(
+                b"BT /%s %d Tf %.2f %.2f Td (%s) Tj ET" % (font.encode(), size, self.margin + x, self.y, _encode(text))
+            )
+
+    def space(self, height=8):
+        self._advance(height)
+
+    def rule(self):
+        self._advance(6)
+        self.ops.append(b"%.2f %.2f m %.2f %.2f l S" % (self.margin, self.y, self.width - self.margin, self.y))
+
+    def render(self):
+        objects = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            None,  # puslapių medis – kai bus žinomi puslapių objektai
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding 5 0 R >>",
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding 5 0 R >>",
+            b"<< /Type /Encoding /BaseEncoding /WinAnsiEncoding /Differences [%s] >>"
+            % b" ".join(b"%d /%s" % (byte, name.encode()) for byte, name in DIFFERENCES.items()),
+        ]
+        kids = []
+        for ops in self.pages:
+            stream = zlib.compress(b"\n".join(ops))
+            objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(stream), stream))
+            objects.append(
+                b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R "
+                b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> >>"
+                % (self.width, self.height, len(objects))
+            )
+            kids.append(b"%d 0 R" % len(objects))
+        objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+        out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+        xref = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+        for offset in offsets:
+            out += b"%010d 00000 n \n" % offset
+        out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+        return bytes(out)
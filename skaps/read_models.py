@@ -0,0 +1,189 @@
+"""
+Read models for rendering.
+
+InvoiceDocument loads an invoice with everything its page shows (customer,
+association, period, items with PeriodTax → TaxType and Meter) in a fixed
+number of queries and hands the template ready-made rows, so rendering
+does no lazy lookups.
+
+versioned_invoice() reads just the invoice row plus the latest change time
+of everything printed on it; its etag keys the HTTP validators, the cached
+page fragments and the stored PDF.
+"""
+import hashlib
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.db.models import Max, OuterRef, Subquery
+from django.shortcuts import get_object_or_404
+
+from .models import Invoice, InvoiceItem
+
+
+@dataclass
+class InvoiceLine:
+    item: object
+    name: str
+    unit_price: object
+    total: object
+    currency: str = None
+    footnote: int = None
+    # bendrijos mokesčiai
+    quantity_label: str = ""
+    # skaitiklių sąnaudos
+    start_value: object = None
+    end_value: object = None
+    consumed: object = None
+    unit: str = ""
+
+
+@dataclass
+class InvoiceDocument:
+    invoice: Invoice
+    customer: object
+    association: object
+    community_lines: list = field(default_factory=list)
+    meter_lines: list = field(default_factory=list)
+    footnotes: list = field(default_factory=list)
+    currency: str = None
+
+    @classmethod
+    def load(cls, customer_id, invoice_id):
+        """Two queries: the invoice with its customer/association/period, then all its items."""
+        invoice = get_object_or_404(
+            Invoice.objects.select_related("customer__association", "period"),
+            id=invoice_id, customer_id=customer_id,
+        )
+        return cls.for_invoice(invoice)
+
+    @classmethod
+    def for_invoice(cls, invoice):
+        """One query: the items of an invoice already loaded with its customer/association/period."""
+        return cls.for_invoices([invoice])[0]
+
+    @classmethod
+    def for_invoices(cls, invoices):
+        """Documents for many loaded invoices with one items query."""
+        items_by_invoice = defaultdict(list)
+        items = InvoiceItem.objects.filter(invoice__in=invoices).select_related("period_tax__tax_type", "meter")
+        for item in items.order_by("consumed", "description"):
+            items_by_invoice[item.invoice_id].append(item)
+        return [cls.build(invoice, items_by_invoice[invoice.id]) for invoice in invoices]
+
+    @classmethod
+    def build(cls, invoice, items):
+        customer = invoice.customer
+        document = cls(invoice=invoice, customer=customer, association=customer.association)
+        footnote_by_tax_type = {}
+
+        # pirma bendrijos mokesčiai, tada skaitikliai – išnašos numeruojamos rodymo tvarka
+        community = [item for item in items if not item.consumed]
+        metered = [item for item in items if item.consumed]
+
+        for item in community + metered:
+            tax_type = item.period_tax.tax_type if item.period_tax_id else None
+            currency = tax_type.currency if tax_type else None
+            document.currency = document.currency or currency
+
+            footnote = None
+            if tax_type and tax_type.description:
+                footnote = footnote_by_tax_type.get(tax_type.id)
+                if footnote is None:
+                    document.footnotes.append(tax_type.description)
+                    footnote = footnote_by_tax_type[tax_type.id] = len(document.footnotes)
+
+            line = InvoiceLine(
+                item=item, name=item.description, unit_price=item.unit_price, total=item.total,
+                currency=currency, footnote=footnote,
+            )
+            if item.consumed:
+                line.name = tax_type.name if tax_type else item.description
+                if item.is_estimated:
+                    line.name += " (įvertinta)"
+                line.start_value = item.start_value
+                line.end_value = item.end_value
+                line.consumed = item.consumed
+                line.unit = item.meter.unit_display if item.meter_id else ""
+                document.meter_lines.append(line)
+            else:
+                if tax_type and tax_type.distribution_type == "by_area":
+                    area = item.floor_area if item.floor_area is not None else customer.floor_area
+                    line.quantity_label = f"× {area} m²"
+                document.community_lines.append(line)
+        return document
+
+
+def _latest(queryset, field_name):
+    return Subquery(
+        queryset.filter(invoice=OuterRef("pk")).order_by().values("invoice").annotate(latest=Max(field_name))
+        .values("latest")[:1]
+    )
+
+
+def versioned_invoices():
+    """Invoices with customer/association/period and the change times invoice_etag() is built from."""
+    return Invoice.objects.select_related("customer__association", "period").annotate(
+        items_updated_at=_latest(InvoiceItem.objects, "updated_at"),
+        tax_types_updated_at=_latest(InvoiceItem.objects, "period_tax__tax_type__updated_at"),
+        meters_updated_at=_latest(InvoiceItem.objects, "meter__updated_at"),
+    )
+
+
+def _stamp(invoice):
+    invoice.last_modified = max(
+        ts for ts in (
+            invoice.updated_at, invoice.items_updated_at, invoice.tax_types_updated_at, invoice.meters_updated_at,
+            invoice.customer.updated_at, invoice.customer.association.updated_at,
+        ) if ts is not None
+    )
+    return invoice
+
+
+def versioned_invoice(customer_id, invoice_id):
+    """
+    The invoice with customer/association/period and a `last_modified`
+    attribute (latest updated_at of the invoice, its items, their tax
+    types and meters, the customer and the association) in one query;
+    None if missing.
+    """
+    invoice = versioned_invoices().filter(id=invoice_id, customer_id=customer_id).first()
+    return _stamp(invoice) if invoice else None
+
+
+async def aversioned_invoice(customer_id, invoice_id):
+    """Async versioned_invoice()."""
+    invoice = await versioned_invoices().filter(id=invoice_id, customer_id=customer_id).afirst()
+    return _stamp(invoice) if invoice else None
+
+
+def period_invoices(association, period, chunk_size=100):
+    """
+    Latest invoice of every customer of the association for the period,
+    ordered by customer name, with its InvoiceDocument: yields
+    (document, etag) and loads items one query per chunk.
+    """
+    invoices = versioned_invoices().filter(customer__association=association, period=period).order_by(
+        "customer__full_name", "customer_id", "-created_at"
+    )
+    chunk, last_customer_id = [], None
+    for invoice in invoices.iterator(chunk_size=chunk_size):
+        if invoice.customer_id == last_customer_id:
+            continue
+        last_customer_id = invoice.customer_id
+        chunk.append(_stamp(invoice))
+        if len(chunk) == chunk_size:
+            yield from _documents(chunk)
+            chunk = []
+    yield from _documents(chunk)
+
+
+def _documents(invoices):
+    for document in InvoiceDocument.for_invoices(invoices):
+        yield document, invoice_etag(document.invoice)
+
+
+def invoice_etag(invoice):
+    # updated_at saugomas mikrosekundžių tikslumu, Last-Modified – tik sekundžių
+    parts = [invoice.id, invoice.updated_at, invoice.items_updated_at, invoice.tax_types_updated_at,
+             invoice.meters_updated_at, invoice.customer.updated_at, invoice.customer.association.updated_at]
+    return hashlib.sha256("|".join(map(str, parts)).encode()).hexdigest()[:32]
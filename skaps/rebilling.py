@@ -0,0 +1,106 @@
+"""
+Incremental re-billing.
+
+Model signals mark invoices whose inputs changed as stale (Invoice.is_stale).
+recompute_stale_invoices() then rebuilds the allocation of the association
+once, so proportional and by_area denominators are computed a single time,
+and writes only the item rows whose values actually moved.
+"""
+from django.db.models import Q
+
+from .billing import BillingContext, build_invoice, save_invoices
+from .models import Invoice, Meter, Period
+from .reporting import refresh_period_rollup
+
+
+def mark_stale_for_reading(meter_id, period_id):
+    """
+    A reading is the end value of its period and the start value of the next
+    one, and it moves every proportional share of its meter type.
+    """
+    meter = Meter.objects.filter(id=meter_id).values(
+        "customer_id", "customer__association_id", "meter_type"
+    ).first()
+    period = Period.objects.filter(id=period_id).first()
+    if meter is None or period is None:
+        return 0
+
+    periods = [p.id for p in (period, period.next_period()) if p]
+    return mark_stale_for_readings(
+        meter["customer__association_id"], periods, [meter["customer_id"]], [meter["meter_type"]]
+    )
+
+
+def mark_stale_for_readings(association_id, period_ids, customer_ids, meter_types):
+    """
+    mark_stale_for_reading() for many readings of one association at once:
+    `period_ids` must already include the periods following the readings'.
+    """
+    return Invoice.objects.filter(
+        customer__association_id=association_id,
+        period_id__in=period_ids,
+        is_stale=False,
+    ).filter(
+        Q(customer_id__in=customer_ids)
+        | Q(items__period_tax__tax_type__meter_type__in=meter_types)
+    ).update(is_stale=True)
+
+
+def mark_stale_for_period_tax(association_id, period_id):
+    # naujas ar pakeistas mokestis keičia visų bendrijos sąskaitų eilutes
+    return Invoice.objects.filter(
+        customer__association_id=association_id, period_id=period_id, is_stale=False
+    ).update(is_stale=True)
+
+
+def mark_stale_for_customers(association_id):
+    """
+    Floor area or membership changes move by_area and equal_split shares.
+
+    Customer data has no history, so only the latest invoiced period of the
+    association is affected; earlier periods stay as issued.
+    """
+    latest = Invoice.objects.filter(customer__association_id=association_id).order_by(
+        "-period__year", "-period__month"
+    ).values_list("period_id", flat=True).first()
+    if latest is None:
+        return 0
+    return Invoice.objects.filter(
+        customer__association_id=association_id,
+        period_id=latest,
+        items__period_tax__tax_type__distribution_type__in=["by_area", "equal_split"],
+        is_stale=False,
+    ).update(is_stale=True)
+
+
+def recompute_stale_invoices(association, period):
+    """Recomputes the stale invoices of one association and period; returns their drafts."""
+    stale_customers = set(
+        Invoice.objects.filter(
+            customer__association=association, period=period, is_stale=True
+        ).values_list("customer_id", flat=True)
+    )
+    if not stale_customers:
+        return []
+
+    context = BillingContext(association, period)
+    drafts = []
+    for customer in context.customers:
+        if customer.id not in stale_customers:
+            continue
+        customer.association = association
+        draft = build_invoice(customer, period, context)
+        if draft is not None:
+            drafts.append(draft)
+
+    save_invoices(drafts)
+    refresh_period_rollup(association.id, period)
+    return drafts
+
+
+def stale_targets():
+    """(association, period) pairs that have stale invoices."""
+    pairs = Invoice.objects.filter(is_stale=True).values_list(
+        "customer__association_id", "period_id"
+    ).distinct()
+    return list(pairs)
@@ -0,0 +1,186 @@
+"""
+Reporting rollups.
+
+PeriodRollup and TaxRollup hold the billing totals of one association
+period: invoices, billed and payable amounts, supplier amounts per tax
+type and payments collected in that month. refresh_period_rollup()
+re-aggregates a single (association, period) after its invoices are
+generated, and refresh_collected() updates one month after a payment, so
+reports never aggregate invoices or the ledger. Consumption per meter type
+comes from ConsumptionTotal, which the consumption ledger already keeps.
+
+association_summary() reads a whole history from the rollups in three
+independent queries, whatever the number of periods.
+"""
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import (
+    ConsumptionTotal, Invoice, InvoiceItem, LedgerEntry, Period, PeriodRollup, PeriodTax, TaxRollup
+)
+
+ZERO = Decimal("0.00")
+
+
+ROLLUP_FIELDS = ["invoices", "billed_amount", "payable_amount", "supplier_amount", "collected_amount"]
+
+
+def _upsert(rollup, fields):
+    # viena INSERT ... ON CONFLICT užklausa, nesvarbu, ar eilutė jau yra
+    PeriodRollup.objects.bulk_create(
+        [rollup], update_conflicts=True, unique_fields=["association", "period"],
+        update_fields=fields + ["period_ordinal", "updated_at"],
+    )
+
+
+def _month_bounds(year, month):
+    start = timezone.make_aware(datetime(year, month, 1))
+    end = timezone.make_aware(datetime(year + month // 12, month % 12 + 1, 1))
+    return start, end
+
+
+def _collected(association_id, year, month):
+    start, end = _month_bounds(year, month)
+    total = LedgerEntry.objects.filter(
+        customer__association_id=association_id, kind="payment", created_at__gte=start, created_at__lt=end
+    ).aggregate(total=Sum("amount"))["total"]
+    return total or ZERO
+
+
+def refresh_period_rollup(association_id, period):
+    """Re-aggregates the rollups of one association period from its invoices."""
+    invoices = Invoice.objects.filter(customer__association_id=association_id, period=period)
+    totals = invoices.aggregate(count=Count("id"), billed=Sum("total_amount"), payable=Sum("payable_amount"))
+    per_tax = {
+        row["period_tax__tax_type_id"]: row
+        for row in InvoiceItem.objects.filter(invoice__in=invoices, period_tax__isnull=False)
+        .values("period_tax__tax_type_id")
+        .annotate(billed=Sum("total"), consumed=Sum("consumed"), lines=Count("id"))
+        .order_by()
+    }
+    supplier = dict(
+        PeriodTax.objects.filter(association_id=association_id, period=period).values_list("tax_type_id", "amount")
+    )
+
+    tax_rows = []
+    for tax_type_id in supplier.keys() | per_tax.keys():
+        row = per_tax.get(tax_type_id, {})
+        tax_rows.append(TaxRollup(
+            association_id=association_id,
+            period=period,
+            period_ordinal=period.ordinal,
+            tax_type_id=tax_type_id,
+            supplier_amount=supplier.get(tax_type_id, ZERO),
+            billed_amount=row.get("billed") or ZERO,
+            consumed=row.get("consumed"),
+            lines=row.get("lines", 0),
+        ))
+
+    rollup = PeriodRollup(
+        association_id=association_id,
+        period=period,
+        period_ordinal=period.ordinal,
+        invoices=totals["count"],
+        billed_amount=totals["billed"] or ZERO,
+        payable_amount=totals["payable"] or ZERO,
+        supplier_amount=sum(supplier.values(), ZERO),
+        collected_amount=_collected(association_id, period.year, period.month),
+    )
+    with transaction.atomic():
+        _upsert(rollup, ROLLUP_FIELDS)
+        TaxRollup.objects.filter(association_id=association_id, period=period).delete()
+        TaxRollup.objects.bulk_create(tax_rows)
+
+
+def refresh_collected(association_id, when):
+    """Recounts the payments of the month `when` falls in; months without a Period are not reported."""
+    when = timezone.localtime(when)
+    period = Period.objects.filter(year=when.year, month=when.month).first()
+    if period is None:
+        return
+    _upsert(PeriodRollup(
+        association_id=association_id,
+        period=period,
+        period_ordinal=period.ordinal,
+        collected_amount=_collected(association_id, period.year, period.month),
+    ), ["collected_amount"])
+
+
+def refresh_association_rollups(association):
+    """Full refresh of every period the association has invoices or period taxes for."""
+    period_ids = set(PeriodTax.objects.filter(association=association).values_list("period_id", flat=True))
+    period_ids |= set(Invoice.objects.filter(customer__association=association).values_list("period_id", flat=True))
+    for period in Period.objects.filter(id__in=period_ids):
+        refresh_period_rollup(association.id, period)
+
+
+def summary_querysets(association_id, rollups=None):
+    """
+    (rollups, tax rollups, consumption totals) querysets association_summary()
+    reads; the latter two pick their periods with a subquery of `rollups`, so
+    none depends on another's result.
+    """
+    if rollups is None:
+        rollups = PeriodRollup.objects.filter(association_id=association_id)
+    period_ids = rollups.values("period_id")
+    return (
+        rollups.select_related("period").order_by("period_ordinal"),
+        TaxRollup.objects.filter(association_id=association_id, period_id__in=period_ids)
+        .select_related("tax_type").order_by("period_ordinal", "tax_type__name"),
+        ConsumptionTotal.objects.filter(association_id=association_id, period_id__in=period_ids)
+        .values_list("period_id", "meter_type", "consumed"),
+    )
+
+
+def association_summary(association, rollups=None):
+    """
+    Per-period report rows, oldest first; `rollups` may be a pre-filtered
+    PeriodRollup queryset of the association.
+    """
+    return summary_rows(*(list(queryset) for queryset in summary_querysets(association.id, rollups)))
+
+
+def summary_rows(rollups, taxes, totals):
+    """
+    Report rows from the evaluated summary_querysets().
+
+    outstanding is the running total of billed minus collected from the
+    first reported period on.
+    """
+    taxes_by_period = defaultdict(list)
+    for tax in taxes:
+        taxes_by_period[tax.period_id].append({
+            "tax_type": tax.tax_type.name,
+            "meter_type": tax.tax_type.meter_type,
+            "supplier_amount": tax.supplier_amount,
+            "billed_amount": tax.billed_amount,
+            "difference": tax.difference,
+            "consumed": tax.consumed,
+        })
+
+    consumption = defaultdict(dict)
+    for period_id, meter_type, consumed in totals:
+        consumption[period_id][meter_type] = consumed
+
+    rows, outstanding = [], ZERO
+    for rollup in rollups:
+        outstanding += rollup.billed_amount - rollup.collected_amount
+        rows.append({
+            "period": str(rollup.period),
+            "period_id": rollup.period_id,
+            "invoices": rollup.invoices,
+            "billed_amount": rollup.billed_amount,
+            "payable_amount": rollup.payable_amount,
+            "supplier_amount": rollup.supplier_amount,
+            "difference": rollup.billed_amount - rollup.supplier_amount,
+            "collected_amount": rollup.collected_amount,
+            "outstanding": outstanding,
+            "taxes": taxes_by_period[rollup.period_id],
+            "consumption": consumption[rollup.period_id],
+        })
+    return rows
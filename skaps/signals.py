@@ -0,0 +1,183 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import billing_cache
+from .anomalies import detect_anomalies
+from .consumption import rebuild_consumption, refresh_reading_ledger
+from .models import (
+    Association, Customer, Meter, MeterReading, MeterStats, Period, PeriodTax, ReadingAnomaly, TaxType
+)
+from .rebilling import mark_stale_for_customers, mark_stale_for_period_tax, mark_stale_for_reading
+
+
+def _stored_values(instance, *fields):
+    """Values of the row as it is in the DB before an update (None for new rows)."""
+    if instance._state.adding:
+        return None
+    return type(instance).objects.filter(pk=instance.pk).values_list(*fields).first()
+
+
+@receiver(pre_save, sender=MeterReading)
+def remember_reading_origin(sender, instance, raw=False, **kwargs):
+    # jei rodmuo perkeltas į kitą skaitiklį/periodą, senąją vietą irgi reikia perskaičiuoti
+    instance._ledger_origin = None if raw else _stored_values(instance, "meter_id", "period_id")
+
+
+@receiver(post_save, sender=MeterReading)
+def update_ledger_on_reading_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    keys = {(instance.meter_id, instance.period_id)}
+    origin = getattr(instance, "_ledger_origin", None)
+    if origin:
+        keys.add(origin)
+    for meter_id, period_id in keys:
+        refresh_reading_ledger(meter_id, period_id)
+        mark_stale_for_reading(meter_id, period_id)
+
+    # naujas rodmuo tikrinamas pagal sukauptą statistiką, pataisytas – skaitiklis perskenuojamas
+    detect_anomalies(instance.association_id, meter_ids=[instance.meter_id], rescan=bool(origin))
+    if origin and origin[0] != instance.meter_id:
+        _rescan_meter(origin[0])
+
+
+@receiver(post_delete, sender=MeterReading)
+def update_ledger_on_reading_delete(sender, instance, **kwargs):
+    refresh_reading_ledger(instance.meter_id, instance.period_id)
+    mark_stale_for_reading(instance.meter_id, instance.period_id)
+    detect_anomalies(instance.association_id, meter_ids=[instance.meter_id], rescan=True)
+
+
+def _rescan_meter(meter_id):
+    association_id = Meter.objects.filter(id=meter_id).values_list("customer__association_id", flat=True).first()
+    if association_id:
+        detect_anomalies(association_id, meter_ids=[meter_id], rescan=True)
+
+
+@receiver(pre_save, sender=PeriodTax)
+def remember_period_tax_origin(sender, instance, raw=False, **kwargs):
+    instance._billing_origin = None if raw else _stored_values(instance, "association_id", "period_id")
+
+
+@receiver(post_save, sender=PeriodTax)
+def mark_invoices_on_period_tax_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    keys = {(instance.association_id, instance.period_id)}
+    origin = getattr(instance, "_billing_origin", None)
+    if origin:
+        keys.add(origin)
+    for association_id, period_id in keys:
+        billing_cache.invalidate_periods(association_id, period_id)
+        mark_stale_for_period_tax(association_id, period_id)
+
+
+@receiver(post_delete, sender=PeriodTax)
+def mark_invoices_on_period_tax_delete(sender, instance, **kwargs):
+    billing_cache.invalidate_periods(instance.association_id, instance.period_id)
+    mark_stale_for_period_tax(instance.association_id, instance.period_id)
+
+
+@receiver(pre_save, sender=TaxType)
+def remember_tax_type_origin(sender, instance, raw=False, **kwargs):
+    instance._billing_origin = None if raw else _stored_values(instance, "association_id")
+
+
+@receiver(post_save, sender=TaxType)
+@receiver(post_delete, sender=TaxType)
+def invalidate_billing_on_tax_type_change(sender, instance, **kwargs):
+    # mokesčio tipas įeina į visų bendrijos periodų mokesčius
+    billing_cache.invalidate_association(instance.association_id)
+    origin = getattr(instance, "_billing_origin", None)
+    if origin and origin[0] != instance.association_id:
+        billing_cache.invalidate_association(origin[0])
+
+
+def _rebuild_ledgers(*association_ids):
+    for association in Association.objects.filter(id__in=set(association_ids)):
+        rebuild_consumption(association)
+        detect_anomalies(association.id, rescan=True)
+
+
+def _meter_association_id(meter):
+    return Customer.objects.filter(id=meter.customer_id).values_list("association_id", flat=True).first()
+
+
+@receiver(pre_save, sender=Meter)
+def remember_meter_origin(sender, instance, raw=False, **kwargs):
+    instance._reading_origin = None if raw else _stored_values(
+        instance, "customer_id", "customer__association_id", "meter_type"
+    )
+
+
+@receiver(post_save, sender=Meter)
+def sync_readings_on_meter_move(sender, instance, raw=False, **kwargs):
+    # skaitiklis perkeltas kitam klientui ar pakeistas tipas – rodmenų kopijos ir žurnalas pasikeičia
+    if raw:
+        return
+    origin = getattr(instance, "_reading_origin", None)
+    if origin is None:
+        billing_cache.invalidate_association(_meter_association_id(instance))
+        return
+    old_customer_id, old_association_id, old_meter_type = origin
+    billing_cache.invalidate_association(old_association_id)
+    if (old_customer_id, old_meter_type) == (instance.customer_id, instance.meter_type):
+        return
+    association_id = _meter_association_id(instance)
+    billing_cache.invalidate_association(association_id)
+    MeterReading.objects.filter(meter=instance).update(association_id=association_id, meter_type=instance.meter_type)
+    MeterStats.objects.filter(meter=instance).update(association_id=association_id)
+    ReadingAnomaly.objects.filter(meter=instance).update(association_id=association_id)
+    _rebuild_ledgers(old_association_id, association_id)
+
+
+@receiver(pre_save, sender=Period)
+def remember_period_origin(sender, instance, raw=False, **kwargs):
+    instance._ordinal_origin = None if raw else _stored_values(instance, "year", "month")
+
+
+@receiver(post_save, sender=Period)
+def sync_readings_on_period_change(sender, instance, raw=False, **kwargs):
+    origin = getattr(instance, "_ordinal_origin", None)
+    if raw or origin is None or origin == (instance.year, instance.month):
+        return
+    MeterReading.objects.filter(period=instance).update(period_ordinal=instance.ordinal)
+    _rebuild_ledgers(*MeterReading.objects.filter(period=instance).values_list("association_id", flat=True))
+
+
+@receiver(post_delete, sender=Meter)
+def invalidate_billing_on_meter_delete(sender, instance, **kwargs):
+    billing_cache.invalidate_association(_meter_association_id(instance))
+
+
+@receiver(pre_save, sender=Customer)
+def remember_customer_origin(sender, instance, raw=False, **kwargs):
+    instance._billing_origin = None if raw else _stored_values(instance, "association_id", "floor_area")
+
+
+@receiver(post_save, sender=Customer)
+def mark_invoices_on_customer_save(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    billing_cache.invalidate_association(instance.association_id)
+    origin = getattr(instance, "_billing_origin", None)
+    if created or origin is None:
+        mark_stale_for_customers(instance.association_id)
+        return
+    old_association_id, old_floor_area = origin
+    if old_association_id != instance.association_id:
+        billing_cache.invalidate_association(old_association_id)
+        MeterReading.objects.filter(meter__customer=instance).update(association_id=instance.association_id)
+        MeterStats.objects.filter(meter__customer=instance).update(association_id=instance.association_id)
+        ReadingAnomaly.objects.filter(meter__customer=instance).update(association_id=instance.association_id)
+        _rebuild_ledgers(old_association_id, instance.association_id)
+        mark_stale_for_customers(old_association_id)
+        mark_stale_for_customers(instance.association_id)
+    elif old_floor_area != instance.floor_area:
+        mark_stale_for_customers(instance.association_id)
+
+
+@receiver(post_delete, sender=Customer)
+def mark_invoices_on_customer_delete(sender, instance, **kwargs):
+    billing_cache.invalidate_association(instance.association_id)
+    mark_stale_for_customers(instance.association_id)
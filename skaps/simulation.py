@@ -0,0 +1,357 @@
+"""
+What-if billing.
+
+simulate() bills hypothetical period taxes for one or many periods of an
+association without writing anything. The inputs of all periods are read
+at once by load_period_inputs(), so customers and meters are loaded a
+single time; each period then gets a BillingContext, the scenario's
+overrides are applied to unsaved copies of its period taxes and the
+distribution engine allocates them in memory. Customer totals are compared
+with the latest issued invoice of every (customer, period), read in two
+queries for the whole scenario.
+
+A scenario is a dict (the JSON body of the simulate API):
+
+    {
+        "periods": ["2025-01", {"period": "2025-02", "taxes": [...]}],
+        "taxes": [
+            {"tax_type": "<uuid>", "amount": "1200.00"},
+            {"tax_type": "<uuid>", "factor": "1.1", "distribution_type": "by_area"},
+            {"tax_type": "<uuid>", "remove": true},
+            {"name": "Stogo remontas", "distribution_type": "equal_split", "amount": "3000"}
+        ]
+    }
+
+Top-level "taxes" apply to every period; a period's own "taxes" are applied
+after them. An override with "amount" adds the tax to periods that do not
+have it, "factor" only scales existing period taxes.
+"""
+import copy
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q, Sum
+
+from .billing import BillingContext, load_period_inputs
+from .distribution import CENT, DISTRIBUTION_STRATEGIES
+from .models import Invoice, InvoiceItem, Period, PeriodTax, TaxType
+
+ZERO = Decimal("0.00")
+MAX_SIMULATED_PERIODS = 36
+# PeriodTax.amount: max_digits=12, decimal_places=2
+MAX_TAX_AMOUNT = Decimal("10000000000")
+
+_PERIOD = re.compile(r"^(\d{4})-(\d{2})$")
+
+
+class ScenarioError(Exception):
+    """Invalid scenario; `errors` lists every problem found."""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+@dataclass
+class TaxOverride:
+    """Changes one tax type; None fields are left as they are."""
+    tax_type: TaxType
+    amount: Decimal = None
+    factor: Decimal = None
+    distribution_type: str = None
+    meter_type: str = None
+    remove: bool = False
+
+    def apply(self, tax_type):
+        """Copy of tax_type with the distribution changes of this override."""
+        tax_type = copy.copy(tax_type)
+        if self.distribution_type is not None:
+            tax_type.distribution_type = self.distribution_type
+            if self.distribution_type != "proportional":
+                tax_type.meter_type = None
+        if self.meter_type is not None:
+            tax_type.meter_type = self.meter_type or None
+        return tax_type
+
+
+@dataclass
+class SimulationResult:
+    association: object
+    periods: list = field(default_factory=list)
+    customers: list = field(default_factory=list)
+    wall_time: float = 0.0
+
+    def as_dict(self):
+        simulated = sum((p["simulated"] for p in self.periods), ZERO)
+        issued = sum((p["issued"] for p in self.periods), ZERO)
+        return {
+            "association": {"id": self.association.id, "name": self.association.name},
+            "simulated": simulated,
+            "issued": issued,
+            "difference": simulated - issued,
+            "periods": self.periods,
+            "customers": self.customers,
+            "wall_time": self.wall_time,
+        }
+
+
+def _decimal(value, label, errors):
+    try:
+        number = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        errors.append(f"{label}: netinkamas skaičius {value!r}")
+        return None
+    if not number.is_finite() or number < 0 or number >= MAX_TAX_AMOUNT:
+        errors.append(f"{label}: netinkama reikšmė {value!r}")
+        return None
+    return number
+
+
+def _parse_override(raw, tax_types, association, label, errors):
+    if not isinstance(raw, dict):
+        errors.append(f"{label}: turi būti objektas")
+        return None
+    error_count = len(errors)
+
+    if raw.get("tax_type"):
+        tax_type = tax_types.get(str(raw["tax_type"]))
+        if tax_type is None:
+            errors.append(f"{label}: bendrija neturi mokesčio tipo {raw['tax_type']}")
+            return None
+    elif raw.get("name"):
+        # naujas (neišsaugotas) mokesčio tipas – tik scenarijui
+        tax_type = TaxType(
+            association=association, name=str(raw["name"])[:100], distribution_type=raw.get("distribution_type"),
+            currency=raw.get("currency") or "eur",
+        )
+    else:
+        errors.append(f"{label}: nurodykite tax_type arba name")
+        return None
+
+    override = TaxOverride(
+        tax_type=tax_type,
+        distribution_type=raw.get("distribution_type"),
+        meter_type=raw.get("meter_type"),
+        remove=bool(raw.get("remove")),
+    )
+    changed = override.apply(tax_type)
+    if changed.distribution_type not in DISTRIBUTION_STRATEGIES:
+        errors.append(f"{label}: nežinomas paskirstymo būdas {changed.distribution_type!r}")
+    else:
+        try:
+            # tos pačios taisyklės, kaip išsaugant TaxType
+            changed.clean_fields(exclude=["association", "description"])
+            changed.clean()
+        except ValidationError as exc:
+            errors += [f"{label}: {name}: {' '.join(messages)}" for name, messages in exc.message_dict.items()]
+
+    if raw.get("amount") is not None:
+        amount = _decimal(raw["amount"], f"{label}.amount", errors)
+        override.amount = amount.quantize(CENT) if amount is not None else None
+    if raw.get("factor") is not None:
+        override.factor = _decimal(raw["factor"], f"{label}.factor", errors)
+    if override.amount is not None and override.factor is not None:
+        errors.append(f"{label}: amount ir factor kartu negalimi")
+    if tax_type._state.adding and override.amount is None and not override.remove:
+        errors.append(f"{label}: naujam mokesčiui reikia amount")
+    return override if len(errors) == error_count else None
+
+
+def _parse_overrides(raw, tax_types, association, label, errors):
+    if raw is None:
+        return []
+    if not isinstance(raw, list):
+        errors.append(f"{label}: turi būti sąrašas")
+        return []
+    overrides = [_parse_override(item, tax_types, association, f"{label}[{i}]", errors) for i, item in enumerate(raw)]
+    return [override for override in overrides if override is not None]
+
+
+def parse_scenario(association, data):
+    """
+    Validates a scenario and returns [(Period, [TaxOverride, ...]), ...]
+    ordered by period. Raises ScenarioError listing every problem.
+    """
+    errors = []
+    if not isinstance(data, dict):
+        raise ScenarioError(["scenarijus turi būti JSON objektas"])
+    raw_periods = data.get("periods")
+    if not isinstance(raw_periods, list) or not raw_periods:
+        raise ScenarioError(["periods: nurodykite bent vieną periodą"])
+    if len(raw_periods) > MAX_SIMULATED_PERIODS:
+        raise ScenarioError([f"periods: ne daugiau kaip {MAX_SIMULATED_PERIODS} periodų"])
+
+    tax_types = {str(t.id): t for t in TaxType.objects.filter(association=association)}
+    shared = _parse_overrides(data.get("taxes"), tax_types, association, "taxes", errors)
+
+    wanted = {}
+    for i, raw in enumerate(raw_periods):
+        label = f"periods[{i}]"
+        key, own = (raw.get("period"), raw.get("taxes")) if isinstance(raw, dict) else (raw, None)
+        match = _PERIOD.match(str(key or ""))
+        if not match:
+            errors.append(f"{label}: periodas turi būti YYYY-MM")
+            continue
+        year, month = int(match[1]), int(match[2])
+        if (year, month) in wanted:
+            errors.append(f"{label}: periodas {key} kartojasi")
+            continue
+        wanted[(year, month)] = shared + _parse_overrides(own, tax_types, association, f"{label}.taxes", errors)
+
+    query = Q(pk__in=[])
+    for year, month in wanted:
+        query |= Q(year=year, month=month)
+    periods = {(p.year, p.month): p for p in Period.objects.filter(query)}
+    for year, month in wanted.keys() - periods.keys():
+        errors.append(f"periodo {year}-{month:02d} nėra")
+
+    if errors:
+        raise ScenarioError(errors)
+    return [(periods[key], overrides) for key, overrides in sorted(wanted.items())]
+
+
+def hypothetical_taxes(context, overrides):
+    """Unsaved PeriodTax copies of the context with the overrides applied; cached objects are not changed."""
+    taxes = {pt.tax_type_id: pt for pt in context.period_taxes}
+    for override in overrides:
+        tax_type = override.tax_type
+        current = taxes.get(tax_type.id)
+        if override.remove:
+            taxes.pop(tax_type.id, None)
+            continue
+        if current is None:
+            if override.amount is None:
+                continue  # factor keičia tik esamus mokesčius
+            taxes[tax_type.id] = PeriodTax(
+                association=context.association, period=context.period,
+                tax_type=override.apply(tax_type), amount=override.amount,
+            )
+            continue
+
+        pt = copy.copy(current)
+        if override.amount is not None:
+            pt.amount = override.amount
+        elif override.factor is not None:
+            pt.amount = (pt.amount * override.factor).quantize(CENT)
+        pt.tax_type = override.apply(current.tax_type)
+        taxes[tax_type.id] = pt
+    return list(taxes.values())
+
+
+def _issued(association, periods):
+    """Latest invoice per (period, customer) and its per-tax-type totals, in two queries."""
+    invoices = {}
+    rows = Invoice.objects.filter(customer__association=association, period__in=periods).order_by(
+        "period_id", "customer_id", "-created_at"
+    ).values_list("id", "period_id", "customer_id", "total_amount")
+    for invoice_id, period_id, customer_id, total in rows:
+        invoices.setdefault((period_id, customer_id), (invoice_id, total))
+
+    latest = {invoice_id: key[0] for key, (invoice_id, _) in invoices.items()}
+    per_tax = defaultdict(lambda: ZERO)
+    items = InvoiceItem.objects.filter(
+        invoice__customer__association=association, invoice__period__in=periods
+    ).values("invoice_id", "period_tax__tax_type_id").annotate(total=Sum("total")).order_by()
+    for row in items:
+        period_id = latest.get(row["invoice_id"])
+        if period_id is not None:
+            # SQLite SUM grąžina slankiojo kablelio reikšmę
+            per_tax[(period_id, row["period_tax__tax_type_id"])] += row["total"].quantize(CENT)
+    return invoices, per_tax
+
+
+def simulate(association, scenario, only_changed=False):
+    """
+    Runs a scenario (see the module docstring) and returns a SimulationResult.
+
+    Period rows hold the hypothetical supplier amounts and the simulated,
+    issued and difference totals overall and per tax type. Customer rows hold
+    the same totals per period; only_changed drops customers whose simulated
+    totals equal their issued invoices in every period.
+    """
+    started = time.perf_counter()
+    plan = parse_scenario(association, scenario)
+    periods = [period for period, _ in plan]
+    meter_types = {override.meter_type for _, overrides in plan for override in overrides if override.meter_type}
+    inputs = load_period_inputs(association, periods, meter_types, readings=False)
+    invoices, issued_per_tax = _issued(association, periods)
+
+    result = SimulationResult(association=association)
+    customers = {}
+    for period, overrides in plan:
+        context = BillingContext(association, period, inputs[period.id])
+        period_taxes = hypothetical_taxes(context, overrides)
+        allocation = context.with_period_taxes(period_taxes).allocation
+
+        simulated_per_tax = defaultdict(lambda: ZERO)
+        tax_type_of = {pt.id: pt.tax_type_id for pt in period_taxes}
+        period_row = {"period": str(period), "period_id": period.id, "simulated": ZERO, "issued": ZERO}
+        for customer in context.customers:
+            shares = allocation.shares.get(customer.id, {})
+            for pt_id, share in shares.items():
+                simulated_per_tax[tax_type_of[pt_id]] += share
+            simulated = sum(shares.values(), ZERO)
+            issued = invoices.get((period.id, customer.id), (None, None))[1]
+            if not shares and issued is None:
+                continue
+
+            row = customers.get(customer.id)
+            if row is None:
+                row = customers[customer.id] = {
+                    "customer_id": customer.id, "full_name": customer.full_name,
+                    "simulated": ZERO, "issued": ZERO, "periods": {},
+                }
+            row["periods"][str(period)] = {
+                "simulated": simulated, "issued": issued, "difference": simulated - (issued or ZERO),
+            }
+            row["simulated"] += simulated
+            row["issued"] += issued or ZERO
+            period_row["simulated"] += simulated
+            period_row["issued"] += issued or ZERO
+
+        taxes = []
+        for pt in sorted(period_taxes, key=lambda pt: pt.tax_type.name):
+            tax_type = pt.tax_type
+            issued = issued_per_tax.get((period.id, tax_type.id), ZERO)
+            taxes.append({
+                "tax_type_id": None if tax_type._state.adding else tax_type.id,
+                "name": tax_type.name,
+                "distribution_type": tax_type.distribution_type,
+                "meter_type": tax_type.meter_type,
+                "amount": pt.amount,
+                "simulated": simulated_per_tax[tax_type.id],
+                "issued": issued,
+                "difference": simulated_per_tax[tax_type.id] - issued,
+            })
+        # išrašytos sąskaitos eilutės mokesčių, kurių scenarijuje nebeliko
+        removed = {tax_type_id for period_id, tax_type_id in issued_per_tax if period_id == period.id}
+        original = {pt.tax_type_id: pt.tax_type for pt in context.period_taxes}
+        for tax_type_id in removed - set(tax_type_of.values()):
+            tax_type, issued = original.get(tax_type_id), issued_per_tax[(period.id, tax_type_id)]
+            taxes.append({
+                "tax_type_id": tax_type_id,
+                "name": tax_type.name if tax_type else None,
+                "distribution_type": tax_type.distribution_type if tax_type else None,
+                "meter_type": tax_type.meter_type if tax_type else None,
+                "amount": ZERO, "simulated": ZERO, "issued": issued, "difference": -issued,
+            })
+
+        period_row.update(
+            supplier_amount=sum((pt.amount for pt in period_taxes), ZERO),
+            difference=period_row["simulated"] - period_row["issued"],
+            taxes=taxes,
+        )
+        result.periods.append(period_row)
+
+    for row in customers.values():
+        row["difference"] = row["simulated"] - row["issued"]
+        if only_changed and not any(p["difference"] for p in row["periods"].values()):
+            continue
+        result.customers.append(row)
+
+    result.wall_time = time.perf_counter() - started
+    return result
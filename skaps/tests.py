@@ -1,3 +1,1364 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+import zipfile
+import zlib
+from unittest import mock
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.contrib.auth.models import User
+from django.http import Http404, HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import ResolverMatch, reverse
+from django.utils import timezone
+
+from . import async_views
+from .anomalies import detect_anomalies
+from .benchmarks import (
+    api_comparison, compare, dataset_periods, generate_dataset, memory_growth, profile_export, run_benchmarks
+)
+from .billing import BillingContext, generate_association_invoices, generate_invoice
+from .consumption import rebuild_consumption
+from .distribution import allocate, largest_remainder
+from .exports import TABULAR_EXPORTS, export_period_invoices, shared_pool
+from .importers import import_readings
+from .instrumentation import metrics
+from .ledger import balance_history, current_balance, post_entry
+from .jobs import STALE_AFTER, enqueue_invoice_job, run_pending_jobs
+from .loadtest import load
+from .middleware import QueryMetricsMiddleware
+from .pagination import paginate
+from .pdf import PDFDocument
+from .read_models import InvoiceDocument
+from .rebilling import recompute_stale_invoices
+from .simulation import simulate
+from .models import (
+    Association, Customer, Meter, MeterReading, Period, PeriodTax, TaxType, MeterConsumption, ConsumptionTotal,
+    BalanceSnapshot, LedgerEntry, MeterStats, PeriodRollup, ReadingAnomaly, TaxRollup,
+    Invoice, InvoiceItem, InvoiceJob,
+)
+
+
+class BillingTestMixin:
+    """Small association: three flats, one water meter each, four tax types."""
+
+    def setUp(self):
+        self.association = Association.objects.create(name="Bendrija")
+        self.prev_period = Period.objects.create(year=2025, month=10)
+        self.period = Period.objects.create(year=2025, month=11)
+
+        self.customers = []
+        for i, (area, prev_value, value) in enumerate([(50, 100, 110), (30, 200, 215), (20, 300, 325)]):
+            customer = Customer.objects.create(
+                association=self.association, full_name=f"Klientas {i}", floor_area=Decimal(area)
+            )
+            meter = Meter.objects.create(customer=customer, meter_type="water", ser_num=f"W{i}")
+            MeterReading.objects.create(meter=meter, period=self.prev_period, value=Decimal(prev_value))
+            MeterReading.objects.create(meter=meter, period=self.period, value=Decimal(value))
+            self.customers.append(customer)
+
+        for name, distribution_type, meter_type, amount in [
+            ("Vanduo", "proportional", "water", "100.00"),
+            ("Administravimas", "fixed", None, "5.00"),
+            ("Šildymas", "by_area", None, "200.00"),
+            ("Valymas", "equal_split", None, "30.00"),
+        ]:
+            tax_type = TaxType.objects.create(
+                association=self.association, name=name,
+                distribution_type=distribution_type, meter_type=meter_type,
+            )
+            PeriodTax.objects.create(
+                association=self.association, tax_type=tax_type, period=self.period, amount=Decimal(amount)
+            )
+
+
+class AssociationBillingTests(BillingTestMixin, TestCase):
+
+    def test_batch_run_matches_single_customer_invoices(self):
+        run = generate_association_invoices(self.association, self.period)
+
+        self.assertEqual(len(run.invoices), 3)
+        self.assertGreater(run.queries, 0)
+        batch_totals = {inv.customer_id: inv.total_amount for inv in run.invoices}
+
+        for customer in self.customers:
+            single = generate_invoice(customer, self.period)
+            self.assertEqual(single.total_amount, batch_totals[customer.id])
+
+    def test_batch_run_shares_sum_to_period_tax(self):
+        run = generate_association_invoices(self.association, self.period)
+
+        total = sum(inv.total_amount for inv in run.invoices)
+        # 100 + 3 * 5 + 200 + 30
+        self.assertEqual(total, Decimal("345.00"))
+
+    def test_batch_run_query_count_does_not_grow_with_customers(self):
+        run = generate_association_invoices(self.association, self.period)
+
+        for i in range(10):
+            customer = Customer.objects.create(association=self.association, full_name=f"Naujas {i}")
+            meter = Meter.objects.create(customer=customer, meter_type="water")
+            MeterReading.objects.create(meter=meter, period=self.prev_period, value=Decimal(0))
+            MeterReading.objects.create(meter=meter, period=self.period, value=Decimal(1))
+
+        Invoice.objects.all().delete()
+        bigger_run = generate_association_invoices(self.association, self.period)
+        self.assertEqual(len(bigger_run.invoices), 13)
+        self.assertEqual(bigger_run.queries, run.queries)
+
+
+class InvoiceJobTests(BillingTestMixin, TestCase):
+
+    def test_association_job_runs_off_the_request_path(self):
+        url = reverse("generate_association_invoices", args=[self.association.id, self.period.id])
+        response = self.client.post(url)
+        job = InvoiceJob.objects.get()
+        self.assertRedirects(response, reverse("invoice_job", args=[job.id]))
+        self.assertEqual(job.status, "pending")
+        self.assertFalse(Invoice.objects.exists())
+
+        # pakartotinis paspaudimas nesukuria antros užduoties
+        self.client.post(url)
+        self.assertEqual(InvoiceJob.objects.count(), 1)
+
+        run_pending_jobs()
+
+        status = self.client.get(reverse("invoice_job_status", args=[job.id])).json()
+        self.assertEqual(status["status"], "done")
+        self.assertEqual((status["progress_done"], status["progress_total"]), (3, 3))
+        self.assertEqual(Invoice.objects.count(), 3)
+        self.assertContains(self.client.get(reverse("invoice_job", args=[job.id])), "Klientų: 3/3")
+
+    def test_stale_job_reruns_without_rewriting_committed_invoices(self):
+        # pirmoji dalis įrašyta prieš darbuotojui nutrūkstant
+        context = BillingContext(self.association, self.period)
+        committed = [generate_invoice(customer, self.period, context) for customer in self.customers[:2]]
+        # po avarijos neapmokestintas klientas pervadinamas ir rikiuojamas pirmas
+        late = self.customers[2]
+        Customer.objects.filter(id=late.id).update(full_name="Aaa")
+        job = InvoiceJob.objects.create(
+            association=self.association, period=self.period, status="running",
+            progress_done=2, heartbeat_at=timezone.now() - STALE_AFTER - timedelta(seconds=1),
+        )
+
+        run_pending_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("done", 1))
+        self.assertEqual((job.progress_done, job.progress_total, job.invoices_created), (3, 3, 3))
+        self.assertEqual(Invoice.objects.count(), 3)
+        self.assertTrue(Invoice.objects.filter(customer=late).exists())
+        for invoice in committed:
+            self.assertEqual(Invoice.objects.get(customer=invoice.customer_id).updated_at, invoice.updated_at)
+
+    def test_job_checks_and_estimates_readings_like_the_command(self):
+        MeterReading.objects.filter(meter__customer=self.customers[0], period=self.period).update(
+            value=90, updated_at=timezone.now()
+        )
+        rebuild_consumption(self.association)
+        job = enqueue_invoice_job(self.association, self.period, estimate=True)
+
+        run_pending_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.anomalies, job.estimated), ("done", 1, 0))
+        response = self.client.get(reverse("invoice_job", args=[job.id]))
+        self.assertContains(response, "Įtartinų šio periodo rodmenų: 1")
+
+    def test_customer_job_redirects_to_invoice(self):
+        customer = self.customers[0]
+        response = self.client.get(reverse("generate_invoice", args=[customer.id, self.period.id]))
+        job = InvoiceJob.objects.get()
+        self.assertRedirects(response, reverse("invoice_job", args=[job.id]))
+
+        run_pending_jobs()
+
+        status = self.client.get(reverse("invoice_job_status", args=[job.id])).json()
+        invoice = Invoice.objects.get(customer=customer)
+        self.assertEqual(status["redirect_url"], reverse("invoice_detail", args=[customer.id, invoice.id]))
+
+
+class IdempotentInvoiceTests(BillingTestMixin, TestCase):
+
+    def test_regeneration_without_changes_writes_nothing(self):
+        customer = self.customers[0]
+        invoice = generate_invoice(customer, self.period)
+
+        with CaptureQueriesContext(connection) as ctx:
+            again = generate_invoice(customer, self.period)
+
+        self.assertEqual(again.id, invoice.id)
+        self.assertFalse([q for q in ctx.captured_queries if not q["sql"].startswith("SELECT")])
+        self.assertEqual(Invoice.objects.count(), 1)
+
+    def test_unchanged_rebill_clears_stale_flag(self):
+        invoice = generate_invoice(self.customers[0], self.period)
+        Invoice.objects.filter(id=invoice.id).update(is_stale=True)
+
+        again = generate_invoice(self.customers[0], self.period)
+
+        self.assertEqual(again.id, invoice.id)
+        self.assertFalse(again.is_stale)
+        self.assertFalse(Invoice.objects.get(id=invoice.id).is_stale)
+
+    def test_changed_inputs_replace_items_in_place(self):
+        customer = self.customers[0]
+        invoice = generate_invoice(customer, self.period)
+        old_items = dict(invoice.items.values_list("id", "updated_at"))
+
+        period_tax = PeriodTax.objects.get(tax_type__distribution_type="fixed")
+        period_tax.amount = Decimal("7.00")
+        period_tax.save()
+        again = generate_invoice(customer, self.period)
+
+        self.assertEqual((again.id, again.number), (invoice.id, invoice.number))
+        self.assertEqual(again.total_amount, invoice.total_amount + 2)
+        self.assertEqual(Invoice.objects.count(), 1)
+
+        # perrašoma tik pasikeitusi eilutė
+        new_items = dict(again.items.values_list("id", "updated_at"))
+        self.assertEqual(new_items.keys(), old_items.keys())
+        changed = [item_id for item_id in new_items if new_items[item_id] != old_items[item_id]]
+        self.assertEqual(
+            list(InvoiceItem.objects.filter(id__in=changed).values_list("total", flat=True)), [Decimal("7.00")]
+        )
+
+    def test_cent_moved_by_other_customers_is_rebilled(self):
+        PeriodTax.objects.filter(tax_type__name="Valymas").update(amount=Decimal("10.00"))
+        generate_association_invoices(self.association, self.period)
+        cleaning = InvoiceItem.objects.filter(period_tax__tax_type__name="Valymas")
+        self.assertEqual(cleaning.get(invoice__customer=self.customers[0]).total, Decimal("3.34"))
+
+        # lygius likučius lemia vardų tvarka – centas atitenka kitam klientui
+        self.customers[2].full_name = "Aaa"
+        self.customers[2].save()
+        generate_association_invoices(self.association, self.period)
+
+        self.assertEqual(cleaning.get(invoice__customer=self.customers[0]).total, Decimal("3.33"))
+        self.assertEqual(cleaning.get(invoice__customer=self.customers[2]).total, Decimal("3.34"))
+        self.assertEqual(sum(cleaning.values_list("total", flat=True)), Decimal("10.00"))
+
+
+class IncrementalRebillingTests(BillingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        generate_association_invoices(self.association, self.period)
+
+    def test_late_reading_marks_and_patches_only_moved_rows(self):
+        meter = self.customers[0].meters.get()
+        reading = MeterReading.objects.get(meter=meter, period=self.period)
+        reading.value = Decimal(120)
+        reading.save()
+
+        self.assertEqual(Invoice.objects.filter(is_stale=True).count(), 3)
+        fixed_before = dict(
+            InvoiceItem.objects.filter(period_tax__tax_type__distribution_type="fixed").values_list("id", "updated_at")
+        )
+
+        drafts = recompute_stale_invoices(self.association, self.period)
+
+        self.assertEqual({d.action for d in drafts}, {"replace"})
+        self.assertFalse(Invoice.objects.filter(is_stale=True).exists())
+        fixed_after = dict(
+            InvoiceItem.objects.filter(period_tax__tax_type__distribution_type="fixed").values_list("id", "updated_at")
+        )
+        self.assertEqual(fixed_after, fixed_before)
+        water = InvoiceItem.objects.get(meter=meter)
+        self.assertEqual((water.consumed, water.reading_id), (Decimal(20), reading.id))
+        self.assertEqual(sum(InvoiceItem.objects.filter(meter__isnull=False).values_list("total", flat=True)), 100)
+
+    def test_floor_area_change_marks_latest_period(self):
+        customer = self.customers[0]
+        customer.floor_area = Decimal(60)
+        customer.save()
+
+        self.assertEqual(Invoice.objects.filter(is_stale=True).count(), 3)
+        recompute_stale_invoices(self.association, self.period)
+        item = InvoiceItem.objects.get(invoice__customer=customer, period_tax__tax_type__distribution_type="by_area")
+        self.assertEqual((item.floor_area, item.total), (Decimal(60), Decimal("109.09")))
+
+
+class ReadingImportTests(BillingTestMixin, TestCase):
+
+    def test_import_upserts_and_reports_row_errors(self):
+        december = Period.objects.create(year=2025, month=12)
+        data = (
+            "ser_num;year;month;value\n"
+            "W0;2025;11;111\n"      # atnaujinamas esamas rodmuo
+            "W1;2025;12;220\n"      # naujas rodmuo
+            "W2;2025;12;300\n"      # mažesnis už lapkričio 325
+            "X9;2025;12;1\n"        # nežinomas skaitiklis
+        ).encode()
+
+        result = import_readings(io.BytesIO(data), "readings.csv", association=self.association)
+
+        self.assertEqual((result.rows, result.upserted, result.error_count), (4, 2, 2))
+        self.assertEqual([line for line, _ in result.errors], [4, 5])
+        self.assertEqual(MeterReading.objects.get(meter__ser_num="W0", period=self.period).value, Decimal(111))
+        self.assertEqual(MeterConsumption.objects.get(meter__ser_num="W1", period=december).consumed, Decimal(5))
+
+    def test_import_checks_next_reading_and_ambiguous_serial_numbers(self):
+        other = Association.objects.create(name="Kita")
+        twin = Meter.objects.create(
+            customer=Customer.objects.create(association=other, full_name="Kitas"), meter_type="water", ser_num="W1"
+        )
+        data = (
+            "ser_num,year,month,value\n"
+            "W0,2025,10,120\n"     # didesnis už lapkričio 110
+            "W1,2025,10,201\n"     # W1 yra dviejose bendrijose
+        ).encode()
+
+        result = import_readings(io.BytesIO(data), "readings.csv")
+
+        self.assertEqual(result.upserted, 0)
+        self.assertIn("didesnis už vėlesnį (110.00)", result.errors[0][1])
+        self.assertIn("Keli skaitikliai turi numerį 'W1'", result.errors[1][1])
+        # bendrijos ribose numeris vienareikšmis
+        result = import_readings(io.BytesIO(b"ser_num,year,month,value\nW1,2025,10,201\n"), "r.csv",
+                                 association=self.association)
+        self.assertEqual((result.upserted, result.errors), (1, []))
+        self.assertFalse(twin.readings.exists())
+
+    def test_import_marks_only_affected_invoices_stale(self):
+        gas = Meter.objects.create(customer=self.customers[0], meter_type="gas", ser_num="G0")
+        generate_association_invoices(self.association, self.period)
+
+        import_readings(io.BytesIO(b"ser_num,year,month,value\nG0,2025,11,5\n"), "r.csv")
+
+        self.assertEqual(list(Invoice.objects.filter(is_stale=True).values_list("customer", flat=True)),
+                         [gas.customer_id])
+
+    def test_upload_view_shows_result(self):
+        upload = SimpleUploadedFile("r.csv", b"ser_num,year,month,value\nW0,2025,11,112\n")
+        response = self.client.post(reverse("import_meter_readings", args=[self.association.id]), {"file": upload})
+        self.assertContains(response, "Eilučių: 1, įrašyta: 1, klaidų: 0")
+
+
+class ConsumptionLedgerTests(BillingTestMixin, TestCase):
+
+    def test_ledger_follows_reading_changes(self):
+        meter = self.customers[0].meters.get()
+        row = MeterConsumption.objects.get(meter=meter, period=self.period)
+        self.assertEqual((row.start_value, row.end_value, row.consumed), (100, 110, 10))
+
+        reading = MeterReading.objects.get(meter=meter, period=self.prev_period)
+        reading.value = Decimal(105)
+        reading.save()
+
+        row.refresh_from_db()
+        self.assertEqual((row.start_value, row.consumed), (105, 5))
+        total = ConsumptionTotal.objects.get(association=self.association, meter_type="water", period=self.period)
+        self.assertEqual(total.consumed, Decimal(45))
+
+        reading.delete()
+        row.refresh_from_db()
+        self.assertIsNone(row.start_value)
+        self.assertEqual(row.consumed, 0)
+
+    def test_previous_period_crosses_january(self):
+        december = Period.objects.create(year=2024, month=12)
+        january = Period.objects.create(year=2025, month=1)
+        meter = self.customers[0].meters.get()
+        MeterReading.objects.create(meter=meter, period=december, value=Decimal(40))
+        MeterReading.objects.create(meter=meter, period=january, value=Decimal(55))
+
+        self.assertEqual(january.previous_period(), december)
+        row = MeterConsumption.objects.get(meter=meter, period=january)
+        self.assertEqual(row.consumed, Decimal(15))
+
+    def test_rebuild_matches_incremental_ledger(self):
+        def snapshot():
+            return (
+                sorted(MeterConsumption.objects.values_list("meter_id", "period_id", "start_value", "consumed")),
+                sorted(ConsumptionTotal.objects.values_list("meter_type", "period_id", "start_total", "consumed")),
+            )
+
+        incremental = snapshot()
+        rebuild_consumption(self.association)
+        self.assertEqual(snapshot(), incremental)
+
+    def test_readings_carry_association_type_and_ordinal(self):
+        reading = MeterReading.objects.get(meter__customer=self.customers[0], period=self.period)
+        self.assertEqual(
+            (reading.association_id, reading.meter_type, reading.period_ordinal),
+            (self.association.id, "water", 2025 * 12 + 11),
+        )
+        with CaptureQueriesContext(connection) as queries:
+            rebuild_consumption(self.association)
+        reading_sql = [q["sql"] for q in queries.captured_queries if 'FROM "skaps_meterreading"' in q["sql"]]
+        self.assertTrue(reading_sql)
+        self.assertTrue(all("JOIN" not in sql for sql in reading_sql))
+
+    def test_meter_move_resyncs_readings_and_totals(self):
+        other = Association.objects.create(name="Kita")
+        newcomer = Customer.objects.create(association=other, full_name="Naujas")
+        meter = self.customers[0].meters.get()
+        meter.customer = newcomer
+        meter.save()
+
+        self.assertEqual(set(meter.readings.values_list("association_id", flat=True)), {other.id})
+        moved = ConsumptionTotal.objects.get(association=other, meter_type="water", period=self.period)
+        self.assertEqual(moved.consumed, Decimal(10))
+        remaining = ConsumptionTotal.objects.get(association=self.association, meter_type="water", period=self.period)
+        self.assertEqual(remaining.consumed, Decimal(40))
+
+        newcomer.association = self.association
+        newcomer.save()
+        self.assertEqual(set(meter.readings.values_list("association_id", flat=True)), {self.association.id})
+
+
+class AnomalyDetectionTests(BillingTestMixin, TestCase):
+
+    def add_history(self, ser_num, values, start=0):
+        """Bulk-inserted readings (no signals) from 2000-01 + start months on; None skips a month."""
+        meter = Meter.objects.create(customer=self.customers[0], meter_type="electricity", ser_num=ser_num)
+        periods = dataset_periods(start + len(values))[start:]
+        MeterReading.objects.bulk_create(
+            MeterReading(meter=meter, period=period, value=Decimal(value))
+            .denormalize(self.association.id, meter.meter_type, period)
+            for period, value in zip(periods, values) if value is not None
+        )
+        return meter
+
+    def flags(self, meter):
+        return [(str(a.period), a.kind) for a in ReadingAnomaly.objects.filter(meter=meter).order_by("period_ordinal")]
+
+    def test_history_is_checked_in_one_pass(self):
+        steady = [1000 + 100 * i for i in range(12)]
+        meter = self.add_history("E1", steady + [3000, 3100, 3050, None, 3250])
+        rollover = self.add_history("E2", [99700, 99800, 99900, 50])
+
+        run = detect_anomalies(self.association.id)
+        self.assertEqual(run.readings_scanned, 16 + 4)
+        self.assertEqual(self.flags(meter), [("2001-01", "spike"), ("2001-03", "decrease"), ("2001-05", "gap")])
+        self.assertEqual(self.flags(rollover), [("2000-04", "rollover")])
+        spike = ReadingAnomaly.objects.get(meter=meter, kind="spike")
+        self.assertEqual((spike.consumed, spike.expected), (Decimal(900), Decimal(100)))
+        stats = MeterStats.objects.get(meter=meter)
+        # šuolis ir sumažėjimas į vidurkį neįtraukti, tarpas – po 100 per mėnesį
+        self.assertEqual((stats.samples, stats.mean, stats.last_value), (13, 100.0, Decimal(3250)))
+
+    def test_customer_move_carries_stats_and_anomalies(self):
+        meter = self.add_history("E4", [1000 + 100 * i for i in range(12)] + [3000])
+        detect_anomalies(self.association.id)
+        # nauja bendrija perskaičiuojama pirma – senoji nebeturi rodmenų ir ištrintų neperkeltą statistiką
+        other = Association.objects.create(name="Aaa")
+        customer = meter.customer
+        customer.association = other
+        customer.save()
+
+        self.assertEqual(MeterStats.objects.get(meter=meter).association_id, other.id)
+        self.assertEqual(set(ReadingAnomaly.objects.filter(meter=meter).values_list("association_id", flat=True)),
+                         {other.id})
+
+    def test_spikes_follow_the_monthly_profile(self):
+        # žiemą (gruodis–vasaris) suvartojama triskart daugiau
+        usage = [300 if month in (12, 1, 2) else 100 for _ in range(3) for month in range(1, 13)]
+        values = [1000]
+        for consumed in usage[1:]:
+            values.append(values[-1] + consumed)
+        meter = self.add_history("E3", values + [values[-1] + 300, values[-1] + 600, values[-1] + 900])
+
+        detect_anomalies(self.association.id)
+        # 300 sausį ir vasarį – įprasta, kovą – šuolis
+        self.assertEqual(self.flags(meter), [("2003-03", "spike")])
+
+    def test_only_changed_readings_are_scanned(self):
+        meter = self.add_history("E4", [1000 + 100 * i for i in range(12)])
+        detect_anomalies(self.association.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(detect_anomalies(self.association.id).readings_scanned, 0)
+
+        period = dataset_periods(13)[-1]
+        MeterReading.objects.bulk_create([
+            MeterReading(meter=meter, period=period, value=Decimal(5000))
+            .denormalize(self.association.id, meter.meter_type, period)
+        ])
+        run = detect_anomalies(self.association.id)
+        self.assertEqual((run.meters_extended, run.meters_rescanned, run.readings_scanned), (1, 0, 1))
+        self.assertEqual(self.flags(meter), [("2001-01", "spike")])
+
+        MeterReading.objects.filter(meter=meter, period__year=2000, period__month=3).update(
+            value=Decimal(900), updated_at=timezone.now()
+        )
+        run = detect_anomalies(self.association.id)
+        self.assertEqual((run.meters_extended, run.meters_rescanned, run.readings_scanned), (0, 1, 13))
+        self.assertEqual(self.flags(meter), [("2000-03", "decrease"), ("2001-01", "spike")])
+
+    def test_saved_readings_are_flagged_before_billing(self):
+        reading = MeterReading.objects.get(meter__ser_num="W0", period=self.period)
+        reading.value = Decimal(90)
+        reading.save()
+        self.assertEqual(self.flags(reading.meter), [("2025-11", "decrease")])
+
+        run = generate_association_invoices(self.association, self.period)
+        self.assertEqual(run.anomalies, 1)
+        response = self.client.get(reverse("meter_readings", args=[self.customers[0].id]))
+        self.assertContains(response, "Rodmuo sumažėjo")
+
+        reading.delete()
+        self.assertFalse(ReadingAnomaly.objects.exists())
+        self.assertEqual(MeterStats.objects.get(meter=reading.meter).last_ordinal, self.prev_period.ordinal)
+
+
+class EstimatedReadingTests(BillingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.december = Period.objects.create(year=2025, month=12)
+        self.january = Period.objects.create(year=2026, month=1)
+        water = TaxType.objects.get(name="Vanduo")
+        PeriodTax.objects.create(association=self.association, tax_type=water, period=self.december,
+                                 amount=Decimal("100.00"))
+        self.meters = [Meter.objects.get(ser_num=f"W{i}") for i in range(3)]
+        for meter, value in zip(self.meters[:2], (120, 230)):
+            MeterReading.objects.create(meter=meter, period=self.december, value=Decimal(value))
+        # naujas skaitiklis be suvartojimo istorijos neįvertinamas
+        fresh = Meter.objects.create(customer=self.customers[0], meter_type="electricity", ser_num="E9")
+        MeterReading.objects.create(meter=fresh, period=self.period, value=Decimal(7))
+
+    def test_missing_reading_is_estimated_and_billed(self):
+        run = generate_association_invoices(self.association, self.december, estimate=True)
+
+        self.assertEqual(run.estimated, 1)
+        reading = MeterReading.objects.get(meter=self.meters[2], period=self.december)
+        self.assertEqual((reading.value, reading.is_estimated, reading.estimated_value),
+                         (Decimal(350), True, Decimal(350)))
+        self.assertFalse(MeterReading.objects.filter(meter__ser_num="E9", period=self.december).exists())
+
+        item = InvoiceItem.objects.get(invoice__period=self.december, meter=self.meters[2])
+        self.assertEqual((item.consumed, item.is_estimated), (Decimal(25), True))
+        items = InvoiceItem.objects.filter(invoice__period=self.december, period_tax__tax_type__name="Vanduo")
+        self.assertEqual(sum(i.total for i in items), Decimal("100.00"))
+        self.assertEqual(sum(i.is_estimated for i in items), 1)
+        document = InvoiceDocument.for_invoice(item.invoice)
+        self.assertEqual(document.meter_lines[0].name, "Vanduo (įvertinta)")
+
+    def test_real_reading_is_trued_up_in_the_next_period(self):
+        generate_association_invoices(self.association, self.december, estimate=True)
+        invoice = Invoice.objects.get(customer=self.customers[2], period=self.december)
+
+        # tikrasis gruodžio rodmuo įrašomas vietoj įvertinto
+        response = self.client.post(reverse("add_meter_reading", args=[self.customers[2].id]), {
+            "meter": self.meters[2].id, "period": self.december.id, "value": "340",
+        })
+        self.assertRedirects(response, reverse("meter_readings", args=[self.customers[2].id]))
+        reading = MeterReading.objects.get(meter=self.meters[2], period=self.december)
+        self.assertEqual((reading.value, reading.is_estimated, reading.estimated_value),
+                         (Decimal(340), False, Decimal(350)))
+
+        # išrašyta sąskaita nesikeičia – periodas apmokestintas įvertinimu
+        self.assertEqual(MeterConsumption.objects.get(meter=self.meters[2], period=self.december).end_value,
+                         Decimal(350))
+        generate_association_invoices(self.association, self.december)
+        self.assertEqual(Invoice.objects.get(id=invoice.id).input_hash, invoice.input_hash)
+
+        # sausio rodmuo mažesnis už gruodžio įvertinimą + suvartojimą – ne klaida, o patikslinimas
+        result = import_readings(io.BytesIO(b"ser_num,year,month,value\nW2,2026,1,355\n"), "readings.csv")
+        self.assertEqual(result.errors, [])
+        january = MeterConsumption.objects.get(meter=self.meters[2], period=self.january)
+        self.assertEqual((january.start_value, january.consumed, january.is_estimated),
+                         (Decimal(350), Decimal(5), False))
+        self.assertFalse(ReadingAnomaly.objects.filter(meter=self.meters[2]).exists())
+
+
+class ApiTests(BillingTestMixin, TestCase):
+
+    def url(self, name, **kwargs):
+        return reverse(name, kwargs={"association_id": self.association.id, **kwargs})
+
+    def test_sparse_fields_and_cursor_pages(self):
+        url = self.url("api_v1_customers")
+        first = self.client.get(url, {"fields": "full_name,floor_area", "page_size": 2}).json()
+        self.assertEqual(first["data"], [
+            {"full_name": "Klientas 0", "floor_area": "50.00"}, {"full_name": "Klientas 1", "floor_area": "30.00"},
+        ])
+        second = self.client.get(url, {"fields": "full_name", "page_size": 2, "after": first["next"]}).json()
+        self.assertEqual((second["data"], second["next"]), ([{"full_name": "Klientas 2"}], None))
+
+        self.assertEqual(self.client.get(url, {"fields": "full_name,password"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"after": "blogas"}).status_code, 400)
+        missing = reverse("api_v1_customers", kwargs={"association_id": Period.objects.first().id})
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_list_revalidates_with_etag(self):
+        url = self.url("api_v1_readings")
+        response = self.client.get(url, {"meter_type": "water", "period_from": "2025-11"})
+        self.assertEqual(len(response.json()["data"]), 3)
+        self.assertEqual(response.json()["data"][0]["period"], "2025-11")
+
+        # 304: tik puslapio užklausa, be serializavimo
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, {"meter_type": "water", "period_from": "2025-11"},
+                                     HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+
+        reading = MeterReading.objects.get(meter__ser_num="W0", period=self.period)
+        reading.value = Decimal(111)
+        reading.save()
+        changed = self.client.get(url, {"meter_type": "water", "period_from": "2025-11"},
+                                  HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], response["ETag"])
+
+    def test_tax_type_change_changes_etag(self):
+        url = self.url("api_v1_period_taxes")
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+        tax_type = TaxType.objects.get(name="Valymas")
+        tax_type.name = "Laiptinės valymas"
+        tax_type.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], response["ETag"])
+        self.assertIn("Laiptinės valymas", [row["name"] for row in changed.json()["data"]])
+
+    def test_bulk_upsert_readings(self):
+        december = Period.objects.create(year=2025, month=12)
+        meter = Meter.objects.get(ser_num="W1")
+        payload = {"readings": [
+            {"ser_num": "W0", "period": "2025-12", "value": 118},
+            {"meter": str(meter.id), "year": 2025, "month": 12, "value": "230.5"},
+            {"ser_num": "W2", "period": "2025-12", "value": 1},
+            {"ser_num": "X9", "period": "2025-12", "value": 1},
+        ]}
+        url = self.url("api_v1_readings")
+        response = self.client.post(url, payload, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual((result["received"], result["upserted"]), (4, 2))
+        self.assertEqual([e["index"] for e in result["errors"]], [2, 3])
+        self.assertEqual(MeterConsumption.objects.get(meter=meter, period=december).consumed, Decimal("15.50"))
+
+        self.assertEqual(self.client.post(url, "ser_num=W0", content_type="text/plain").status_code, 415)
+        self.assertEqual(self.client.post(url, {"readings": {}}, content_type="application/json").status_code, 400)
+
+    def test_invoice_detail_with_items(self):
+        run = generate_association_invoices(self.association, self.period)
+        invoice = run.invoices[0]
+        url = self.url("api_v1_invoice", pk=invoice.id)
+        data = self.client.get(url, {"fields": "number,period,total_amount,items"}).json()["data"]
+        self.assertEqual((data["number"], data["period"]), (invoice.number, "2025-11"))
+        self.assertEqual(sum(Decimal(item["total"]) for item in data["items"]), Decimal(data["total_amount"]))
+
+        listed = self.client.get(self.url("api_v1_invoices"), {"fields": "number"}).json()["data"]
+        self.assertEqual(len(listed), 3)
+        self.assertNotIn("items", listed[0])
+        self.assertEqual(self.client.get(self.url("api_v1_invoice", pk=self.period.id)).status_code, 404)
+
+
+class DistributionTests(BillingTestMixin, TestCase):
+
+    def test_largest_remainder_keeps_the_total(self):
+        shares = largest_remainder(Decimal("100.00"), {"a": 1, "b": 1, "c": 1})
+        self.assertEqual(sorted(shares.values()), [Decimal("33.33"), Decimal("33.33"), Decimal("33.34")])
+
+    def test_largest_remainder_never_exceeds_the_amount(self):
+        # dalis suvartojimo be kliento – likutis nepaskirstomas
+        shares = largest_remainder(Decimal("100.00"), {"a": 1, "b": 1}, total_weight=4)
+        self.assertEqual(shares, {"a": Decimal("25.00"), "b": Decimal("25.00")})
+
+        with self.assertLogs("skaps.billing", level="WARNING"):
+            shares = largest_remainder(Decimal("100.00"), {"a": 1, "b": 2}, total_weight=1)
+        self.assertEqual(shares, {"a": Decimal("33.33"), "b": Decimal("66.67")})
+
+    def test_allocation_matrix_sums_to_period_tax_amounts(self):
+        for pt in PeriodTax.objects.all():
+            pt.amount = Decimal("100.01")
+            pt.save()
+
+        allocation = allocate(BillingContext(self.association, self.period))
+
+        for pt in PeriodTax.objects.select_related("tax_type"):
+            column = [row[pt.id] for row in allocation.shares.values()]
+            self.assertEqual(len(column), 3)
+            if pt.tax_type.distribution_type == "fixed":
+                self.assertEqual(set(column), {Decimal("100.01")})
+            else:
+                self.assertEqual(sum(column), Decimal("100.01"))
+
+
+class BillingCacheTests(BillingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+
+    def _context_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            context = BillingContext(self.association, self.period)
+        return context, len(ctx.captured_queries)
+
+    def test_second_context_is_served_from_cache(self):
+        first, cold = self._context_queries()
+        second, warm = self._context_queries()
+
+        # tik įvesčių versijos
+        self.assertEqual(warm, 1)
+        self.assertGreater(cold, warm)
+        self.assertEqual(second.total_consumption, first.total_consumption)
+        self.assertEqual(second.total_floor_area, Decimal(100))
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual((counters["billing_cache_miss"], counters["billing_cache_hit"]), (1, 1))
+
+    def test_period_tax_change_invalidates_only_its_period(self):
+        BillingContext(self.association, self.period)
+        BillingContext(self.association, self.prev_period)
+
+        period_tax = PeriodTax.objects.get(period=self.period, tax_type__name="Valymas")
+        period_tax.amount = Decimal("60.00")
+        period_tax.save()
+
+        self.assertGreater(self._context_queries()[1], 0)
+        with CaptureQueriesContext(connection) as ctx:
+            BillingContext(self.association, self.prev_period)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        run = generate_association_invoices(self.association, self.period)
+        self.assertEqual(sum(inv.total_amount for inv in run.invoices), Decimal("375.00"))
+
+    def test_changes_reach_another_process_cache(self):
+        # darbuotojo procesas turi savo locmem talpyklą, signalai suveikia žiniatinklio procese
+        worker_cache = LocMemCache("skaps-worker", {})
+        with mock.patch("skaps.billing_cache._cache", return_value=worker_cache):
+            BillingContext(self.association, self.period)
+
+        PeriodTax.objects.filter(period=self.period, tax_type__name="Valymas").get().delete()
+        Customer.objects.create(association=self.association, full_name="Naujas", floor_area=Decimal(10))
+
+        with mock.patch("skaps.billing_cache._cache", return_value=worker_cache):
+            context = BillingContext(self.association, self.period)
+        self.assertEqual((len(context.period_taxes), context.customer_count), (3, 4))
+
+    def test_reading_and_customer_changes_invalidate(self):
+        BillingContext(self.association, self.period)
+        reading = MeterReading.objects.get(meter__customer=self.customers[0], period=self.period)
+        reading.value = Decimal(120)
+        reading.save()
+        self.assertEqual(BillingContext(self.association, self.period).total_consumption["water"], Decimal(60))
+
+        Customer.objects.create(association=self.association, full_name="Naujas", floor_area=Decimal(10))
+        self.assertEqual(BillingContext(self.association, self.period).customer_count, 4)
+
+
+class InvoiceDetailTests(BillingTestMixin, TestCase):
+
+    def test_document_is_split_into_sections_with_footnotes(self):
+        TaxType.objects.filter(name__in=["Vanduo", "Šildymas"]).update(description="Pagal deklaraciją")
+        invoice = generate_invoice(self.customers[0], self.period)
+
+        with self.assertNumQueries(2):
+            document = InvoiceDocument.load(self.customers[0].id, invoice.id)
+
+        self.assertEqual(
+            [line.name.split(" (")[0] for line in document.community_lines], ["Administravimas", "Valymas", "Šildymas"]
+        )
+        self.assertEqual([line.name for line in document.meter_lines], ["Vanduo"])
+        self.assertEqual(document.meter_lines[0].unit, "m³")
+        self.assertEqual(document.community_lines[2].quantity_label, "× 50.00 m²")
+        self.assertEqual(document.footnotes, ["Pagal deklaraciją", "Pagal deklaraciją"])
+        self.assertEqual([line.footnote for line in document.community_lines + document.meter_lines],
+                         [None, None, 1, 2])
+
+    def test_query_count_does_not_grow_with_items(self):
+        customer = self.customers[0]
+        invoice = generate_invoice(customer, self.period)
+        url = reverse("invoice_detail", args=[customer.id, invoice.id])
+        with CaptureQueriesContext(connection) as few:
+            self.assertContains(self.client.get(url), "Skaitiklių sąnaudos")
+
+        for i in range(5):
+            meter = Meter.objects.create(customer=customer, meter_type="water", ser_num=f"X{i}")
+            MeterReading.objects.create(meter=meter, period=self.prev_period, value=Decimal(0))
+            MeterReading.objects.create(meter=meter, period=self.period, value=Decimal(i + 1))
+        invoice = generate_invoice(customer, self.period)
+        self.assertEqual(invoice.items.filter(consumed__gt=0).count(), 6)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(url)
+        self.assertEqual(len(many), len(few))
+
+
+class InvoiceCachingTests(BillingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.invoice = generate_invoice(self.customers[0], self.period)
+        self.url = reverse("invoice_detail", args=[self.customers[0].id, self.invoice.id])
+
+    def test_unchanged_invoice_returns_304(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        period_tax = PeriodTax.objects.get(tax_type__name="Administravimas")
+        period_tax.amount = Decimal("7.00")
+        period_tax.save()
+        generate_invoice(self.customers[0], self.period)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertContains(response, "7.00")
+
+    def test_rendered_fragments_are_reused(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(1):
+            second = self.client.get(self.url)
+        self.assertEqual(second.content, first.content)
+
+    def test_pdf_is_rendered_once_and_served_from_disk(self):
+        url = reverse("invoice_pdf", args=[self.customers[0].id, self.invoice.id])
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            first = self.client.get(url)
+            body = b"".join(first.streaming_content)
+            second = self.client.get(url)
+
+            self.assertEqual(first["Content-Type"], "application/pdf")
+            self.assertTrue(body.startswith(b"%PDF-1.4") and body.rstrip().endswith(b"%%EOF"))
+            self.assertEqual(b"".join(second.streaming_content), body)
+            self.assertEqual(metrics.snapshot()["counters"]["invoice_pdf_rendered"], 1)
+            etag = second["ETag"].strip('"')
+            self.assertEqual(os.listdir(os.path.join(media, "invoices", str(self.invoice.id))), [f"{etag}.pdf"])
+
+    def test_meter_change_changes_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        meter = Meter.objects.get(customer=self.customers[0], ser_num="W0")
+        meter.ser_num = "W0-2"
+        meter.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_pdf_keeps_lithuanian_letters(self):
+        document = PDFDocument()
+        document.line("ąčęėįšųūž ĄČĘĖĮŠŲŪŽ")
+        body = document.render()
+        differences = re.search(rb"/Differences \[(.*?)\]", body).group(1).split()
+        glyphs = {int(code): name.decode().lstrip("/") for code, name in zip(differences[::2], differences[1::2])}
+        stream = re.search(rb"stream\n(.*?)\nendstream", body, re.S).group(1)
+        text = re.search(rb"\((.*)\) Tj", zlib.decompress(stream)).group(1)
+
+        self.assertEqual(text.decode("cp1257"), "ąčęėįšųūž ĄČĘĖĮŠŲŪŽ")
+        self.assertEqual(
+            [glyphs[byte] for byte in text[:9]],
+            ["aogonek", "ccaron", "eogonek", "edotaccent", "iogonek", "scaron", "uogonek", "umacron", "zcaron"],
+        )
+        self.assertEqual(glyphs[text[10]], "Aogonek")
+
+
+class InvoiceExportTests(BillingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.invoices = generate_association_invoices(self.association, self.period).invoices
+
+    def test_process_pool_renders_every_invoice(self):
+        target = io.BytesIO()
+        run = export_period_invoices(self.association, self.period, target, formats=["pdf", "html"], workers=2)
+
+        names = sorted(f"{invoice.number}.{fmt}" for invoice in self.invoices for fmt in ("pdf", "html"))
+        archive = zipfile.ZipFile(target)
+        self.assertEqual(sorted(archive.namelist()), names)
+        self.assertEqual(sorted(name for name, _ in run.timings), names)
+        self.assertTrue(archive.read(f"{self.invoices[0].number}.pdf").startswith(b"%PDF"))
+        self.assertIn("Skaitiklių sąnaudos", archive.read(f"{self.invoices[0].number}.html").decode())
+
+    def test_command_and_view_write_zip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "saskaitos.zip")
+            out = io.StringIO()
+            call_command("export_invoices", str(self.association.id), year=2025, month=11, workers=0,
+                         output=output, stdout=out)
+            self.assertIn("3 files", out.getvalue())
+            self.assertEqual(len(zipfile.ZipFile(output).namelist()), 3)
+
+        url = reverse("export_invoices", args=[self.association.id, self.period.id])
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.create_user("buhaltere", password="x", is_staff=True))
+        with mock.patch("skaps.views.export_period_invoices", wraps=export_period_invoices) as export:
+            response = self.client.get(url)
+            pool = shared_pool()
+            self.client.get(url)
+        self.assertEqual(export.call_args.kwargs["formats"], ["pdf"])
+        self.assertIs(shared_pool(), pool)
+        self.assertEqual(response["Content-Type"], "application/zip")
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(len(archive.namelist()), 3)
+
+
+class TabularExportTests(BillingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user("buhaltere", password="x", is_staff=True)
+        self.client.force_login(self.staff)
+
+    def _get(self, dataset, fmt, **params):
+        response = self.client.get(reverse("export_table", args=[self.association.id, dataset, fmt]), params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    def test_csv_exports_are_filtered_by_period(self):
+        generate_association_invoices(self.association, self.period)
+
+        rows = list(csv.reader(io.StringIO(self._get("readings", "csv", period_from="2025-11").decode("utf-8-sig"))))
+        self.assertEqual(rows[0][:3], ["Metai", "Mėnuo", "Klientas"])
+        self.assertEqual(sorted(r[5] for r in rows[1:]), ["110.00", "215.00", "325.00"])
+
+        items = list(csv.reader(io.StringIO(self._get("invoices", "csv").decode("utf-8-sig"))))
+        self.assertEqual(len(items) - 1, InvoiceItem.objects.count())
+        self.assertEqual(sum(Decimal(r[13]) for r in items[1:]), Decimal("345.00"))
+        self.assertEqual(len(self._get("period_taxes", "csv", period_to="2025-10").splitlines()), 1)
+
+    def test_xlsx_is_a_valid_workbook(self):
+        archive = zipfile.ZipFile(io.BytesIO(self._get("period_taxes", "xlsx")))
+        self.assertIn("xl/workbook.xml", archive.namelist())
+        sheet = archive.read("xl/worksheets/sheet1.xml").decode()
+        self.assertEqual(sheet.count("<row>"), 5)
+        self.assertIn("<v>200.00</v>", sheet)
+        self.assertIn("Šildymas", sheet)
+
+    def test_exports_are_staff_only(self):
+        self.client.logout()
+        response = self.client.get(reverse("export_table", args=[self.association.id, "readings", "csv"]))
+        self.assertEqual(response.status_code, 302)
+
+    def test_memory_stays_flat_as_rows_grow(self):
+        association = generate_dataset(customers=100, meters=2, periods=12).associations[0]
+        rows, written, samples = profile_export(
+            TABULAR_EXPORTS["readings"], association, expected_rows=2400, chunk_size=100, batch=100,
+        )
+        self.assertEqual(rows, 2400)
+        self.assertGreater(len(samples), 5)
+        self.assertLess(memory_growth(samples), 1.5)
+
+
+class ReportingTests(BillingTestMixin, TestCase):
+
+    def test_invoice_runs_refresh_period_rollups(self):
+        generate_association_invoices(self.association, self.period)
+
+        rollup = PeriodRollup.objects.get(association=self.association, period=self.period)
+        self.assertEqual((rollup.invoices, rollup.billed_amount, rollup.supplier_amount), (3, 345, 335))
+        taxes = {t.tax_type.name: t for t in TaxRollup.objects.filter(period=self.period).select_related("tax_type")}
+        self.assertEqual((taxes["Administravimas"].billed_amount, taxes["Administravimas"].difference), (15, 10))
+        self.assertEqual(taxes["Vanduo"].consumed, Decimal(50))
+        water = InvoiceItem.objects.filter(meter__isnull=False)
+        self.assertEqual(set(water.values_list("supplier_amount", "total_diff")), {(Decimal(100), Decimal(50))})
+
+        period_tax = PeriodTax.objects.get(tax_type__name="Valymas")
+        period_tax.amount = Decimal("60.00")
+        period_tax.save()
+        recompute_stale_invoices(self.association, self.period)
+        rollup.refresh_from_db()
+        self.assertEqual((rollup.billed_amount, rollup.supplier_amount), (375, 365))
+
+    def test_payments_are_collected_in_their_month(self):
+        now = timezone.localtime()
+        Period.objects.get_or_create(year=now.year, month=now.month)
+        post_entry(self.customers[0], "payment", Decimal("20.00"))
+        post_entry(self.customers[1], "adjustment", Decimal("5.00"))
+
+        rollup = PeriodRollup.objects.get(association=self.association, period__year=now.year, period__month=now.month)
+        self.assertEqual((rollup.collected_amount, rollup.invoices), (Decimal("20.00"), 0))
+
+    def test_five_year_summary_reads_only_rollups(self):
+        tax_type = TaxType.objects.get(name="Administravimas")
+        rollups, taxes = [], []
+        for period in dataset_periods(60):
+            rollups.append(PeriodRollup(association=self.association, period=period, period_ordinal=period.ordinal,
+                                        invoices=3, billed_amount=100, supplier_amount=90, collected_amount=80))
+            taxes.append(TaxRollup(association=self.association, period=period, period_ordinal=period.ordinal,
+                                   tax_type=tax_type, supplier_amount=90, billed_amount=100, lines=3))
+        PeriodRollup.objects.bulk_create(rollups)
+        TaxRollup.objects.bulk_create(taxes)
+        url = reverse("association_summary_api", args=[self.association.id])
+
+        with self.assertNumQueries(4):
+            periods = self.client.get(url).json()["periods"]
+        self.assertEqual(len(periods), 60)
+        self.assertEqual((periods[0]["period"], periods[-1]["outstanding"]), ("2000-01", "1200.00"))
+        self.assertEqual(periods[0]["taxes"][0]["difference"], "10.00")
+
+        periods = self.client.get(url, {"period_from": "2004-01"}).json()["periods"]
+        self.assertEqual([p["period"] for p in periods], [f"2004-{m:02d}" for m in range(1, 13)])
+
+
+class SimulationTests(BillingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        generate_association_invoices(self.association, self.period)
+        self.tax_types = {t.name: str(t.id) for t in TaxType.objects.all()}
+
+    def test_unchanged_scenario_matches_issued_invoices_without_writes(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = simulate(self.association, {"periods": ["2025-11"]})
+        self.assertEqual(len(queries), 9)
+        self.assertTrue(all(q["sql"].startswith("SELECT") for q in queries.captured_queries))
+
+        period = result.periods[0]
+        self.assertEqual((period["simulated"], period["issued"], period["difference"]), (345, 345, 0))
+        self.assertEqual([c["difference"] for c in result.customers], [0, 0, 0])
+        self.assertEqual(simulate(self.association, {"periods": ["2025-11"]}, only_changed=True).customers, [])
+
+    def test_overrides_are_billed_in_memory(self):
+        result = simulate(self.association, {"periods": ["2025-11"], "taxes": [
+            {"tax_type": self.tax_types["Šildymas"], "factor": "1.5"},
+            {"tax_type": self.tax_types["Vanduo"], "distribution_type": "by_area"},
+            {"tax_type": self.tax_types["Valymas"], "remove": True},
+            {"name": "Remontas", "distribution_type": "equal_split", "amount": "60"},
+        ]}, only_changed=True)
+
+        differences = {c["full_name"]: c["difference"] for c in result.customers}
+        self.assertEqual(differences, {"Klientas 0": 90, "Klientas 1": 40})
+        taxes = {t["name"]: t for t in result.periods[0]["taxes"]}
+        self.assertEqual((taxes["Šildymas"]["amount"], taxes["Šildymas"]["difference"]), (300, 100))
+        self.assertEqual((taxes["Valymas"]["simulated"], taxes["Valymas"]["difference"]), (0, -30))
+        self.assertIsNone(taxes["Remontas"]["tax_type_id"])
+        self.assertEqual(result.periods[0]["difference"], 130)
+        self.assertEqual(PeriodTax.objects.get(tax_type__name="Šildymas").amount, 200)
+        self.assertFalse(TaxType.objects.filter(name="Remontas").exists())
+
+    def test_many_periods_cost_the_same_queries(self):
+        scenario = {
+            "periods": ["2025-10", {"period": "2025-11", "taxes": [
+                {"tax_type": self.tax_types["Šildymas"], "amount": "100"},
+            ]}],
+            "taxes": [{"tax_type": self.tax_types["Administravimas"], "amount": "7"}],
+        }
+        with self.assertNumQueries(9):
+            result = simulate(self.association, scenario)
+
+        self.assertEqual([p["period"] for p in result.periods], ["2025-10", "2025-11"])
+        self.assertEqual((result.periods[0]["simulated"], result.periods[0]["issued"]), (21, 0))
+        customer = result.customers[0]["periods"]
+        self.assertEqual(customer["2025-10"], {"simulated": 7, "issued": None, "difference": 7})
+        self.assertEqual(customer["2025-11"]["difference"], Decimal("-48.00"))
+
+    def test_api_returns_differences_or_errors(self):
+        self.assertContains(self.client.get(reverse("simulate_billing", args=[self.association.id])), "Šildymas")
+        url = reverse("simulate_billing_api", args=[self.association.id])
+        scenario = {"periods": ["2025-11"], "taxes": [{"tax_type": self.tax_types["Valymas"], "amount": "60"}]}
+        response = self.client.post(url, scenario, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["difference"], "30.00")
+
+        response = self.client.post(url, {"periods": ["2025-12", "2025-11"], "taxes": [
+            {"tax_type": self.tax_types["Valymas"], "distribution_type": "proportional"},
+            {"name": "Remontas", "distribution_type": "fixed"},
+        ]}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()["errors"]), 3)
+        response = self.client.post(url, "{", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class CustomerLedgerTests(BillingTestMixin, TestCase):
+
+    def test_invoice_applies_balance_and_is_charged(self):
+        customer = self.customers[0]
+        post_entry(customer, "payment", Decimal("20.00"))
+
+        invoice = generate_invoice(customer, self.period)
+        self.assertEqual(invoice.balance, Decimal("20.00"))
+        self.assertEqual(invoice.payable_amount, invoice.total_amount - Decimal("20.00"))
+        self.assertEqual(current_balance(customer), Decimal("20.00") - invoice.total_amount)
+
+        # perskaičiavus sąskaitą žurnale atsiranda korekcija, o ne pakeistas įrašas
+        period_tax = PeriodTax.objects.get(tax_type__name="Administravimas")
+        period_tax.amount = Decimal("7.00")
+        period_tax.save()
+        invoice = generate_invoice(customer, self.period)
+        charged = LedgerEntry.objects.filter(invoice=invoice).values_list("amount", flat=True)
+        self.assertEqual(len(charged), 2)
+        self.assertEqual(sum(charged), -invoice.total_amount)
+        self.assertEqual(invoice.payable_amount, invoice.total_amount - Decimal("20.00"))
+
+    def test_debt_is_added_to_payable_amount(self):
+        customer = self.customers[1]
+        post_entry(customer, "adjustment", Decimal("-15.50"), note="Skola")
+        invoice = generate_invoice(customer, self.period)
+        self.assertEqual(invoice.payable_amount, invoice.total_amount + Decimal("15.50"))
+
+    def test_balance_reads_latest_snapshot_and_short_tail(self):
+        customer = self.customers[0]
+        with mock.patch("skaps.ledger.SNAPSHOT_EVERY", 3):
+            for amount in range(1, 8):
+                post_entry(customer, "payment", Decimal(amount))
+
+        self.assertEqual(list(BalanceSnapshot.objects.filter(customer=customer).values_list("sequence", "balance")),
+                         [(3, Decimal("6.00")), (6, Decimal("21.00"))])
+        with self.assertNumQueries(1):
+            self.assertEqual(current_balance(customer), Decimal("28.00"))
+
+        history = balance_history(customer, limit=3)
+        self.assertEqual([(e.sequence, b) for e, b in history],
+                         [(7, Decimal("28.00")), (6, Decimal("21.00")), (5, Decimal("15.00"))])
+
+    def test_dashboard_posts_payment(self):
+        customer = self.customers[2]
+        url = reverse("add_ledger_entry", args=[self.association.id, customer.id])
+        self.client.post(url, {"kind": "payment", "amount": "12.34", "note": "Bankas"})
+        self.client.post(url, {"kind": "invoice", "amount": "99"})
+
+        self.assertEqual(current_balance(customer), Decimal("12.34"))
+        response = self.client.get(reverse("customer_dashboard", args=[self.association.id, customer.id]))
+        self.assertContains(response, "Bankas")
+        self.assertEqual(response.context["balance"], Decimal("12.34"))
+
+
+class ListViewTests(BillingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(3, 12):
+            Customer.objects.create(association=self.association, full_name=f"Klientas {i:02d}")
+
+    def test_keyset_pages_walk_forward_and_back(self):
+        qs = Customer.objects.filter(association=self.association)
+        ordering = ("full_name", "id")
+        expected = list(qs.order_by(*ordering))
+
+        seen, page = [], paginate(qs, ordering, page_size=5)
+        self.assertFalse(page.has_previous)
+        while True:
+            seen.extend(page)
+            if not page.has_next:
+                break
+            page = paginate(qs, ordering, after=page.next_cursor, page_size=5)
+        self.assertEqual(seen, expected)
+
+        back = paginate(qs, ordering, before=page.previous_cursor, page_size=5)
+        self.assertEqual(list(back), expected[5:10])
+        self.assertTrue(back.has_previous)
+
+    def test_deep_pages_cost_the_same_queries(self):
+        url = reverse("customers_list", args=[self.association.id])
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get(url, {"page_size": 3})
+        cursor = response.context["page"].next_cursor
+        for _ in range(2):
+            response = self.client.get(url, {"page_size": 3, "after": cursor})
+            cursor = response.context["page"].next_cursor
+        with CaptureQueriesContext(connection) as deep:
+            self.client.get(url, {"page_size": 3, "after": cursor})
+        self.assertEqual(len(deep), len(first))
+
+    def test_filters(self):
+        Meter.objects.create(customer=self.customers[1], meter_type="gas", ser_num="G1")
+        Meter.objects.create(customer=self.customers[1], meter_type="gas", ser_num="G2")
+
+        response = self.client.get(reverse("customers_list", args=[self.association.id]), {"meter_type": "gas"})
+        self.assertEqual(list(response.context["customers"]), [self.customers[1]])
+
+        response = self.client.get(reverse("meter_list", args=[self.association.id]), {"q": "g2"})
+        self.assertEqual([m.ser_num for m in response.context["meters"]], ["G2"])
+
+        response = self.client.get(
+            reverse("meter_readings", args=[self.customers[0].id]), {"period_from": "2025-11", "period_to": "2025-12"}
+        )
+        self.assertEqual([r.period for r in response.context["readings"]], [self.period])
+
+        response = self.client.get(reverse("period_taxes", args=[self.association.id]), {"q": "vand"})
+        self.assertEqual([t.tax_type.name for t in response.context["taxes"]], ["Vanduo"])
+
+    def test_bad_cursor_restarts_from_first_page(self):
+        response = self.client.get(reverse("associations_list"), {"after": "not-a-cursor"})
+        self.assertEqual(list(response.context["associations"]), [self.association])
+
+
+class QueryPlanTests(BillingTestMixin, TestCase):
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    @skipUnlessDBFeature("supports_explaining_query_execution")
+    def test_billing_queries_use_indexes(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("plan format is SQLite specific")
+        generate_association_invoices(self.association, self.prev_period)
+
+        with CaptureQueriesContext(connection) as queries:
+            context = BillingContext(self.association, self.period)
+            context.allocation, context.existing_invoices
+            rebuild_consumption(self.association)
+
+        checked = 0
+        for query in queries.captured_queries:
+            sql = query["sql"]
+            if not sql.startswith("SELECT"):
+                continue
+            plan = self.explain(sql)
+            # periodų lentelė – mažas žodynas, ją skaityti visą leidžiama
+            scans = [step for step in plan if step.startswith("SCAN skaps_") and "skaps_period " not in step]
+            self.assertEqual(scans, [], f"full scan in: {sql}")
+            checked += 1
+        self.assertGreater(checked, 3)
+
+    def test_period_tax_is_unique_per_association_period_and_type(self):
+        tax = PeriodTax.objects.filter(association=self.association).first()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PeriodTax.objects.create(
+                association=self.association, tax_type=tax.tax_type, period=tax.period, amount=Decimal("1")
+            )
+
+        response = self.client.post(reverse("add_period_tax", args=[self.association.id]), {
+            "period": tax.period.id, "tax_type": tax.tax_type.id, "amount": "1.00",
+        })
+        self.assertContains(response, "jau įvesta")
+
+
+class InstrumentationTests(BillingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.staff = User.objects.create_user("admin", password="x", is_staff=True)
+
+    def test_middleware_records_views(self):
+        generate_association_invoices(self.association, self.period)
+        invoice = Invoice.objects.filter(customer=self.customers[0]).get()
+
+        self.client.get(reverse("invoice_detail", args=[self.customers[0].id, invoice.id]))
+
+        stats = metrics.snapshot()["views"]["invoice_detail"]
+        self.assertEqual(stats["requests"], 1)
+        self.assertGreater(stats["queries"], 0)
+        self.assertEqual(stats["n_plus_one"], 0)
+
+    def test_middleware_flags_repeated_sql(self):
+        def lazy_view(request):
+            # kiekvienas skaitiklis atskirai užkrauna klientą
+            return HttpResponse(", ".join(str(m.customer) for m in Meter.objects.all()))
+
+        request = RequestFactory().get("/n-plus-one/")
+        request.resolver_match = ResolverMatch(lazy_view, (), {}, url_name="n_plus_one")
+        for i in range(3):
+            Meter.objects.create(customer=self.customers[i], meter_type="gas", ser_num=f"G{i}")
+
+        with self.assertLogs("skaps.requests", level="WARNING"):
+            QueryMetricsMiddleware(lazy_view)(request)
+        self.assertEqual(metrics.snapshot()["views"]["n_plus_one"]["n_plus_one"], 1)
+
+    def test_metrics_endpoints_are_staff_only(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 302)
+
+        self.client.force_login(self.staff)
+        self.client.get(reverse("associations_list"))
+        response = self.client.get(reverse("metrics_prometheus"))
+        self.assertContains(response, 'skaps_view_requests_total{view="associations_list"} 1')
+        self.assertIn("associations_list", self.client.get(reverse("metrics")).json()["views"])
+
+
+class AsyncViewTests(BillingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        generate_association_invoices(self.association, self.period)
+        self.customer = self.customers[0]
+        self.invoice = Invoice.objects.get(customer=self.customer)
+        self.factory = AsyncRequestFactory()
+
+    async def test_customer_dashboard(self):
+        response = await async_views.customer_dashboard(self.factory.get("/"), self.association.id, self.customer.id)
+        self.assertContains(response, self.invoice.number)
+        self.assertContains(response, "Generuoti sąskaitą už 2025-11")
+
+    async def test_invoice_detail_is_conditional(self):
+        url = reverse("invoice_detail", args=[self.customer.id, self.invoice.id])
+        response = await async_views.invoice_detail(self.factory.get(url), self.customer.id, self.invoice.id)
+        self.assertContains(response, "Skaitiklių sąnaudos")
+        self.assertEqual(response["ETag"], (await self.async_client.get(url))["ETag"])
+
+        request = self.factory.get(url, headers={"if-none-match": response["ETag"]})
+        response = await async_views.invoice_detail(request, self.customer.id, self.invoice.id)
+        self.assertEqual(response.status_code, 304)
+
+    async def test_summaries_and_readings_match_sync_views(self):
+        url = reverse("association_summary_api", args=[self.association.id])
+        response = await async_views.association_summary_api(self.factory.get(url), self.association.id)
+        self.assertEqual(json.loads(response.content), (await self.async_client.get(url)).json())
+
+        response = await async_views.association_period_summary_api(
+            self.factory.get("/"), self.association.id, self.period.id
+        )
+        self.assertEqual(json.loads(response.content)["invoices"], 3)
+        with self.assertRaises(Http404):
+            await async_views.association_period_summary_api(
+                self.factory.get("/"), self.association.id, self.prev_period.id
+            )
+
+        response = await async_views.meter_readings(self.factory.get("/"), self.customer.id)
+        self.assertContains(response, "110.00 m3")
+        with self.assertRaises(Http404):
+            await async_views.meter_readings(self.factory.get("/"), self.association.id)
+
+    async def test_middleware_counts_async_view_queries(self):
+        async def dashboard(request):
+            return await async_views.customer_dashboard(request, self.association.id, self.customer.id)
+
+        request = self.factory.get("/")
+        request.resolver_match = ResolverMatch(dashboard, (), {}, url_name="customer_dashboard")
+        await QueryMetricsMiddleware(dashboard)(request)
+        # klientas su bendrija + skaitikliai, periodai, sąskaitos, žurnalas ir likutis kartu
+        self.assertEqual(metrics.snapshot()["views"]["customer_dashboard"]["queries"], 6)
+
+    async def test_load_driver(self):
+        async def handle(reader, writer):
+            request_line = await reader.readuntil(b"\r\n\r\n")
+            status = b"200 OK" if request_line.startswith(b"GET /ok ") else b"404 Not Found"
+            writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        async with server:
+            result = await load("127.0.0.1", server.sockets[0].getsockname()[1], ["/ok", "/missing"],
+                                concurrency=3, requests=10)
+        self.assertEqual((result.requests, result.errors, len(result.latencies)), (10, 5, 10))
+        self.assertGreater(result.throughput, 0)
+
+
+class BenchmarkTests(TestCase):
+
+    def test_dataset_and_benchmark_scenarios(self):
+        dataset = generate_dataset(customers=5, meters=2, periods=3)
+        association = dataset.associations[0]
+        self.assertEqual(MeterReading.objects.filter(meter__customer__association=association).count(), 30)
+        self.assertEqual(PeriodTax.objects.filter(association=association).count(), 3 * 5)
+
+        results = run_benchmarks(dataset, repeat=1)
+        self.assertEqual(
+            set(results), {
+                "generate_invoice", "invoice_detail", "invoice_detail_cached", "customer_dashboard", "meter_list",
+                "customers_list", "simulate_billing", "api_invoice", "api_meters", "api_customers",
+            }
+        )
+        self.assertEqual([api for api, _, _ in api_comparison(results)], ["api_invoice", "api_meters", "api_customers"])
+        self.assertTrue(all(r["queries"] > 0 and r["peak_memory"] > 0 for r in results.values()))
+        # be fragmentų talpyklos užkraunamos ir sąskaitos eilutės
+        self.assertGreater(results["invoice_detail"]["queries"], results["invoice_detail_cached"]["queries"])
+
+    def test_compare_flags_regressions(self):
+        baseline = {"view": {"queries": 5, "wall_time": 0.1, "peak_memory": 1000}}
+        self.assertEqual(compare({"view": {"queries": 5, "wall_time": 0.12, "peak_memory": 1000}}, baseline), [])
+        regressions = compare({"view": {"queries": 6, "wall_time": 0.2, "peak_memory": 1000}}, baseline)
+        self.assertEqual(len(regressions), 2)
@@ -1,5 +1,9 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# ASGI serveryje skaitymo rodiniai – asinchroniniai
+read_views = async_views if settings.SKAPS_ASYNC_VIEWS else views
 
 urlpatterns = [
     path("", views.index, name="index"),
@@ -12,10 +16,12 @@ urlpatterns = [
     # Customers
     path("association/<uuid:association_id>/customers/", views.customers_list, name="customers_list"),
     path("association/<uuid:association_id>/customers/add/", views.add_customer, name="add_customer"),
-    path("association/<uuid:association_id>/customers/<uuid:customer_id>/", views.customer_dashboard,
+    path("association/<uuid:association_id>/customers/<uuid:customer_id>/", read_views.customer_dashboard,
          name="customer_dashboard"),
     path("association/<uuid:association_id>/customers/<uuid:customer_id>/edit/", views.edit_customer,
          name="edit_customer"),
+    path("association/<uuid:association_id>/customers/<uuid:customer_id>/ledger/", views.add_ledger_entry,
+         name="add_ledger_entry"),
 
     # Taxes
     path("association/<uuid:association_id>/taxes/", views.association_taxes, name="association_taxes"),
@@ -37,14 +43,21 @@ urlpatterns = [
 
     # Meter readings
     path("customers/<uuid:customer_id>/meter-readings/add/", views.add_meter_reading, name="add_meter_reading"),
-    path("customers/<uuid:customer_id>/meter-readings/", views.meter_readings, name="meter_readings"),
+    path("customers/<uuid:customer_id>/meter-readings/", read_views.meter_readings, name="meter_readings"),
+    path("association/<uuid:association_id>/meter-readings/import/", views.import_meter_readings,
+         name="import_meter_readings"),
 
     # Invoices
     path(
         "customers/<uuid:customer_id>/invoices/<uuid:invoice_id>/",
-        views.invoice_detail,
+        read_views.invoice_detail,
         name="invoice_detail"
     ),
+    path(
+        "customers/<uuid:customer_id>/invoices/<uuid:invoice_id>/pdf/",
+        views.invoice_pdf,
+        name="invoice_pdf"
+    ),
 
     # Generate invoice
     path(
@@ -52,5 +65,62 @@ urlpatterns = [
         views.generate_invoice_view,
         name="generate_invoice"
     ),
+    path(
+        "association/<uuid:association_id>/invoices/generate/<uuid:period_id>/",
+        views.generate_association_invoices_view,
+        name="generate_association_invoices"
+    ),
+    path(
+        "association/<uuid:association_id>/invoices/export/<uuid:period_id>/",
+        views.export_invoices_view,
+        name="export_invoices"
+    ),
+
+    # Reporting
+    path("api/associations/<uuid:association_id>/summary/", read_views.association_summary_api,
+         name="association_summary_api"),
+    path("api/associations/<uuid:association_id>/summary/<uuid:period_id>/", read_views.association_period_summary_api,
+         name="association_period_summary_api"),
+
+    # What-if billing
+    path("association/<uuid:association_id>/simulate/", views.simulate_billing, name="simulate_billing"),
+    path("api/associations/<uuid:association_id>/simulate/", views.simulate_billing_api,
+         name="simulate_billing_api"),
+
+    # JSON API v1
+    path("api/v1/associations/", views.api_list, {"resource": "associations"}, name="api_v1_associations"),
+    path("api/v1/associations/<uuid:pk>/", views.api_detail, {"resource": "associations"},
+         name="api_v1_association"),
+    path("api/v1/associations/<uuid:association_id>/customers/", views.api_list, {"resource": "customers"},
+         name="api_v1_customers"),
+    path("api/v1/associations/<uuid:association_id>/customers/<uuid:pk>/", views.api_detail,
+         {"resource": "customers"}, name="api_v1_customer"),
+    path("api/v1/associations/<uuid:association_id>/meters/", views.api_list, {"resource": "meters"},
+         name="api_v1_meters"),
+    path("api/v1/associations/<uuid:association_id>/meters/<uuid:pk>/", views.api_detail, {"resource": "meters"},
+         name="api_v1_meter"),
+    path("api/v1/associations/<uuid:association_id>/readings/", views.api_readings, name="api_v1_readings"),
+    path("api/v1/associations/<uuid:association_id>/readings/<uuid:pk>/", views.api_detail,
+         {"resource": "readings"}, name="api_v1_reading"),
+    path("api/v1/associations/<uuid:association_id>/period-taxes/", views.api_list, {"resource": "period_taxes"},
+         name="api_v1_period_taxes"),
+    path("api/v1/associations/<uuid:association_id>/period-taxes/<uuid:pk>/", views.api_detail,
+         {"resource": "period_taxes"}, name="api_v1_period_tax"),
+    path("api/v1/associations/<uuid:association_id>/invoices/", views.api_list, {"resource": "invoices"},
+         name="api_v1_invoices"),
+    path("api/v1/associations/<uuid:association_id>/invoices/<uuid:pk>/", views.api_detail,
+         {"resource": "invoices"}, name="api_v1_invoice"),
+
+    # Exports (staff only)
+    path("association/<uuid:association_id>/export/<slug:dataset>.<slug:fmt>", views.export_table,
+         name="export_table"),
+
+    # Invoice jobs
+    path("jobs/<uuid:job_id>/", views.invoice_job, name="invoice_job"),
+    path("jobs/<uuid:job_id>/status/", views.invoice_job_status, name="invoice_job_status"),
+
+    # Instrumentation (staff only)
+    path("metrics/", views.metrics_view, name="metrics"),
+    path("metrics/prometheus/", views.metrics_prometheus, name="metrics_prometheus"),
 
 ]
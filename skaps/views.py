@@ -1,12 +1,31 @@
-import uuid
-from decimal import Decimal
+import json
+import tempfile
 
 from django.contrib import messages
-from django.db.models import Sum
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import content_disposition_header, quote_etag
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_http_methods, require_POST, require_safe
+
+from .api import API_RESOURCES, ApiError, upsert_readings
+from .exports import EXPORT_FORMATS, TABULAR_EXPORTS, TABULAR_FORMATS, export_period_invoices, stored_invoice_pdf
+from .jobs import enqueue_invoice_job
 from .forms import TaxTypeForm, PeriodTaxForm, PeriodForm, MeterForm, MeterReadingForm, MeterFormSet, CustomerForm, \
-    AssociationForm
-from .models import TaxType, Period, Meter, MeterReading, Customer, Association, Invoice, InvoiceItem, PeriodTax
+    AssociationForm, ReadingImportForm, ListFilterForm, LedgerEntryForm
+from .importers import import_readings
+from .instrumentation import metrics
+from .ledger import balance_history, post_entry
+from .pagination import page_size_from, paginate_request
+from .models import TaxType, Period, Meter, MeterReading, Customer, Association, InvoiceJob
+from .reporting import association_summary
+from .read_models import InvoiceDocument, invoice_etag, versioned_invoice
+from .simulation import ScenarioError, simulate
 
 
 def add_association(request):
@@ -20,14 +39,27 @@ def add_association(request):
     return render(request, "skaps/add_association.html", {"form": form})
 
 
+def filtered_page(request, queryset, ordering, **filters):
+    """Applies the list filters from the query string and returns (page, filter form)."""
+    form = ListFilterForm(request.GET or None, **filters)
+    return paginate_request(request, form.filter(queryset), ordering), form
+
+
 def associations_list(request):
-    associations = Association.objects.all()
-    return render(request, "skaps/associations_list.html", {"associations": associations})
+    associations, filter_form = filtered_page(
+        request, Association.objects.all(), ("name", "id"), search=["name"]
+    )
+    return render(request, "skaps/associations_list.html", {
+        "associations": associations,
+        "page": associations,
+        "filter_form": filter_form,
+    })
 
 
 def association_dashboard(request, association_id):
     association = get_object_or_404(Association, id=association_id)
-    return render(request, "skaps/association_dashboard.html", {"association": association})
+    periods = Period.objects.filter(taxes__association=association).distinct().order_by("-year", "-month")
+    return render(request, "skaps/association_dashboard.html", {"association": association, "periods": periods})
 
 
 def index(request):
@@ -38,8 +70,20 @@ def index(request):
 
 def customers_list(request, association_id):
     association = get_object_or_404(Association, id=association_id)
-    customers = Customer.objects.filter(association=association)
-    return render(request, "skaps/customers_list.html", {"association": association, "customers": customers})
+    customers, filter_form = filtered_page(
+        request,
+        Customer.objects.filter(association=association),
+        ("full_name", "id"),
+        search=["full_name", "address", "email"],
+        meter_type="meters__meter_type",
+        distinct=True,
+    )
+    return render(request, "skaps/customers_list.html", {
+        "association": association,
+        "customers": customers,
+        "page": customers,
+        "filter_form": filter_form,
+    })
 
 
 def tax_list(request):
@@ -87,48 +131,21 @@ def tax_edit(request, association_id, tax_id):
 
 
 
-def apply_distribution(customer, period_tax, period):
-    tax_type = period_tax.tax_type
-    amount = period_tax.amount
-
-    if tax_type.distribution_type == "fixed":
-        # fiksuotas mokestis kiekvienam klientui
-        return amount
-
-    elif tax_type.distribution_type == "equal_split":
-        # padalinam visiems klientams po lygiai
-        total_customers = customer.association.customers.count()
-        print("klientų skaičius grupėje", total_customers)
-        return amount / total_customers if total_customers else 0
-
-    elif tax_type.distribution_type == "by_area":
-        # proporcingai pagal plotą (pvz. floor_area laukas Customer modelyje)
-        total_area = customer.association.customers.aggregate(total=Sum("floor_area"))["total"] or 0
-        return (customer.floor_area / total_area) * amount if total_area else 0
-
-    elif tax_type.distribution_type == "proportional":
-        # proporcingai pagal skaitiklių duomenis (pvz. electricity)
-        total_consumption = MeterReading.objects.filter(
-            meter__customer__association=customer.association,
-            period=period
-        ).aggregate(total=Sum("value"))["total"] or 0
-
-        customer_consumption = MeterReading.objects.filter(
-            meter__customer=customer,
-            period=period
-        ).aggregate(total=Sum("value"))["total"] or 0
-
-        return (customer_consumption / total_consumption) * amount if total_consumption else 0
-
-    return 0
-
-
 def period_taxes(request, association_id):
     association = get_object_or_404(Association, id=association_id)
-    taxes = association.period_taxes.select_related("tax_type", "period").all()
+    taxes, filter_form = filtered_page(
+        request,
+        association.period_taxes.select_related("tax_type", "period"),
+        ("-period__year", "-period__month", "tax_type__name", "id"),
+        search=["tax_type__name"],
+        meter_type="tax_type__meter_type",
+        period="period",
+    )
     return render(request, "skaps/period_taxes.html", {
         "association": association,
-        "taxes": taxes
+        "taxes": taxes,
+        "page": taxes,
+        "filter_form": filter_form,
     })
 
 
@@ -139,8 +156,12 @@ def add_period_tax(request, association_id):
         if form.is_valid():
             period_tax = form.save(commit=False)
             period_tax.association = association
-            period_tax.save()
-            return redirect("period_taxes", association_id=association.id)
+            # association nėra formoje, todėl unikalumą tikriname patys
+            if association.period_taxes.filter(tax_type=period_tax.tax_type, period=period_tax.period).exists():
+                form.add_error(None, "Šio mokesčio suma šiam periodui jau įvesta.")
+            else:
+                period_tax.save()
+                return redirect("period_taxes", association_id=association.id)
     else:
         form = PeriodTaxForm()
     return render(request, "skaps/add_period_tax.html", {
@@ -170,8 +191,19 @@ def period_list(request):
 
 def meter_list(request, association_id):
     association = get_object_or_404(Association, id=association_id)
-    meters = Meter.objects.filter(customer__association=association).select_related("customer")
-    return render(request, "skaps/meter_list.html", {"association": association, "meters": meters})
+    meters, filter_form = filtered_page(
+        request,
+        Meter.objects.filter(customer__association=association).select_related("customer"),
+        ("customer__full_name", "id"),
+        search=["customer__full_name", "ser_num", "description"],
+        meter_type="meter_type",
+    )
+    return render(request, "skaps/meter_list.html", {
+        "association": association,
+        "meters": meters,
+        "page": meters,
+        "filter_form": filter_form,
+    })
 
 
 def add_meter(request, customer_id):
@@ -189,10 +221,28 @@ def add_meter(request, customer_id):
     return render(request, "skaps/add_meter.html", {"form": form, "customer": customer})
 
 
+def readings_page(request, customer_id):
+    """(page of the customer's readings with meters, periods and anomalies, filter form)."""
+    return filtered_page(
+        request,
+        MeterReading.objects.filter(meter__customer_id=customer_id).select_related("meter", "period")
+        .prefetch_related("anomalies"),
+        ("-period_ordinal", "meter_type", "id"),
+        search=["meter__ser_num"],
+        meter_type="meter_type",
+        period_ordinal="period_ordinal",
+    )
+
+
 def meter_readings(request, customer_id):
     customer = get_object_or_404(Customer, id=customer_id)
-    readings = MeterReading.objects.filter(meter__customer=customer).select_related("meter", "period")
-    return render(request, "skaps/meter_readings.html", {"customer": customer, "readings": readings})
+    readings, filter_form = readings_page(request, customer.id)
+    return render(request, "skaps/meter_readings.html", {
+        "customer": customer,
+        "readings": readings,
+        "page": readings,
+        "filter_form": filter_form,
+    })
 
 
 def add_meter_reading(request, customer_id):
@@ -212,6 +262,28 @@ def add_meter_reading(request, customer_id):
     return render(request, "skaps/add_meter.html", {"form": form, "customer": customer})
 
 
+def import_meter_readings(request, association_id):
+    association = get_object_or_404(Association, id=association_id)
+    result = None
+    if request.method == "POST":
+        form = ReadingImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data["file"]
+            try:
+                result = import_readings(upload.file, upload.name, association=association)
+            except ValueError as e:
+                messages.error(request, str(e))
+            else:
+                messages.success(request, f"Importuota rodmenų: {result.upserted} iš {result.rows}.")
+    else:
+        form = ReadingImportForm()
+    return render(request, "skaps/import_readings.html", {
+        "form": form,
+        "association": association,
+        "result": result,
+    })
+
+
 def edit_meter(request, customer_id, meter_id):
     customer = get_object_or_404(Customer, id=customer_id)
     meter = get_object_or_404(Meter, id=meter_id, customer=customer)
@@ -252,6 +324,8 @@ def customer_dashboard(request, association_id, customer_id):
     customer = get_object_or_404(Customer, id=customer_id, association=association)
     meters = customer.meters.all()
     periods = Period.objects.filter(taxes__association=association).distinct().order_by("-year", "-month")
+    history = balance_history(customer)
+    balance = history[0][1] if history else 0
 
     return render(
         request,
@@ -261,10 +335,27 @@ def customer_dashboard(request, association_id, customer_id):
             "customer": customer,
             "meters": meters,
             "periods": periods,
+            "invoices": customer.invoices.all(),
+            "balance": balance,
+            "history": history,
+            "ledger_form": LedgerEntryForm(),
         }
     )
 
 
+@require_POST
+def add_ledger_entry(request, association_id, customer_id):
+    customer = get_object_or_404(Customer, id=customer_id, association_id=association_id)
+    form = LedgerEntryForm(request.POST)
+    if form.is_valid():
+        entry = form.cleaned_data
+        post_entry(customer, entry["kind"], entry["amount"], note=entry["note"])
+        messages.success(request, "Įrašas pridėtas į kliento sąskaitą.")
+    else:
+        messages.error(request, "Neteisingas įrašas: " + "; ".join(e for errs in form.errors.values() for e in errs))
+    return redirect("customer_dashboard", association_id=association_id, customer_id=customer.id)
+
+
 def edit_customer(request, association_id, customer_id):
     association = get_object_or_404(Association, id=association_id)
     customer = get_object_or_404(Customer, id=customer_id, association=association)
@@ -287,218 +378,249 @@ def edit_customer(request, association_id, customer_id):
     )
 
 
-def generate_invoice(customer, period):
-    print("Generating invoice for:", customer, period)
+def generate_invoice_view(request, customer_id, period_id):
+    customer = get_object_or_404(Customer.objects.select_related("association"), id=customer_id)
+    period = get_object_or_404(Period, id=period_id)
+
+    # sąskaita generuojama fone – čia tik įtraukiame į eilę
+    job = enqueue_invoice_job(customer.association, period, customer=customer)
+    return redirect("invoice_job", job_id=job.id)
 
-    items = []
-    total_amount = 0
 
-    period_taxes = PeriodTax.objects.filter(
-        association=customer.association,
-        period=period
+@require_POST
+def generate_association_invoices_view(request, association_id, period_id):
+    association = get_object_or_404(Association, id=association_id)
+    period = get_object_or_404(Period, id=period_id)
+
+    job = enqueue_invoice_job(association, period, estimate=bool(request.POST.get("estimate")))
+    return redirect("invoice_job", job_id=job.id)
+
+
+@staff_member_required
+def export_invoices_view(request, association_id, period_id):
+    """Zip of all invoices of the period (?format=pdf&format=html), rendered in the shared export pool."""
+    association = get_object_or_404(Association, id=association_id)
+    period = get_object_or_404(Period, id=period_id)
+    formats = [f for f in request.GET.getlist("format") if f in EXPORT_FORMATS] or ["pdf"]
+
+    # laikinas failas diske ištrinamas, kai atsakymas jį uždaro
+    archive = tempfile.TemporaryFile()
+    run = export_period_invoices(association, period, archive, formats=formats)
+    archive.seek(0)
+    response = FileResponse(
+        archive, as_attachment=True, filename=f"saskaitos-{period.year}-{period.month:02d}.zip",
+        content_type="application/zip",
     )
+    response["X-Export-Files"] = run.files
+    return response
 
-    # Kiekvieną distribution_type apdorojame atskiroje funkcijoje
-    for pt in period_taxes:
-        if pt.tax_type.distribution_type == "proportional":
-            line_items, subtotal = invoices_proportional(customer, pt, period)
-        elif pt.tax_type.distribution_type == "fixed":
-            line_items, subtotal = invoices_fixed(customer, pt, period)
-        elif pt.tax_type.distribution_type == "by_area":
-            line_items, subtotal = invoices_by_area(customer, pt, period)
-        elif pt.tax_type.distribution_type == "equal_split":
-            line_items, subtotal = invoices_equal_split(customer, pt, period)
-        else:
-            continue
-
-        items.extend(line_items)
-        total_amount += subtotal
-
-    # Sukuriame Invoice
-    if not items:
+
+@staff_member_required
+def export_table(request, association_id, dataset, fmt):
+    """Streams a CSV/XLSX export; ?period_from=, ?period_to= (YYYY-MM) and ?meter_type= filter the rows."""
+    association = get_object_or_404(Association, id=association_id)
+    export = TABULAR_EXPORTS.get(dataset)
+    if export is None or fmt not in TABULAR_FORMATS:
+        raise Http404("Nežinomas eksportas")
+    response = StreamingHttpResponse(export.stream(association, fmt, request.GET), content_type=TABULAR_FORMATS[fmt])
+    response["Content-Disposition"] = content_disposition_header(True, f"{dataset}-{association.id.hex[:8]}.{fmt}")
+    return response
+
+
+def _job_redirect_url(job):
+    if job.status != "done":
         return None
+    if job.invoice_id:
+        return reverse("invoice_detail", kwargs={"customer_id": job.customer_id, "invoice_id": job.invoice_id})
+    return None
 
-    invoice = Invoice.objects.create(
-        customer=customer,
-        period=period,
-        number=f"INV-{period.year}{period.month:02d}-{customer.id.hex[:6]}-{uuid.uuid4().hex[:4]}",
-        total_amount=total_amount,
-        payable_amount=total_amount,
-        balance=0,
-    )
 
-    # Sukuriame InvoiceItem
-    for item in items:
-        InvoiceItem.objects.create(
-            invoice=invoice,
-            description=item["description"],
-            quantity=item["quantity"],
-            unit_price=item["unit_price"],
-            total=item["total"],
-            start_value=item.get("start_value"),
-            end_value=item.get("end_value"),
-            consumed=item.get("consumed"),
-            supplier_amount=item.get("supplier_amount"),
-            total_diff=item.get("total_diff"),
-            meter=item.get("meter"),
-            period_tax=item.get("period_tax"),
-        )
-
-    return invoice
-
-def invoices_fixed(customer, pt, period):
-    line_total = apply_distribution(customer, pt, period)
-    item = {
-        "description": f"{pt.tax_type.name} ({pt.tax_type.get_distribution_type_display()})",
-        "quantity": 1,
-        "unit_price": line_total,
-        "total": line_total,
-        "currency": pt.tax_type.currency,
-        "period_tax": pt,
-    }
-    return [item], line_total
-
-def invoices_equal_split(customer, pt, period):
-    line_total = apply_distribution(customer, pt, period)
-    item = {
-        "description": f"{pt.tax_type.name} ({pt.tax_type.get_distribution_type_display()})",
-        "quantity": 1,
-        "unit_price": line_total,
-        "total": line_total,
-        "currency": pt.tax_type.currency,
-        "period_tax": pt,
-    }
-    return [item], line_total
-
-def invoices_by_area(customer, pt, period):
-    total_floor_area = Customer.objects.filter(
-        association=customer.association
-    ).aggregate(total=Sum("floor_area"))["total"] or 0
-
-    if total_floor_area > 0:
-        unit_price = pt.amount / Decimal(total_floor_area)
-        line_total = customer.floor_area * unit_price
-    else:
-        unit_price = Decimal("0")
-        line_total = Decimal("0")
-
-    item = {
-        "description": f"{pt.tax_type.name} ({pt.tax_type.get_distribution_type_display()})",
-        "quantity": customer.floor_area,
-        "unit_price": unit_price,
-        "total": line_total,
-        "currency": pt.tax_type.currency,
-        "period_tax": pt,
-    }
-    print(item)
-    return [item], line_total
-
-def invoices_proportional(customer, pt, period):
-    items = []
-    subtotal = 0
-
-    meter_type = pt.tax_type.meter_type
-    if not meter_type:
-        return [], 0
-
-    for meter in customer.meters.filter(meter_type=meter_type):
-        current = meter.readings.filter(period=period).first()
-        previous = meter.readings.filter(
-            period__year=period.year,
-            period__month=period.month - 1
-        ).first()
-
-        if not current:
-            continue  # be dabartinio rodmens nieko nerodome
-
-        if previous:
-            consumed = current.value - previous.value
-            start_value = previous.value
-        else:
-            consumed = 0
-            start_value = None
-
-        end_value = current.value
-
-        # Bendras suvartojimas visai asociacijai to tipo
-        total_consumption = MeterReading.objects.filter(
-            meter__customer__association=pt.association,
-            meter__meter_type=meter_type,
-            period=period
-        ).aggregate(total=Sum("value"))["total"] or 0
-
-        prev_total = MeterReading.objects.filter(
-            meter__customer__association=pt.association,
-            meter__meter_type=meter_type,
-            period__year=period.year,
-            period__month=period.month - 1
-        ).aggregate(total=Sum("value"))["total"] or 0
-
-        total_diff = total_consumption - prev_total if prev_total else total_consumption
-        unit_price = pt.amount / Decimal(total_diff) if total_diff > 0 else Decimal("0")
-
-        line_total = round(consumed * unit_price, 2)
-        subtotal += line_total
-
-        items.append({
-            "description": f"{pt.tax_type.name} ({pt.tax_type.get_distribution_type_display()})",
-            "quantity": consumed,
-            "start_value": start_value,
-            "end_value": end_value,
-            "consumed": consumed,
-            "unit_price": unit_price,
-            "total": line_total,
-            "unit": meter.unit_display,
-            "currency": pt.tax_type.currency,
-            "meter": meter,
-            "period_tax": pt,
-        })
-
-    return items, subtotal
+def invoice_job(request, job_id):
+    job = get_object_or_404(InvoiceJob.objects.select_related("association", "period", "customer"), id=job_id)
+    return render(request, "skaps/invoice_job.html", {"job": job, "redirect_url": _job_redirect_url(job)})
 
 
-def generate_invoice_view(request, customer_id, period_id):
-    customer = get_object_or_404(Customer, id=customer_id)
-    period = get_object_or_404(Period, id=period_id)
+def association_summary_api(request, association_id):
+    """Per-period rollups as JSON; ?period_from= and ?period_to= (YYYY-MM) limit the range."""
+    association = get_object_or_404(Association, id=association_id)
+    filter_form = ListFilterForm(request.GET, period_ordinal="period_ordinal")
+    rows = association_summary(association, rollups=filter_form.filter(association.period_rollups.all()))
+    return JsonResponse({"association": {"id": association.id, "name": association.name}, "periods": rows})
 
-    invoice = generate_invoice(customer, period)
-    if not invoice:
-        messages.error(request, "Nepavyko sugeneruoti sąskaitos – nėra duomenų arba mokesčių.")
-        return redirect("customer_dashboard", association_id=customer.association.id, customer_id=customer.id)
 
-    # redirect be period_id
-    return redirect("invoice_detail", customer_id=customer.id, invoice_id=invoice.id)
+def association_period_summary_api(request, association_id, period_id):
+    association = get_object_or_404(Association, id=association_id)
+    rows = association_summary(association, rollups=association.period_rollups.filter(period_id=period_id))
+    if not rows:
+        raise Http404("Šiam periodui suvestinės nėra")
+    return JsonResponse({"association": {"id": association.id, "name": association.name}, **rows[0]})
 
 
-def invoice_detail(request, customer_id, invoice_id):
-    customer = get_object_or_404(Customer, id=customer_id)
-    invoice = get_object_or_404(Invoice, id=invoice_id, customer=customer)
+def simulate_billing(request, association_id):
+    association = get_object_or_404(Association, id=association_id)
+    periods = Period.objects.filter(taxes__association=association).distinct().order_by("-year", "-month")
+    return render(request, "skaps/simulate_billing.html", {
+        "association": association,
+        "periods": periods,
+        "tax_types": association.tax_types.order_by("name"),
+        "distribution_choices": TaxType.DISTRIBUTION_CHOICES,
+    })
+
+
+@require_POST
+def simulate_billing_api(request, association_id):
+    """Bills a what-if scenario (JSON body, see skaps.simulation) in memory and returns the differences."""
+    association = get_object_or_404(Association, id=association_id)
+    try:
+        scenario = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"errors": ["Netinkamas JSON"]}, status=400)
+    only_changed = isinstance(scenario, dict) and bool(scenario.get("only_changed"))
+    try:
+        result = simulate(association, scenario, only_changed=only_changed)
+    except ScenarioError as exc:
+        return JsonResponse({"errors": exc.errors}, status=400)
+    return JsonResponse(result.as_dict())
+
+
+def invoice_job_status(request, job_id):
+    job = get_object_or_404(InvoiceJob, id=job_id)
+    return JsonResponse({
+        "id": str(job.id),
+        "status": job.status,
+        "status_display": job.get_status_display(),
+        "progress_done": job.progress_done,
+        "progress_total": job.progress_total,
+        "percent": job.percent,
+        "invoices_created": job.invoices_created,
+        "estimated": job.estimated,
+        "anomalies": job.anomalies,
+        "wall_time": job.wall_time,
+        "queries": job.queries,
+        "finished": job.is_finished,
+        "redirect_url": _job_redirect_url(job),
+    })
 
-    # Surikiuojame: pirma ne-skaitikliai (consumed=False arba None), tada skaitikliai
-    items = invoice.items.all().order_by('consumed')
 
-    # Sukuriame sąrašą su footnote numeriais
-    items_with_footnotes = []
-    footnote_num = 1
+def _versioned_invoice(request, customer_id, invoice_id):
+    # condition() kviečia etag ir last_modified funkcijas atskirai – sąskaitą skaitome vieną kartą
+    if not hasattr(request, "_versioned_invoice"):
+        request._versioned_invoice = versioned_invoice(customer_id, invoice_id)
+    return request._versioned_invoice
 
-    for item in items:
-        footnote_number = None
-        if item.period_tax and item.period_tax.tax_type.description:
-            footnote_number = footnote_num
-            footnote_num += 1
 
-        items_with_footnotes.append({
-            'item': item,
-            'footnote_number': footnote_number
-        })
+def _invoice_etag(request, customer_id, invoice_id):
+    invoice = _versioned_invoice(request, customer_id, invoice_id)
+    return invoice_etag(invoice) if invoice else None
 
+
+def _invoice_last_modified(request, customer_id, invoice_id):
+    invoice = _versioned_invoice(request, customer_id, invoice_id)
+    return invoice.last_modified if invoice else None
+
+
+invoice_conditional = condition(etag_func=_invoice_etag, last_modified_func=_invoice_last_modified)
+
+
+@invoice_conditional
+def invoice_detail(request, customer_id, invoice_id):
+    invoice = _versioned_invoice(request, customer_id, invoice_id)
+    if invoice is None:
+        raise Http404("Sąskaita nerasta")
+    # eilutės užkraunamos tik jei šablono fragmentas nerastas talpykloje
+    document = SimpleLazyObject(lambda: InvoiceDocument.for_invoice(invoice))
     return render(
         request,
         "skaps/invoice_detail.html",
         {
-            "customer": customer,
+            "customer": invoice.customer,
             "invoice": invoice,
-            "items": items,
-            "items_with_footnotes": items_with_footnotes
+            "document": document,
+            "version": invoice_etag(invoice),
         },
-    )
\ No newline at end of file
+    )
+
+
+@invoice_conditional
+def invoice_pdf(request, customer_id, invoice_id):
+    invoice = _versioned_invoice(request, customer_id, invoice_id)
+    if invoice is None:
+        raise Http404("Sąskaita nerasta")
+    name = stored_invoice_pdf(invoice, invoice_etag(invoice))
+    return FileResponse(default_storage.open(name), content_type="application/pdf", filename=f"{invoice.number}.pdf")
+
+
+def _api_error(message, status=400):
+    return JsonResponse({"errors": [message]}, status=status)
+
+
+def _api_response(request, etag, render):
+    """JSON from render() with an ETag, or 304 if the client has this version."""
+    etag = quote_etag(etag)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(render())
+    response["ETag"] = etag
+    return response
+
+
+@require_safe
+def api_list(request, resource, association_id=None):
+    """GET /api/v1/...: one page of a resource; ?fields=, ?after=/?before=, ?page_size= and resource filters."""
+    resource = API_RESOURCES[resource]
+    try:
+        page, names = resource.page(association_id, request.GET, page_size_from(request))
+    except ApiError as exc:
+        return _api_error(exc.message, exc.status)
+    # netuščias puslapis jau įrodo, kad bendrija yra
+    if not page.object_list and association_id and not Association.objects.filter(id=association_id).exists():
+        return _api_error("Bendrija nerasta", status=404)
+    etag = resource.etag(page.object_list, request.GET, page.next_cursor, page.previous_cursor)
+    return _api_response(request, etag, lambda: resource.page_data(page, names))
+
+
+@require_safe
+def api_detail(request, resource, pk, association_id=None):
+    resource = API_RESOURCES[resource]
+    try:
+        row, names = resource.get(association_id, pk, request.GET)
+    except ApiError as exc:
+        return _api_error(exc.message, exc.status)
+    return _api_response(request, resource.etag([row], request.GET),
+                         lambda: {"data": resource.serialize([row], names)[0]})
+
+
+@csrf_exempt
+@require_http_methods(["GET", "HEAD", "POST"])
+def api_readings(request, association_id):
+    """
+    GET lists readings; POST upserts a JSON array of them. The API is
+    CSRF-exempt but only accepts application/json bodies, which a browser
+    cannot send cross-site without a CORS preflight.
+    """
+    if request.method != "POST":
+        return api_list(request, "readings", association_id=association_id)
+    association = Association.objects.filter(id=association_id).first()
+    if association is None:
+        return _api_error("Bendrija nerasta", status=404)
+    if request.content_type != "application/json":
+        return _api_error("Laukiama application/json", status=415)
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return _api_error("Netinkamas JSON")
+    try:
+        result = upsert_readings(association, payload)
+    except ApiError as exc:
+        return _api_error(exc.message, exc.status)
+    return JsonResponse(result)
+
+
+@staff_member_required
+def metrics_view(request):
+    return JsonResponse(metrics.snapshot())
+
+
+@staff_member_required
+def metrics_prometheus(request):
+    return HttpResponse(metrics.prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")